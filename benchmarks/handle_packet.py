@@ -0,0 +1,78 @@
+# Segments per second through TCPProtocol.handle_packet on an established connection:
+# in-order data segments on the receive side and pure ACKs on the send side.
+#
+#   python benchmarks/handle_packet.py [segments]
+#
+# Each scenario runs a few times and the best rate is reported.
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from tcp_protocol import TCPProtocol, TCPFlags, TCPState, SEQ_MASK
+
+WINDOW = 0xFFFF
+ROUNDS = 5
+
+
+def established():
+    protocol = TCPProtocol('10.0.0.1', 80, '10.0.0.2', 5000)
+    protocol.state = TCPState.ESTABLISHED
+    protocol.snd_una = protocol.sequence_number
+    protocol.acknowledgment_number = 1000
+    protocol.snd_wnd = WINDOW
+    return protocol
+
+
+def segment(protocol, seq, ack, data=b''):
+    return {
+        'src_ip': protocol.dst_ip,
+        'dst_ip': protocol.src_ip,
+        'src_port': protocol.dst_port,
+        'dst_port': protocol.src_port,
+        'seq_num': seq,
+        'ack_num': ack,
+        'flags': TCPFlags.ACK | (TCPFlags.PSH if data else 0),
+        'window_size': WINDOW,
+        'data': data
+    }
+
+
+def receive(count):
+    protocol = established()
+    payload = bytes(protocol.mss)
+    seq, elapsed = protocol.acknowledgment_number, 0.0
+    for _ in range(0, count, 32):
+        packets = []
+        for _ in range(32):
+            packets.append(segment(protocol, seq, protocol.snd_una, payload))
+            seq = (seq + len(payload)) & SEQ_MASK
+        start = time.perf_counter()
+        for packet in packets:
+            protocol.handle_packet(packet)
+        elapsed += time.perf_counter() - start
+        protocol.get_received_data()
+    return count / elapsed
+
+
+def acknowledge(count):
+    protocol = established()
+    payload = bytes(16 * protocol.mss)
+    done, elapsed = 0, 0.0
+    while done < count:
+        sent = protocol.send(payload) or []
+        acks = [segment(protocol, protocol.acknowledgment_number, (packet['seq_num'] + len(packet['data'])) & SEQ_MASK)
+                for packet in sent if packet['data']]
+        start = time.perf_counter()
+        for packet in acks:
+            protocol.handle_packet(packet)
+        elapsed += time.perf_counter() - start
+        done += len(acks)
+    return done / elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f"in-order data: {max(receive(count) for _ in range(ROUNDS)):,.0f} segments/s")
+    print(f"pure ACKs:     {max(acknowledge(count) for _ in range(ROUNDS)):,.0f} segments/s")
@@ -0,0 +1,101 @@
+# Cost of the stack itself: two NetworkStacks in one process exchange TCP bulk data and UDP
+# datagrams over an in-memory queue pair and over a socketpair, with no tap device in the path.
+#
+#   python benchmarks/stack_pair.py [megabytes] [datagrams]
+#
+# Each scenario runs a few times and the best rate is reported.
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.socket import Socket, SocketType
+from config import Config
+from stack import NetworkStack
+from virtual_device_manager import QueueInterface, SocketPairInterface
+
+ROUNDS = 3
+PAYLOAD = b'm' * 200
+CHUNK = bytes(range(256)) * 256
+
+
+def stack_pair(interface):
+    stacks = []
+    for index, device in enumerate(interface.pair(), 1):
+        device.set_blocking(False)
+        config = Config()
+        config.set('ip_address', f'10.0.0.{index}')
+        config.set('mac_address', f'02:00:00:00:00:0{index}')
+        stacks.append(NetworkStack(config, device))
+    return stacks
+
+
+def pump(stacks):
+    # Runs due timers, then both read handlers until a pass moves no frames.
+    for stack in stacks:
+        stack.event_loop.timers.advance()
+    while True:
+        for stack in stacks:
+            stack.handle_read(-1)
+        if not any(len(stack.rx_batch) for stack in stacks):
+            return
+
+
+def tcp(interface, size):
+    server, client = stack_pair(interface)
+    listener = Socket('10.0.0.1', 80, SocketType.TCP)
+    listener.listen(8)
+    server.socket_manager.add_socket(listener)
+    sock = Socket('10.0.0.2', 40000, SocketType.TCP)
+    client.socket_manager.add_socket(sock)
+    client.transmit(sock.connect('10.0.0.1', 80))
+    pump((server, client))
+    conn = listener.accept()
+    received = sent = 0
+    start = time.perf_counter()
+    while received < size:
+        free = sock.protocol.send_buffer.free
+        if sent < size and free:
+            chunk = CHUNK[:min(free, size - sent)]
+            sent += len(chunk)
+            sock.send(chunk)
+        pump((server, client))
+        received += len(conn.recv(None) or b'')
+    elapsed = time.perf_counter() - start
+    for stack in (server, client):
+        stack.device.close()
+    return size / elapsed
+
+
+def udp(interface, count, batch=64):
+    server, client = stack_pair(interface)
+    receiver = Socket('10.0.0.1', 9000, SocketType.UDP)
+    server.socket_manager.add_socket(receiver)
+    sender = Socket('10.0.0.2', 5000, SocketType.UDP)
+    client.socket_manager.add_socket(sender)
+    sender.send_to(PAYLOAD, ('10.0.0.1', 9000))
+    pump((server, client))
+    receiver.recv_many(batch)
+    datagrams = [(PAYLOAD, ('10.0.0.1', 9000))] * batch
+    received = 0
+    start = time.perf_counter()
+    for _ in range(count // batch):
+        sender.send_many(datagrams)
+        pump((server, client))
+        received += len(receiver.recv_many(batch))
+    elapsed = time.perf_counter() - start
+    for stack in (server, client):
+        stack.device.close()
+    return received / elapsed
+
+
+if __name__ == '__main__':
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    for name, interface in (('queue pair', QueueInterface), ('socketpair', SocketPairInterface)):
+        rate = max(tcp(interface, megabytes << 20) for _ in range(ROUNDS))
+        print(f"{name}: TCP bulk {rate / (1 << 20):,.1f} MiB/s")
+        rate = max(udp(interface, count) for _ in range(ROUNDS))
+        print(f"{name}: UDP {rate:,.0f} datagrams/s")
@@ -0,0 +1,56 @@
+# Memory retained by the stack while short-lived connections are opened and actively closed,
+# measured with tracemalloc. A simulated clock advances with every connection, so the TIME_WAIT
+# table reaches its steady size (rate * timeout) and stays there.
+#
+#   python benchmarks/time_wait_churn.py [connections] [connections per second]
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.socket import Socket, SocketType
+from socket_manager import SocketManager
+from time_wait import TimeWaitTable
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def churn(count, rate):
+    clock = SimulatedClock()
+    TimeWaitTable.clock = clock
+    manager = SocketManager()
+    server = Socket('10.0.0.1', 80, SocketType.TCP)
+    manager.add_socket(server)
+    server.listen(backlog=128)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    report = max(count // 10, 1)
+    for i in range(count):
+        client = Socket('10.1.0.1', 1024 + i % 60000, SocketType.TCP)
+        client.ip = f'10.{1 + (i // 60000) % 250}.0.1'
+        manager.add_socket(client)
+        syn_ack = server.handle_packet(client.connect('10.0.0.1', 80))
+        server.handle_packet(client.handle_packet(syn_ack))
+        conn = server.accept()
+        client.handle_packet(conn.handle_packet(client.close()))
+        conn.handle_packet(client.handle_packet(conn.close()))
+        manager.sockets.clear()
+        clock.now += 1 / rate
+        if (i + 1) % report == 0:
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+            print(f"{i + 1:>9} connections: {len(manager.flow_table.time_wait):>7} in TIME_WAIT, {retained / 1024:>9.0f} KiB retained")
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 1000.0
+    churn(count, rate)
@@ -0,0 +1,57 @@
+# UDP receive path: memory under a flood from random sources, and datagrams per second
+# drained with Socket.recv versus Socket.recv_many.
+#
+#   python benchmarks/udp_receive.py [datagrams]
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.socket import Socket, SocketType
+
+BATCH = 64
+
+
+def datagram(port):
+    return {'src_ip': f'10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}',
+            'src_port': port, 'dst_ip': '10.0.0.1', 'dst_port': 53, 'data': b'x' * 64}
+
+
+def flood(count):
+    sock = Socket('10.0.0.1', 53, SocketType.UDP)
+    tracemalloc.start()
+    for i in range(count):
+        sock.handle_packet(datagram(1024 + i % 60000))
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    protocol = sock.protocol
+    print(f"flood of {count} datagrams: {len(protocol.connections)} peers, {len(protocol.receive_queue)} queued, "
+          f"{protocol.drops} dropped, {retained / 1024:.0f} KiB retained")
+
+
+def drain(count, batched):
+    sock = Socket('10.0.0.1', 53, SocketType.UDP)
+    packets = [datagram(1024 + i % BATCH) for i in range(BATCH)]
+    done, elapsed = 0, 0.0
+    while done < count:
+        for packet in packets:
+            sock.handle_packet(packet)
+        start = time.perf_counter()
+        if batched:
+            done += len(sock.recv_many(BATCH))
+        else:
+            while sock.recv(65535) is not None:
+                done += 1
+        elapsed += time.perf_counter() - start
+    return done / elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    flood(count)
+    print(f"recv:      {max(drain(count, False) for _ in range(3)):,.0f} datagrams/s")
+    print(f"recv_many: {max(drain(count, True) for _ in range(3)):,.0f} datagrams/s")
@@ -0,0 +1,74 @@
+# Datagrams per second through the UDP transmit path for a telemetry-style fan-out
+# (one payload to many destinations), against framing each datagram with PacketParser.
+#
+#   python benchmarks/udp_send.py [datagrams] [destinations]
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from packet_parser import PacketParser, ETH_HEADER, ETH_P_IP, ip_to_int
+from udp_protocol import UDPProtocol
+from ethernet import EthernetLayer, BROADCAST_MAC
+from virtual_device_manager import NetworkInterface
+
+PAYLOAD = b'm' * 200
+MAC = b'\x02\x00\x00\x00\x00\x01'
+
+
+class NullDevice(NetworkInterface):
+    def __init__(self):
+        self.frames = 0
+
+    def read(self, length):
+        return b''
+
+    def write(self, data):
+        self.frames += 1
+        return len(data)
+
+    def write_many(self, frames):
+        self.frames += len(frames)
+        return len(frames)
+
+    def close(self):
+        pass
+
+    @property
+    def fd(self):
+        return -1
+
+
+def per_datagram(count, destinations):
+    parser, device = PacketParser(), NullDevice()
+    start = time.perf_counter()
+    for i in range(count):
+        dst_ip, dst_port = destinations[i % len(destinations)]
+        udp = parser.construct_udp_packet({'src_ip': '10.0.0.1', 'dst_ip': dst_ip, 'src_port': 4000,
+                                           'dst_port': dst_port, 'length': 8 + len(PAYLOAD), 'data': PAYLOAD})
+        ip = parser.construct_ip_packet({'version': 4, 'ihl': 5, 'dscp_ecn': 0, 'total_length': 20 + len(udp),
+                                         'identification': i & 0xFFFF, 'flags_fragment_offset': 0x4000, 'ttl': 64,
+                                         'protocol': 17, 'src_ip': '10.0.0.1', 'dst_ip': dst_ip, 'data': udp})
+        device.write(ETH_HEADER.pack(BROADCAST_MAC, MAC, ETH_P_IP) + ip)
+    return count / (time.perf_counter() - start)
+
+
+def batched(count, destinations, batch=64):
+    link = EthernetLayer(NullDevice(), MAC, '10.0.0.1', '255.0.0.0')
+    for dst_ip, _ in destinations:
+        link._confirm(link.next_hop(ip_to_int(dst_ip)), BROADCAST_MAC)
+    protocol = type('UDPProtocol', (UDPProtocol,), {'link': link})('10.0.0.1', 4000)
+    datagrams = [(PAYLOAD, destinations[i % len(destinations)]) for i in range(batch)]
+    start = time.perf_counter()
+    for _ in range(count // batch):
+        protocol.send_many(datagrams)
+    return count // batch * batch / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    fanout = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    destinations = [(f'10.1.0.{i % 250 + 1}', 9000 + i // 250) for i in range(fanout)]
+    print(f"per-datagram framing: {max(per_datagram(count, destinations) for _ in range(3)):,.0f} datagrams/s")
+    print(f"send_many (templates): {max(batched(count, destinations) for _ in range(3)):,.0f} datagrams/s")
@@ -0,0 +1,289 @@
+import asyncio
+import random
+# asyncio needs the standard socket module, which socket.py shadows while src/ is first on
+# sys.path, so applications using this adapter import the stack from the project root.
+from src.socket import Socket, SocketType
+from packet_parser import ip_to_int, ip_to_str
+from flow_table import IPPROTO_TCP
+from tcp_protocol import TCPState
+
+EPHEMERAL_PORTS = (32768, 60999)  # Linux ip_local_port_range
+CLOSED_STATES = (TCPState.CLOSED, TCPState.TIME_WAIT)
+SENDING_STATES = (TCPState.ESTABLISHED, TCPState.CLOSE_WAIT)
+EOF_STATES = (TCPState.CLOSE_WAIT, TCPState.LAST_ACK, TCPState.CLOSING, TCPState.TIME_WAIT, TCPState.CLOSED)
+
+class StackDriver:
+    # Runs a NetworkStack on an asyncio loop instead of its own EventLoop: the device fd is
+    # watched with add_reader and the stack's timer wheel is advanced by one loop timer that
+    # is always set for the wheel's next deadline.
+    write_high_water = 64 * 1024  # bytes a transport buffers beyond the send ring before pausing the writer
+    connect_timeout = 75.0  # seconds create_connection waits for the handshake, as BSD's connection-establishment timer
+
+    def __init__(self, stack, loop=None):
+        self.stack = stack
+        self.loop = loop or asyncio.get_running_loop()
+        self.timers = stack.event_loop.timers
+        self.tick = None
+
+    def start(self):
+        self.stack.device.set_blocking(False)
+        self.loop.add_reader(self.stack.device.fd, self._on_readable, self.stack.handle_read)
+        if self.stack.inbox is not None:
+            self.stack.inbox.setblocking(False)
+            self.loop.add_reader(self.stack.inbox.fileno(), self._on_readable, self.stack.handle_channel)
+
+    def stop(self):
+        self.loop.remove_reader(self.stack.device.fd)
+        if self.stack.inbox is not None:
+            self.loop.remove_reader(self.stack.inbox.fileno())
+        if self.tick is not None:
+            self.tick.cancel()
+            self.tick = None
+
+    def _on_readable(self, handler):
+        handler(-1)
+        self.kick()
+
+    def kick(self):
+        # Called after anything that may have scheduled stack timers.
+        timeout = self.timers.timeout()
+        if timeout is None:
+            return
+        when = self.loop.time() + timeout
+        if self.tick is not None:
+            if self.tick.when() <= when:
+                return
+            self.tick.cancel()
+        self.tick = self.loop.call_at(when, self._on_tick)
+
+    def _on_tick(self):
+        self.tick = None
+        self.timers.advance()
+        self.kick()
+
+    def transmit(self, segments):
+        self.stack.transmit(segments)
+        self.kick()
+
+    def _open_socket(self, port):
+        sock = Socket(ip_to_str(self.stack.link.ip), port, SocketType.TCP)
+        self.stack.socket_manager.add_socket(sock)
+        return sock
+
+    def _ephemeral_port(self, host, port):
+        # As Linux does: a random starting point, then the first port whose tuple is free.
+        flow_table = self.stack.socket_manager.flow_table
+        local, remote = self.stack.link.ip, ip_to_int(host)
+        low, high = EPHEMERAL_PORTS
+        start = random.randint(low, high)
+        for i in range(high - low + 1):
+            candidate = low + (start - low + i) % (high - low + 1)
+            if ((IPPROTO_TCP, local, candidate, remote, port) not in flow_table.flows
+                    and (local, candidate, remote, port) not in flow_table.time_wait):
+                return candidate
+        raise ValueError(f"No free local port to connect to {host}:{port}")
+
+    async def create_connection(self, protocol_factory, host, port, local_port=None, timeout=None):
+        # loop.create_connection() for the user-space stack; returns (transport, protocol).
+        # Raises ConnectionRefusedError on a RST, TimeoutError when no SYN-ACK comes in time.
+        sock = self._open_socket(local_port or self._ephemeral_port(host, port))
+        connected = self.loop.create_future()
+
+        def on_ready(sock):
+            if connected.done():
+                return
+            if sock.protocol.state == TCPState.ESTABLISHED:
+                connected.set_result(None)
+            elif sock.protocol.state == TCPState.CLOSED:
+                connected.set_exception(ConnectionRefusedError(f"Connection to {host}:{port} refused"))
+
+        sock.on_ready = on_ready
+        try:
+            self.transmit(sock.connect(host, port))
+            await asyncio.wait_for(connected, self.connect_timeout if timeout is None else timeout)
+        except BaseException:
+            sock.on_ready = None
+            self.transmit(sock.abort())
+            raise
+        protocol = protocol_factory()
+        transport = StackTransport(self, sock, protocol)
+        transport._start()
+        return transport, protocol
+
+    async def create_server(self, protocol_factory, host=None, port=0, backlog=100):
+        # loop.create_server() for the user-space stack; host defaults to the stack's address.
+        sock = Socket(host or ip_to_str(self.stack.link.ip), port, SocketType.TCP)
+        sock.listen(backlog)
+        self.stack.socket_manager.add_socket(sock)
+        return StackServer(self, sock, protocol_factory)
+
+    async def open_connection(self, host, port, limit=2 ** 16, **kwargs):
+        # asyncio.open_connection() for the user-space stack.
+        reader = asyncio.StreamReader(limit=limit, loop=self.loop)
+        protocol = asyncio.StreamReaderProtocol(reader, loop=self.loop)
+        transport, _ = await self.create_connection(lambda: protocol, host, port, **kwargs)
+        return reader, asyncio.StreamWriter(transport, protocol, reader, self.loop)
+
+    async def start_server(self, client_connected_cb, host=None, port=0, limit=2 ** 16, backlog=100):
+        # asyncio.start_server() for the user-space stack.
+        def factory():
+            reader = asyncio.StreamReader(limit=limit, loop=self.loop)
+            return asyncio.StreamReaderProtocol(reader, client_connected_cb, loop=self.loop)
+        return await self.create_server(factory, host, port, backlog)
+
+class StackTransport(asyncio.Transport):
+    # A connected Socket as an asyncio transport. Writes that do not fit the send ring wait in
+    # a local buffer, and the protocol is paused while that buffer is over write_high_water.
+    # Received data stays in the socket's ring while reading is paused, which closes the window.
+    def __init__(self, driver, sock, protocol):
+        ip, port = sock.get_sock_name()
+        super().__init__({'peername': sock.get_peer_name(), 'sockname': (ip_to_str(ip_to_int(ip)), port), 'socket': sock})
+        self._driver = driver
+        self._sock = sock
+        self._protocol = protocol
+        self._pending = bytearray()
+        self._reading = True
+        self._writing_paused = False
+        self._closing = False
+        self._eof = False
+        self._lost = False
+
+    def _start(self):
+        self._sock.on_ready = self._on_ready
+        self._protocol.connection_made(self)
+        self._driver.loop.call_soon(self._on_ready, self._sock)  # data that came with the handshake
+
+    def get_protocol(self):
+        return self._protocol
+
+    def set_protocol(self, protocol):
+        self._protocol = protocol
+
+    def is_closing(self):
+        return self._closing
+
+    def is_reading(self):
+        return self._reading and not self._lost
+
+    def pause_reading(self):
+        self._reading = False
+
+    def resume_reading(self):
+        if not self._reading:
+            self._reading = True
+            self._driver.loop.call_soon(self._on_ready, self._sock)
+
+    def get_write_buffer_size(self):
+        return len(self._pending) + len(self._sock.protocol.send_buffer)
+
+    def get_write_buffer_limits(self):
+        return 0, self._driver.write_high_water
+
+    def write(self, data):
+        if self._closing or self._lost or not data:
+            return
+        self._pending += data
+        self._push()
+        if not self._writing_paused and len(self._pending) > self._driver.write_high_water:
+            self._writing_paused = True
+            self._protocol.pause_writing()
+
+    def can_write_eof(self):
+        return False
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        if not self._pending:
+            self._driver.transmit(self._sock.close())
+            self._check_lost()
+
+    def abort(self):
+        # Unlike close(), nothing buffered is sent: the peer gets a RST.
+        self._closing = True
+        self._pending.clear()
+        self._driver.transmit(self._sock.abort())
+        self._connection_lost(None)
+
+    def _push(self):
+        # Moves buffered writes into the send ring as acknowledgements make room.
+        sock = self._sock
+        sending = sock.protocol.state in SENDING_STATES
+        free = sock.protocol.send_buffer.free
+        if self._pending and free and sending:
+            del self._pending[:sock.send(self._pending[:free])]
+        self._driver.transmit(sock.poll_output())
+        if self._writing_paused and len(self._pending) <= self._driver.write_high_water // 4:
+            self._writing_paused = False
+            self._protocol.resume_writing()
+        if self._closing and not self._pending and sending:
+            self._driver.transmit(sock.close())
+
+    def _on_ready(self, sock):
+        if self._lost:
+            return
+        self._push()
+        if self._reading:
+            data = sock.recv(None)
+            if data:
+                self._protocol.data_received(data)
+        state = sock.protocol.state
+        if not self._eof and state in EOF_STATES and not len(sock.protocol.recv_buffer):
+            self._eof = True
+            if not self._protocol.eof_received():
+                self.close()
+        self._check_lost()
+
+    def _check_lost(self):
+        if self._sock.protocol.state in CLOSED_STATES:
+            self._connection_lost(None)
+
+    def _connection_lost(self, exc):
+        if self._lost:
+            return
+        self._lost = True
+        self._sock.on_ready = None
+        self._driver.loop.call_soon(self._protocol.connection_lost, exc)
+
+class StackServer(asyncio.AbstractServer):
+    def __init__(self, driver, sock, protocol_factory):
+        self._driver = driver
+        self._sock = sock
+        self._protocol_factory = protocol_factory
+        self._serving = True
+        self._closed = driver.loop.create_future()
+        sock.on_ready = self._on_ready
+
+    def _on_ready(self, sock):
+        while True:
+            conn = sock.accept()
+            if conn is None:
+                return
+            StackTransport(self._driver, conn, self._protocol_factory())._start()
+
+    @property
+    def sockets(self):
+        return (self._sock,)
+
+    def get_loop(self):
+        return self._driver.loop
+
+    def is_serving(self):
+        return self._serving
+
+    def close(self):
+        if self._serving:
+            self._serving = False
+            self._sock.on_ready = None
+            self._sock.close()
+            self._closed.set_result(None)
+
+    async def start_serving(self):
+        pass  # accepting starts with the listen in create_server
+
+    async def serve_forever(self):
+        await asyncio.shield(self._closed)
+
+    async def wait_closed(self):
+        await asyncio.shield(self._closed)
@@ -0,0 +1,53 @@
+# Internet checksum (RFC 1071). Since 2**16 == 1 (mod 0xFFFF), the one's complement
+# sum of the big-endian 16-bit words of a buffer equals the buffer read as one big
+# integer reduced mod 0xFFFF, which lets int.from_bytes do the summing in C.
+
+def sum_words(data, initial: int = 0) -> int:
+    # Partial sums may be chained; every chunk except the last must have even length.
+    value = int.from_bytes(data, 'big')
+    if len(data) & 1:
+        value <<= 8  # pad the trailing odd byte
+    bits = value.bit_length()
+    # Halving folds on 16-bit boundaries preserve the sum and are cheaper than one
+    # long division for jumbo buffers.
+    while bits > 8192:
+        half = (bits >> 5) << 4
+        value = (value >> half) + (value & ((1 << half) - 1))
+        bits = value.bit_length()
+    total = initial + value
+    # Keep one's complement semantics: a non-zero sum folds to 0xFFFF, never to 0.
+    return total % 0xFFFF or (0xFFFF if total else 0)
+
+def finish(total: int) -> int:
+    return ~total & 0xFFFF
+
+def checksum(data, initial: int = 0) -> int:
+    return finish(sum_words(data, initial))
+
+def pseudo_header_sum(src: int, dst: int, protocol: int, length: int) -> int:
+    return ((src >> 16) + (src & 0xFFFF) + (dst >> 16) + (dst & 0xFFFF) + protocol + length) % 0xFFFF
+
+def ip_header_checksum(header) -> int:
+    # The checksum field (bytes 10-11) is skipped, so it need not be zeroed first.
+    return finish(sum_words(header[12:], sum_words(header[:10])))
+
+def transport_checksum(src: int, dst: int, protocol: int, segment) -> int:
+    # Expects the segment's own checksum field to be zero.
+    return checksum(segment, pseudo_header_sum(src, dst, protocol, len(segment)))
+
+def verify_ip_header(header) -> bool:
+    return sum_words(header) == 0xFFFF
+
+def verify_transport(src: int, dst: int, protocol: int, segment) -> bool:
+    return sum_words(segment, pseudo_header_sum(src, dst, protocol, len(segment))) == 0xFFFF
+
+def update_checksum16(checksum: int, old: int, new: int) -> int:
+    # RFC 1624 eqn. 3: HC' = ~(~HC + ~m + m')
+    total = (~checksum & 0xFFFF) + (~old & 0xFFFF) + new
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+def update_checksum32(checksum: int, old: int, new: int) -> int:
+    checksum = update_checksum16(checksum, old >> 16, new >> 16)
+    return update_checksum16(checksum, old & 0xFFFF, new & 0xFFFF)
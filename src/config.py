@@ -3,7 +3,29 @@ class Config:
         self.config = {
             'log_level': 'INFO',
             'device_name': 'tap0',
-            'mtu': 1500
+            'workers': 1,  # stack processes, one per queue of a multi-queue tap device
+            'mtu': 1500,
+            'mac_address': '02:00:00:00:00:01',
+            'ip_address': '10.0.0.2',
+            'netmask': '255.255.255.0',
+            'gateway': None,  # next hop for off-subnet destinations; None means all are on-link
+            'arp_reachable_time': 30.0,
+            'arp_pending_limit': 16,
+            'event_loop_backend': 'epoll',  # falls back to 'select' where epoll is unavailable
+            'event_loop_edge_triggered': False,
+            'timer_resolution': 0.01,
+            'rx_batch_size': 32,
+            'verify_checksums': False,
+            'congestion_control': 'newreno',  # 'newreno', 'cubic' or 'bbr'
+            'delayed_ack': True,
+            'delayed_ack_timeout': 0.04,
+            'tcp_window_scaling': True,
+            'tcp_timestamps': True,
+            'tcp_sack': True,
+            'tcp_max_syn_backlog': 128,
+            'tcp_syncookies': True,
+            'tcp_tw_reuse': True,
+            'tcp_max_tw_buckets': 262144
         }
 
     def get(self, key, default=None):
@@ -0,0 +1,165 @@
+import time
+from collections import deque
+from typing import Callable, Optional
+
+class CongestionControl:
+    __slots__ = ('mss', 'clock', 'cwnd', 'ssthresh', 'pacing_rate', 'min_rtt')
+    name = None
+
+    def __init__(self, mss: int, clock: Callable[[], float] = time.monotonic):
+        self.mss = mss
+        self.clock = clock
+        self.cwnd = 10 * mss  # RFC 6928 initial window
+        self.ssthresh = 1 << 30
+        self.pacing_rate: Optional[float] = None  # bytes per second, None means unpaced
+        self.min_rtt: Optional[float] = None
+
+    @property
+    def in_slow_start(self) -> bool:
+        return self.cwnd < self.ssthresh
+
+    def on_ack(self, acked: int, in_flight: int):
+        pass
+
+    def on_loss(self, in_flight: int, timeout: bool = False):
+        pass
+
+    def on_rtt_sample(self, rtt: float):
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+
+class NewReno(CongestionControl):
+    __slots__ = ('bytes_acked',)
+    name = 'newreno'
+
+    def __init__(self, mss: int, clock: Callable[[], float] = time.monotonic):
+        super().__init__(mss, clock)
+        self.bytes_acked = 0
+
+    def on_ack(self, acked: int, in_flight: int):
+        if self.in_slow_start:
+            self.cwnd += min(acked, self.mss)  # RFC 3465 with L = 1 MSS
+            return
+        # Congestion avoidance: one MSS per window's worth of acknowledged bytes.
+        self.bytes_acked += acked
+        if self.bytes_acked >= self.cwnd:
+            self.bytes_acked -= self.cwnd
+            self.cwnd += self.mss
+
+    def on_loss(self, in_flight: int, timeout: bool = False):
+        self.ssthresh = max(in_flight // 2, 2 * self.mss)
+        self.cwnd = self.mss if timeout else self.ssthresh
+        self.bytes_acked = 0
+
+class Cubic(CongestionControl):
+    __slots__ = ('w_max', 'k', 'epoch_start', 'w_est')
+    name = 'cubic'
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, mss: int, clock: Callable[[], float] = time.monotonic):
+        super().__init__(mss, clock)
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start: Optional[float] = None
+        self.w_est = 0.0
+
+    def on_ack(self, acked: int, in_flight: int):
+        if self.in_slow_start:
+            self.cwnd += min(acked, self.mss)
+            return
+        now = self.clock()
+        cwnd = self.cwnd / self.mss
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if self.w_max < cwnd:
+                self.w_max, self.k = cwnd, 0.0
+            else:
+                self.k = ((self.w_max - cwnd) / self.C) ** (1 / 3)
+            self.w_est = cwnd
+        t = now - self.epoch_start + (self.min_rtt or 0.0)
+        target = self.C * (t - self.k) ** 3 + self.w_max
+        # RFC 8312 TCP-friendly region, grown per acknowledged segment.
+        self.w_est += 3 * (1 - self.BETA) / (1 + self.BETA) * (acked / self.mss) / cwnd
+        target = max(target, self.w_est)
+        if target > cwnd:
+            self.cwnd += int(self.mss * min(target - cwnd, cwnd) / cwnd * (acked / self.mss)) or 1
+
+    def on_loss(self, in_flight: int, timeout: bool = False):
+        cwnd = self.cwnd / self.mss
+        # Fast convergence: release bandwidth when the last maximum was not reached.
+        self.w_max = cwnd * (1 + self.BETA) / 2 if cwnd < self.w_max else cwnd
+        self.ssthresh = max(int(self.cwnd * self.BETA), 2 * self.mss)
+        self.cwnd = self.mss if timeout else self.ssthresh
+        self.epoch_start = None
+
+class BBR(CongestionControl):
+    # Simplified model-based sender: estimates bottleneck bandwidth and min RTT,
+    # paces at gain * bandwidth and caps inflight at two bandwidth-delay products.
+    __slots__ = ('bw_samples', 'btl_bw', 'min_rtt_stamp', 'interval_start', 'interval_delivered',
+                 'full_bw', 'full_bw_rounds', 'filled_pipe', 'cycle_index', 'pacing_gain')
+    name = 'bbr'
+    STARTUP_GAIN = 2.885
+    PROBE_GAINS = (1.25, 0.75, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+    BW_WINDOW = 10
+    MIN_RTT_LIFETIME = 10.0
+
+    def __init__(self, mss: int, clock: Callable[[], float] = time.monotonic):
+        super().__init__(mss, clock)
+        self.bw_samples = deque(maxlen=self.BW_WINDOW)
+        self.btl_bw = 0.0
+        self.min_rtt_stamp = 0.0
+        self.interval_start: Optional[float] = None
+        self.interval_delivered = 0
+        self.full_bw = 0.0
+        self.full_bw_rounds = 0
+        self.filled_pipe = False
+        self.cycle_index = 0
+        self.pacing_gain = self.STARTUP_GAIN
+
+    def on_rtt_sample(self, rtt: float):
+        now = self.clock()
+        if self.min_rtt is None or rtt <= self.min_rtt or now - self.min_rtt_stamp > self.MIN_RTT_LIFETIME:
+            self.min_rtt = rtt
+            self.min_rtt_stamp = now
+
+    def on_ack(self, acked: int, in_flight: int):
+        now = self.clock()
+        if self.interval_start is None:
+            self.interval_start = now
+        self.interval_delivered += acked
+        elapsed = now - self.interval_start
+        if self.min_rtt is None or elapsed < self.min_rtt or elapsed <= 0:
+            return
+        # One delivery-rate sample per round trip.
+        self.bw_samples.append(self.interval_delivered / elapsed)
+        self.btl_bw = max(self.bw_samples)
+        self.interval_start, self.interval_delivered = now, 0
+        self._advance_round()
+        bdp = self.btl_bw * self.min_rtt
+        self.cwnd = max(int(2 * bdp), 4 * self.mss)
+        self.pacing_rate = self.pacing_gain * self.btl_bw
+
+    def _advance_round(self):
+        if not self.filled_pipe:
+            if self.btl_bw >= self.full_bw * 1.25:
+                self.full_bw, self.full_bw_rounds = self.btl_bw, 0
+            else:
+                self.full_bw_rounds += 1
+                self.filled_pipe = self.full_bw_rounds >= 3
+            if not self.filled_pipe:
+                return
+        self.cycle_index = (self.cycle_index + 1) % len(self.PROBE_GAINS)
+        self.pacing_gain = self.PROBE_GAINS[self.cycle_index]
+
+    def on_loss(self, in_flight: int, timeout: bool = False):
+        if timeout:
+            self.cwnd = 4 * self.mss
+
+CONGESTION_CONTROLS = {cls.name: cls for cls in (NewReno, Cubic, BBR)}
+
+def create_congestion_control(name: str, mss: int, clock: Callable[[], float] = time.monotonic) -> CongestionControl:
+    try:
+        return CONGESTION_CONTROLS[name](mss, clock)
+    except KeyError:
+        raise ValueError(f"Unsupported congestion control: {name}") from None
@@ -0,0 +1,206 @@
+import struct
+import time
+from collections import OrderedDict, deque
+from packet_parser import ETH_HEADER, ETH_P_IP, ip_to_int
+
+ETH_P_ARP = 0x0806
+ARP_HEADER = struct.Struct('!HHBBH6sI6sI')
+ARPHRD_ETHER = 1
+ARPOP_REQUEST = 1
+ARPOP_REPLY = 2
+BROADCAST_MAC = b'\xff' * 6
+ZERO_MAC = b'\x00' * 6
+
+INCOMPLETE = 0  # request sent, no answer yet; packets wait in pending
+REACHABLE = 1   # confirmed within reachable_time
+STALE = 2       # past reachable_time: still used while a refresh is requested
+FAILED = 3      # negative entry: max_probes went unanswered
+
+class Neighbour:
+    __slots__ = ('ip', 'state', 'mac', 'header', 'updated', 'probes', 'requested', 'pending', 'timer')
+
+    def __init__(self, ip, now):
+        self.ip = ip
+        self.state = INCOMPLETE
+        self.mac = None
+        self.header = None  # Ethernet header (with the device prefix) for IPv4 frames to this neighbour
+        self.updated = now
+        self.probes = 0
+        self.requested = None
+        self.pending = None  # deque of IP packets waiting for resolution
+        self.timer = None
+
+class EthernetLayer:
+    # Sits between the tap device and IP: strips and adds Ethernet headers, answers ARP for
+    # our address and resolves next hops through a neighbour cache. A resolved neighbour
+    # keeps its frame header prebuilt, so transmit adds L2 with one concatenation (or one
+    # extra iovec) and no lookup beyond the cache hit.
+    clock = time.monotonic
+    timers = None  # TimerWheel; without one, retransmits and failures happen on the next send
+    reachable_time = 30.0
+    failed_time = 20.0  # how long a negative entry drops packets before resolution is retried
+    retrans_time = 1.0
+    max_probes = 3
+    pending_limit = 16  # packets held per unresolved next hop; the oldest is dropped beyond it
+    max_neighbours = 1024
+
+    def __init__(self, device, mac: bytes, ip, netmask='255.255.255.0', gateway=None):
+        self.device = device
+        self.mac = mac
+        self.ip = ip_to_int(ip)
+        self.netmask = ip_to_int(netmask)
+        self.gateway = None if gateway is None else ip_to_int(gateway)
+        self.prefix = device.frame_prefix
+        self.neighbours = OrderedDict()  # IPv4 address (int) -> Neighbour, oldest first
+        self.arp_requests = 0
+        self.arp_replies = 0
+        self.pending_drops = 0
+        self.unresolved_drops = 0
+        self.frames_ignored = 0
+
+    def next_hop(self, dst: int) -> int:
+        if self.gateway is None or not (dst ^ self.ip) & self.netmask:
+            return dst
+        return self.gateway
+
+    def handle_frame(self, frame, answer=True):
+        # Returns the IPv4 packet in a frame addressed to us, or None once the frame is consumed.
+        # With answer False, ARP is only learned from: another stack on the device replies.
+        view = memoryview(frame)[len(self.prefix):]
+        if len(view) < ETH_HEADER.size:
+            self.frames_ignored += 1
+            return None
+        dst_mac, src_mac, ethertype = ETH_HEADER.unpack_from(view)
+        if dst_mac != self.mac and dst_mac != BROADCAST_MAC:
+            self.frames_ignored += 1
+            return None
+        if ethertype == ETH_P_IP:
+            return view[ETH_HEADER.size:]
+        if ethertype == ETH_P_ARP:
+            self._handle_arp(view[ETH_HEADER.size:], answer)
+        else:
+            self.frames_ignored += 1
+        return None
+
+    def _handle_arp(self, payload, answer=True):
+        if len(payload) < ARP_HEADER.size:
+            return
+        hrd, pro, hln, pln, op, sha, spa, tha, tpa = ARP_HEADER.unpack_from(payload)
+        if hrd != ARPHRD_ETHER or pro != ETH_P_IP or hln != 6 or pln != 4:
+            return
+        # RFC 826: refresh an entry we already have; add one only when the sender is asking for us.
+        for_us = tpa == self.ip
+        if spa and (spa in self.neighbours or for_us):
+            self._confirm(spa, sha)
+        if op == ARPOP_REQUEST and for_us and answer:
+            self.arp_replies += 1
+            self.device.write(self.prefix + ETH_HEADER.pack(sha, self.mac, ETH_P_ARP) +
+                              ARP_HEADER.pack(ARPHRD_ETHER, ETH_P_IP, 6, 4, ARPOP_REPLY, self.mac, self.ip, sha, spa))
+
+    def _confirm(self, ip, mac):
+        now = self.clock()
+        entry = self.neighbours.get(ip)
+        if entry is None:
+            entry = self._add(ip, now)
+        if entry.mac != mac:
+            entry.mac = mac
+            entry.header = self.prefix + ETH_HEADER.pack(mac, self.mac, ETH_P_IP)
+        entry.state = REACHABLE
+        entry.updated = now
+        entry.probes = 0
+        if entry.timer is not None:
+            entry.timer.cancel()
+            entry.timer = None
+        if entry.pending:
+            pending, entry.pending = entry.pending, None
+            self.device.write_many([(entry.header, packet) for packet in pending])
+
+    def _add(self, ip, now):
+        if len(self.neighbours) >= self.max_neighbours:
+            _, oldest = self.neighbours.popitem(last=False)
+            if oldest.timer is not None:
+                oldest.timer.cancel()
+            if oldest.pending:
+                self.pending_drops += len(oldest.pending)
+        entry = self.neighbours[ip] = Neighbour(ip, now)
+        return entry
+
+    def _solicit(self, entry, now):
+        entry.probes += 1
+        entry.requested = now
+        self.arp_requests += 1
+        self.device.write(self.prefix + ETH_HEADER.pack(BROADCAST_MAC, self.mac, ETH_P_ARP) +
+                          ARP_HEADER.pack(ARPHRD_ETHER, ETH_P_IP, 6, 4, ARPOP_REQUEST, self.mac, self.ip, ZERO_MAC, entry.ip))
+        if self.timers is not None and entry.timer is None:
+            entry.timer = self.timers.schedule(self.retrans_time, self._on_retrans_timer, entry)
+
+    def _on_retrans_timer(self, entry):
+        entry.timer = None
+        if entry.state in (INCOMPLETE, STALE):
+            self._probe(entry, self.clock())
+
+    def _probe(self, entry, now):
+        # Sends the next request when one is due; after max_probes the entry turns negative.
+        if entry.requested is not None and now - entry.requested < self.retrans_time:
+            return
+        if entry.probes < self.max_probes:
+            self._solicit(entry, now)
+            return
+        entry.state = FAILED
+        entry.updated = now
+        if entry.pending:
+            self.pending_drops += len(entry.pending)
+            entry.pending = None
+
+    def _header(self, dst, packet, now):
+        # The Ethernet header for dst, or None when the packet was queued or dropped instead.
+        entry = self.neighbours.get(self.next_hop(dst))
+        if entry is not None and entry.state == REACHABLE and now - entry.updated < self.reachable_time:
+            return entry.header
+        if entry is None:
+            entry = self._add(self.next_hop(dst), now)
+        elif entry.state == REACHABLE:
+            entry.state = STALE
+            entry.probes = 0
+            entry.requested = None
+        elif entry.state == FAILED:
+            if now - entry.updated < self.failed_time:
+                self.unresolved_drops += 1
+                return None
+            entry.state = INCOMPLETE
+            entry.probes = 0
+            entry.requested = None
+        self._probe(entry, now)
+        if entry.state == STALE:
+            return entry.header
+        if entry.state == FAILED:
+            self.unresolved_drops += 1
+            return None
+        if entry.pending is None:
+            entry.pending = deque()
+        elif len(entry.pending) >= self.pending_limit:
+            entry.pending.popleft()
+            self.pending_drops += 1
+        entry.pending.append(b''.join(packet))  # the buffers may be reused once we return
+        return None
+
+    def send(self, dst: int, packet) -> bool:
+        # Returns False only when the packet was dropped; a queued packet counts as sent.
+        header = self._header(dst, (packet,), self.clock())
+        if header is None:
+            return self.neighbours[self.next_hop(dst)].state == INCOMPLETE
+        return self.device.write(header + packet) > 0
+
+    def send_many(self, packets) -> int:
+        # packets is an iterable of (dst, buffers), buffers being the pieces of one IPv4 packet.
+        # Resolved packets go to the device in one write_many; returns the number accepted.
+        now = self.clock()
+        frames = []
+        queued = 0
+        for dst, buffers in packets:
+            header = self._header(dst, buffers, now)
+            if header is not None:
+                frames.append((header,) + tuple(buffers))
+            elif self.neighbours[self.next_hop(dst)].state == INCOMPLETE:
+                queued += 1
+        return queued + (self.device.write_many(frames) if frames else 0)
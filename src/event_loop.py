@@ -1,45 +1,161 @@
 import select
-from typing import Dict, Callable, List, Optional
+from typing import Dict, Callable, List, Optional, Tuple
 from collections import defaultdict
+from timer_wheel import TimerWheel, Timer
 
-class EventLoop:
+EVENT_READ  = 0x1
+EVENT_WRITE = 0x2
+EVENT_ERROR = 0x4
+
+class SelectBackend:
     def __init__(self):
+        self.read_fds = set()
+        self.write_fds = set()
+        self.error_fds = set()
+
+    def register(self, fd: int, events: int):
+        self.modify(fd, events)
+
+    def modify(self, fd: int, events: int):
+        for mask, fds in ((EVENT_READ, self.read_fds), (EVENT_WRITE, self.write_fds), (EVENT_ERROR, self.error_fds)):
+            if events & mask:
+                fds.add(fd)
+            else:
+                fds.discard(fd)
+
+    def unregister(self, fd: int):
+        self.modify(fd, 0)
+
+    def poll(self, timeout: Optional[float] = None) -> List[Tuple[int, int]]:
+        readable, writable, errored = select.select(list(self.read_fds), list(self.write_fds), list(self.error_fds), timeout)
+        events = defaultdict(int)
+        for fd in readable:
+            events[fd] |= EVENT_READ
+        for fd in writable:
+            events[fd] |= EVENT_WRITE
+        for fd in errored:
+            events[fd] |= EVENT_ERROR
+        return list(events.items())
+
+    def close(self):
+        self.read_fds.clear()
+        self.write_fds.clear()
+        self.error_fds.clear()
+
+class EpollBackend:
+    def __init__(self, edge_triggered: bool = False):
+        self.epoll = select.epoll()
+        self.edge_triggered = edge_triggered
+        self.registered = set()
+
+    def _to_epoll(self, events: int) -> int:
+        mask = 0
+        if events & EVENT_READ:
+            mask |= select.EPOLLIN
+        if events & EVENT_WRITE:
+            mask |= select.EPOLLOUT
+        if events & EVENT_ERROR:
+            mask |= select.EPOLLPRI
+        if self.edge_triggered:
+            mask |= select.EPOLLET
+        return mask
+
+    def register(self, fd: int, events: int):
+        if fd in self.registered:
+            self.epoll.modify(fd, self._to_epoll(events))
+        else:
+            self.epoll.register(fd, self._to_epoll(events))
+            self.registered.add(fd)
+
+    def modify(self, fd: int, events: int):
+        self.register(fd, events)
+
+    def unregister(self, fd: int):
+        if fd in self.registered:
+            self.registered.discard(fd)
+            try:
+                self.epoll.unregister(fd)
+            except OSError:
+                pass  # fd was closed before it was removed from the loop
+
+    def poll(self, timeout: Optional[float] = None) -> List[Tuple[int, int]]:
+        result = []
+        for fd, mask in self.epoll.poll(-1 if timeout is None else timeout):
+            events = 0
+            if mask & (select.EPOLLIN | select.EPOLLHUP):
+                events |= EVENT_READ
+            if mask & select.EPOLLOUT:
+                events |= EVENT_WRITE
+            if mask & (select.EPOLLERR | select.EPOLLPRI):
+                events |= EVENT_ERROR
+            result.append((fd, events))
+        return result
+
+    def close(self):
+        self.registered.clear()
+        self.epoll.close()
+
+def create_backend(name: str = 'epoll', edge_triggered: bool = False):
+    if name == 'epoll' and hasattr(select, 'epoll'):
+        return EpollBackend(edge_triggered)
+    if name in ('select', 'epoll'):
+        return SelectBackend()
+    raise ValueError(f"Unsupported event loop backend: {name}")
+
+class EventLoop:
+    def __init__(self, backend: str = 'epoll', edge_triggered: bool = False, timer_resolution: float = 0.01):
         self.handlers: Dict[int, Dict[str, Optional[Callable]]] = defaultdict(lambda: {'read': None, 'write': None, 'error': None})
         self.is_running: bool = False
+        self.backend = create_backend(backend, edge_triggered)
+        self.timers = TimerWheel(timer_resolution)
 
     def add_handler(self, fd: int, read_handler: Optional[Callable] = None, write_handler: Optional[Callable] = None, error_handler: Optional[Callable] = None):
         self.handlers[fd]['read'] = read_handler
         self.handlers[fd]['write'] = write_handler
         self.handlers[fd]['error'] = error_handler
+        self.backend.register(fd, self._interest(self.handlers[fd]))
 
     def remove_handler(self, fd: int):
         if fd in self.handlers:
             del self.handlers[fd]
+            self.backend.unregister(fd)
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        return self.timers.schedule(delay, callback, *args)
+
+    def cancel_timer(self, timer: Timer):
+        self.timers.cancel(timer)
+
+    def _interest(self, handlers: Dict[str, Optional[Callable]]) -> int:
+        events = 0
+        if handlers['read']:
+            events |= EVENT_READ
+        if handlers['write']:
+            events |= EVENT_WRITE
+        if handlers['error']:
+            events |= EVENT_ERROR
+        return events
 
     def run(self):
         self.is_running = True
         while self.is_running:
-            read_fds = [fd for fd, handlers in self.handlers.items() if handlers['read']]
-            write_fds = [fd for fd, handlers in self.handlers.items() if handlers['write']]
-            error_fds = [fd for fd, handlers in self.handlers.items() if handlers['error']]
-
-            readable, writable, errored = select.select(read_fds, write_fds, error_fds)
-
-            for fd in readable:
-                if handler := self.handlers[fd]['read']:
+            for fd, events in self.backend.poll(self.timers.timeout()):
+                handlers = self.handlers.get(fd)
+                if handlers is None:
+                    continue
+                if events & EVENT_READ and (handler := handlers['read']):
                     handler(fd)
-            for fd in writable:
-                if handler := self.handlers[fd]['write']:
+                if events & EVENT_WRITE and (handler := handlers['write']):
                     handler(fd)
-            for fd in errored:
-                if handler := self.handlers[fd]['error']:
+                if events & EVENT_ERROR and (handler := handlers['error']):
                     handler(fd)
+            self.timers.advance()
 
     def stop(self):
         self.is_running = False
+        for fd in self.handlers:
+            self.backend.unregister(fd)
         self.handlers.clear()
 
     def get_handlers(self) -> Dict[int, Dict[str, Optional[Callable]]]:
         return self.handlers
-
-
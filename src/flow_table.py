@@ -0,0 +1,50 @@
+from typing import Any, Dict, Optional, Tuple
+from packet_parser import ip_to_int
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+WILDCARD_IP = '0.0.0.0'
+
+def _ip(ip) -> int:
+    return ip if isinstance(ip, int) else ip_to_int(ip)
+
+class FlowTable:
+    def __init__(self):
+        # Addresses are stored as 32-bit ints so lookups from parsed headers need no formatting.
+        # (proto, local_ip, local_port, remote_ip, remote_port) -> endpoint
+        self.flows: Dict[Tuple, Any] = {}
+        # (proto, local_ip, local_port) -> endpoint, local_ip may be the wildcard address
+        self.listeners: Dict[Tuple, Any] = {}
+        # TimeWaitTable set by the owner; tuples in it are answered by the table itself.
+        self.time_wait = None
+
+    def add_flow(self, proto, local_ip, local_port, remote_ip, remote_port, endpoint):
+        self.flows[(proto, _ip(local_ip), local_port, _ip(remote_ip), remote_port)] = endpoint
+
+    def remove_flow(self, proto, local_ip, local_port, remote_ip, remote_port, endpoint=None):
+        key = (proto, _ip(local_ip), local_port, _ip(remote_ip), remote_port)
+        if endpoint is None or self.flows.get(key) is endpoint:
+            self.flows.pop(key, None)
+
+    def add_listener(self, proto, local_ip, local_port, endpoint):
+        self.listeners[(proto, _ip(local_ip), local_port)] = endpoint
+
+    def remove_listener(self, proto, local_ip, local_port, endpoint=None):
+        key = (proto, _ip(local_ip), local_port)
+        if endpoint is None or self.listeners.get(key) is endpoint:
+            self.listeners.pop(key, None)
+
+    def lookup(self, proto, local_ip, local_port, remote_ip, remote_port) -> Optional[Any]:
+        local_ip, remote_ip = _ip(local_ip), _ip(remote_ip)
+        endpoint = self.flows.get((proto, local_ip, local_port, remote_ip, remote_port))
+        if endpoint is not None:
+            return endpoint
+        if proto == IPPROTO_TCP and self.time_wait and (local_ip, local_port, remote_ip, remote_port) in self.time_wait:
+            return self.time_wait
+        endpoint = self.listeners.get((proto, local_ip, local_port))
+        if endpoint is not None:
+            return endpoint
+        return self.listeners.get((proto, 0, local_port))
+
+    def __len__(self):
+        return len(self.flows) + len(self.listeners)
@@ -1,50 +1,33 @@
-from virtual_device_manager import VirtualDeviceInterface
-from socket_manager import SocketManager
-from packet_parser import PacketParser
-from event_loop import EventLoop
+from tcp_protocol import TCPProtocol
+from udp_protocol import UDPProtocol
+from ethernet import EthernetLayer
+from socket import Socket
+from time_wait import TimeWaitTable
 from config import Config
 import logging
+import stack
 
 def main():
     config = Config()
     logging.basicConfig(level=config.get('log_level', 'INFO'))
-    logger = logging.getLogger(__name__)
 
-    virtual_device = VirtualDeviceInterface(config.get('device_name', 'tap0'))
-    socket_manager = SocketManager()
-    packet_parser = PacketParser()
-    event_loop = EventLoop()
-
-    def handle_read(fd):
-        try:
-            packet = virtual_device.read(config.get('mtu', 1500))
-            ip_packet = packet_parser.parse_ip_packet(packet)
-            socket_manager.handle_packet(ip_packet)
-        except Exception as e:
-            logger.error(f"Error handling read: {e}")
-
-    def handle_write(fd):
-        try:
-            # Implement write logic here
-            pass
-        except Exception as e:
-            logger.error(f"Error handling write: {e}")
-
-    def handle_error(fd):
-        logger.error(f"Error on file descriptor: {fd}")
-
-    event_loop.add_handler(virtual_device.fd, read_handler=handle_read, write_handler=handle_write, error_handler=handle_error)
-
-    try:
-        logger.info("Starting event loop...")
-        event_loop.run()
-    except KeyboardInterrupt:
-        logger.info("Shutting down...")
-    finally:
-        virtual_device.close()
-        event_loop.stop()
+    # Stack-wide knobs, set before any worker starts so that every worker inherits them.
+    TCPProtocol.default_congestion_control = config.get('congestion_control', 'newreno')
+    TCPProtocol.default_delayed_ack = config.get('delayed_ack', True)
+    TCPProtocol.delayed_ack_timeout = config.get('delayed_ack_timeout', 0.04)
+    TCPProtocol.default_mss = config.get('mtu', 1500) - 40
+    TCPProtocol.default_window_scaling = config.get('tcp_window_scaling', True)
+    TCPProtocol.default_timestamps = config.get('tcp_timestamps', True)
+    TCPProtocol.default_sack = config.get('tcp_sack', True)
+    Socket.syn_backlog = config.get('tcp_max_syn_backlog', 128)
+    Socket.syncookies = config.get('tcp_syncookies', True)
+    TimeWaitTable.reuse = config.get('tcp_tw_reuse', True)
+    TimeWaitTable.max_buckets = config.get('tcp_max_tw_buckets', 262144)
+    EthernetLayer.reachable_time = config.get('arp_reachable_time', 30.0)
+    EthernetLayer.pending_limit = config.get('arp_pending_limit', 16)
+    UDPProtocol.mtu = config.get('mtu', 1500)
+
+    stack.run(config)
 
 if __name__ == "__main__":
     main()
-
-
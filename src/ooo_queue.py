@@ -0,0 +1,80 @@
+SEQ_MASK = 0xFFFFFFFF
+SEQ_HALF = 1 << 31
+
+class OutOfOrderQueue:
+    # Segments received beyond a hole, kept as disjoint ranges ordered by distance from
+    # rcv_nxt. Overlapping or touching arrivals are merged, so each range is one buffer.
+    def __init__(self, limit: int = 256 * 1024):
+        self.limit = limit
+        self.ranges = []  # [seq, bytearray]
+        self.size = 0
+        self.recent = None  # start of the range the last insert landed in
+        self.drops = 0
+
+    def __len__(self):
+        return self.size
+
+    def _bounds(self, rcv_nxt):
+        bounds = []
+        for seq, data in self.ranges:
+            start = (seq - rcv_nxt) & SEQ_MASK
+            bounds.append((start, start + len(data)))
+        return bounds
+
+    def insert(self, rcv_nxt: int, seq: int, data) -> bool:
+        start = (seq - rcv_nxt) & SEQ_MASK
+        if start >= SEQ_HALF or not data:
+            return False  # at or behind rcv_nxt; the in-order path owns that data
+        end = start + len(data)
+        bounds = self._bounds(rcv_nxt)
+        i = 0
+        while i < len(bounds) and bounds[i][1] < start:
+            i += 1
+        j = i
+        while j < len(bounds) and bounds[j][0] <= end:
+            j += 1
+        held = sum(len(self.ranges[k][1]) for k in range(i, j))
+        merged_start = min(start, bounds[i][0]) if i < j else start
+        merged_end = max(end, bounds[j - 1][1]) if i < j else end
+        if self.size - held + (merged_end - merged_start) > self.limit:
+            self.drops += 1
+            return False
+        # The pieces cover one contiguous span; the leftmost one becomes the buffer and
+        # the rest only contribute the bytes beyond its current end.
+        pieces = [(bounds[k][0], self.ranges[k][1]) for k in range(i, j)]
+        pieces.append((start, data))
+        pieces.sort(key=lambda piece: piece[0])
+        buffer = pieces[0][1] if pieces[0][1] is not data else bytearray(data)
+        for offset, piece in pieces[1:]:
+            tail = merged_start + len(buffer) - offset
+            if tail < len(piece):
+                buffer += piece[tail:]
+        merged_seq = (rcv_nxt + merged_start) & SEQ_MASK
+        self.ranges[i:j] = [[merged_seq, buffer]]
+        self.size += len(buffer) - held
+        self.recent = merged_seq
+        return True
+
+    def pop(self, rcv_nxt: int):
+        # Returns the bytes continuing at rcv_nxt as a memoryview, or None while the hole remains.
+        while self.ranges:
+            seq, data = self.ranges[0]
+            behind = (rcv_nxt - seq) & SEQ_MASK
+            if behind >= SEQ_HALF:
+                return None
+            del self.ranges[0]
+            self.size -= len(data)
+            if behind < len(data):
+                return memoryview(data)[behind:]
+        return None
+
+    def sack_blocks(self, count: int):
+        blocks = [(seq, (seq + len(data)) & SEQ_MASK) for seq, data in self.ranges]
+        # RFC 2018: the block holding the most recently received segment goes first.
+        blocks.sort(key=lambda block: block[0] != self.recent)
+        return blocks[:count]
+
+    def clear(self):
+        self.ranges.clear()
+        self.size = 0
+        self.recent = None
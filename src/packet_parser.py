@@ -1,73 +1,176 @@
 import struct
 from typing import Dict, Any
+from checksum import ip_header_checksum, transport_checksum
+
+ETH_HEADER = struct.Struct('!6s6sH')
+IP_HEADER  = struct.Struct('!BBHHHBBHII')
+TCP_HEADER = struct.Struct('!HHIIHHHH')
+UDP_HEADER = struct.Struct('!HHHH')
+
+ETH_P_IP = 0x0800
+
+TCPOPT_EOL = 0
+TCPOPT_NOP = 1
+TCPOPT_MSS = 2
+TCPOPT_WINDOW_SCALE = 3
+TCPOPT_SACK_PERMITTED = 4
+TCPOPT_SACK = 5
+TCPOPT_TIMESTAMP = 8
+
+def ip_to_str(ip: int) -> str:
+    return f"{ip >> 24}.{(ip >> 16) & 0xFF}.{(ip >> 8) & 0xFF}.{ip & 0xFF}"
+
+def ip_to_int(ip) -> int:
+    if isinstance(ip, int):
+        return ip
+    a, b, c, d = map(int, ip.split('.'))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+def mac_to_bytes(mac: str) -> bytes:
+    return bytes.fromhex(mac.replace(':', ''))
+
+class Header:
+    __slots__ = ()
+
+    # Mapping-style access so header objects can stand in for the dict API.
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+class IPv4Header(Header):
+    __slots__ = ('version', 'ihl', 'dscp_ecn', 'total_length', 'identification', 'flags_fragment_offset',
+                 'ttl', 'protocol', 'header_checksum', 'src', 'dst', 'data', 'raw')
+    FIELDS = ('version', 'ihl', 'dscp_ecn', 'total_length', 'identification', 'flags_fragment_offset',
+              'ttl', 'protocol', 'header_checksum', 'src_ip', 'dst_ip', 'data')
+
+    @property
+    def src_ip(self) -> str:
+        return ip_to_str(self.src)
+
+    @property
+    def dst_ip(self) -> str:
+        return ip_to_str(self.dst)
+
+class TCPHeader(Header):
+    __slots__ = ('src_port', 'dst_port', 'seq_num', 'ack_num', 'data_offset', 'flags', 'window_size',
+                 'checksum', 'urgent_pointer', 'data', 'ip', 'mss', 'window_scale', 'sack_permitted',
+                 'timestamp', 'sack_blocks')
+    FIELDS = ('src_port', 'dst_port', 'seq_num', 'ack_num', 'data_offset', 'flags', 'window_size',
+              'checksum', 'urgent_pointer', 'data', 'mss', 'window_scale', 'sack_permitted', 'timestamp',
+              'sack_blocks')
+
+    @property
+    def src_ip(self) -> str:
+        return self.ip['src_ip']
+
+    @property
+    def dst_ip(self) -> str:
+        return self.ip['dst_ip']
+
+class UDPHeader(Header):
+    __slots__ = ('src_port', 'dst_port', 'length', 'checksum', 'data', 'ip')
+    FIELDS = ('src_port', 'dst_port', 'length', 'checksum', 'data')
+
+    @property
+    def src_ip(self) -> str:
+        return self.ip['src_ip']
+
+    @property
+    def dst_ip(self) -> str:
+        return self.ip['dst_ip']
 
 class PacketParser:
+    def parse_ip_header(self, packet) -> IPv4Header:
+        view = memoryview(packet)
+        header = IPv4Header()
+        (version_ihl, header.dscp_ecn, header.total_length, header.identification, header.flags_fragment_offset,
+         header.ttl, header.protocol, header.header_checksum, header.src, header.dst) = IP_HEADER.unpack_from(view)
+        header.version = version_ihl >> 4
+        header.ihl = ihl = version_ihl & 0xF
+        end = header.total_length if ihl * 4 <= header.total_length <= len(view) else len(view)
+        header.data = view[ihl * 4:end]
+        header.raw = view
+        return header
+
+    def parse_tcp_header(self, segment, ip=None) -> TCPHeader:
+        view = memoryview(segment)
+        header = TCPHeader()
+        (header.src_port, header.dst_port, header.seq_num, header.ack_num, offset_reserved_flags,
+         header.window_size, header.checksum, header.urgent_pointer) = TCP_HEADER.unpack_from(view)
+        header.data_offset = data_offset = (offset_reserved_flags >> 12) * 4
+        header.flags = offset_reserved_flags & 0x3F
+        header.data = view[data_offset:]
+        header.ip = ip
+        header.mss = header.window_scale = header.timestamp = header.sack_blocks = None
+        header.sack_permitted = False
+        if data_offset > 20:
+            self._parse_tcp_options(header, view[20:data_offset])
+        return header
+
+    def _parse_tcp_options(self, header, options):
+        i, end = 0, len(options)
+        while i < end:
+            kind = options[i]
+            if kind == TCPOPT_EOL:
+                break
+            if kind == TCPOPT_NOP:
+                i += 1
+                continue
+            if i + 1 >= end or options[i + 1] < 2:
+                break  # malformed; ignore the rest
+            length = options[i + 1]
+            if kind == TCPOPT_MSS and length == 4 and i + 4 <= end:
+                header.mss = (options[i + 2] << 8) | options[i + 3]
+            elif kind == TCPOPT_WINDOW_SCALE and length == 3 and i + 3 <= end:
+                header.window_scale = min(options[i + 2], 14)  # RFC 7323 2.3
+            elif kind == TCPOPT_SACK_PERMITTED and length == 2:
+                header.sack_permitted = True
+            elif kind == TCPOPT_TIMESTAMP and length == 10 and i + 10 <= end:
+                header.timestamp = struct.unpack_from('!II', options, i + 2)
+            elif kind == TCPOPT_SACK:
+                header.sack_blocks = [struct.unpack_from('!II', options, offset)
+                                      for offset in range(i + 2, min(i + length, end) - 7, 8)]
+            i += length
+
+    def parse_udp_header(self, datagram, ip=None) -> UDPHeader:
+        view = memoryview(datagram)
+        header = UDPHeader()
+        header.src_port, header.dst_port, header.length, header.checksum = UDP_HEADER.unpack_from(view)
+        header.data = view[8:]
+        header.ip = ip
+        return header
+
     def parse_ip_packet(self, packet: bytes) -> Dict[str, Any]:
-        version_ihl = packet[0]
-        version = version_ihl >> 4
-        ihl = version_ihl & 0xF
-        dscp_ecn = packet[1]
-        total_length = struct.unpack('!H', packet[2:4])[0]
-        identification = struct.unpack('!H', packet[4:6])[0]
-        flags_fragment_offset = struct.unpack('!H', packet[6:8])[0]
-        ttl = packet[8]
-        protocol = packet[9]
-        header_checksum = struct.unpack('!H', packet[10:12])[0]
-        src_ip = '.'.join(map(str, packet[12:16]))
-        dst_ip = '.'.join(map(str, packet[16:20]))
-        
-        return {
-            'version': version,
-            'ihl': ihl,
-            'dscp_ecn': dscp_ecn,
-            'total_length': total_length,
-            'identification': identification,
-            'flags_fragment_offset': flags_fragment_offset,
-            'ttl': ttl,
-            'protocol': protocol,
-            'header_checksum': header_checksum,
-            'src_ip': src_ip,
-            'dst_ip': dst_ip,
-            'data': packet[ihl*4:]
-        }
+        header = self.parse_ip_header(packet)
+        result = header.to_dict()
+        result['data'] = packet[header.ihl * 4:]
+        return result
 
     def parse_tcp_packet(self, packet: bytes) -> Dict[str, Any]:
-        src_port, dst_port = struct.unpack('!HH', packet[:4])
-        seq_num = struct.unpack('!I', packet[4:8])[0]
-        ack_num = struct.unpack('!I', packet[8:12])[0]
-        offset_reserved_flags = struct.unpack('!H', packet[12:14])[0]
-        data_offset = (offset_reserved_flags >> 12) * 4
-        flags = offset_reserved_flags & 0x3F
-        window_size = struct.unpack('!H', packet[14:16])[0]
-        checksum = struct.unpack('!H', packet[16:18])[0]
-        urgent_pointer = struct.unpack('!H', packet[18:20])[0]
-        
-        return {
-            'src_port': src_port,
-            'dst_port': dst_port,
-            'seq_num': seq_num,
-            'ack_num': ack_num,
-            'data_offset': data_offset,
-            'flags': flags,
-            'window_size': window_size,
-            'checksum': checksum,
-            'urgent_pointer': urgent_pointer,
-            'data': packet[data_offset:]
-        }
+        header = self.parse_tcp_header(packet)
+        result = header.to_dict()
+        result['data'] = packet[header.data_offset:]
+        return result
 
     def parse_udp_packet(self, packet: bytes) -> Dict[str, Any]:
-        src_port, dst_port, length, checksum = struct.unpack('!HHHH', packet[:8])
-        
-        return {
-            'src_port': src_port,
-            'dst_port': dst_port,
-            'length': length,
-            'checksum': checksum,
-            'data': packet[8:]
-        }
+        result = self.parse_udp_header(packet).to_dict()
+        result['data'] = packet[8:]
+        return result
 
     def construct_ip_packet(self, data: Dict[str, Any]) -> bytes:
-        header = struct.pack('!BBHHHBBH4s4s',
+        # A missing or None header_checksum is computed.
+        header = IP_HEADER.pack(
             (data['version'] << 4) + data['ihl'],
             data['dscp_ecn'],
             data['total_length'],
@@ -75,33 +178,69 @@ class PacketParser:
             data['flags_fragment_offset'],
             data['ttl'],
             data['protocol'],
-            data['header_checksum'],
-            bytes(map(int, data['src_ip'].split('.'))),
-            bytes(map(int, data['dst_ip'].split('.')))
+            data.get('header_checksum') or 0,
+            ip_to_int(data['src_ip']),
+            ip_to_int(data['dst_ip'])
         )
+        if data.get('header_checksum') is None:
+            header = header[:10] + ip_header_checksum(header).to_bytes(2, 'big') + header[12:]
         return header + data['data']
 
     def construct_tcp_packet(self, data: Dict[str, Any]) -> bytes:
+        # A missing or None checksum is computed over the pseudo-header, which needs src_ip/dst_ip.
+        # data_offset counts the fixed header only; option words are added to it.
+        options = self._construct_tcp_options(data)
         header = struct.pack('!HHIIBBHHH',
             data['src_port'],
             data['dst_port'],
             data['seq_num'],
             data['ack_num'],
-            data['data_offset'] << 4,
+            (data['data_offset'] + len(options) // 4) << 4,
             data['flags'],
             data['window_size'],
-            data['checksum'],
+            data.get('checksum') or 0,
             data['urgent_pointer']
         )
-        return header + data['data']
+        segment = header + options + data['data']
+        if data.get('checksum') is None:
+            value = transport_checksum(ip_to_int(data['src_ip']), ip_to_int(data['dst_ip']), 6, segment)
+            segment = segment[:16] + value.to_bytes(2, 'big') + segment[18:]
+        return segment
+
+    def _construct_tcp_options(self, data: Dict[str, Any]) -> bytes:
+        # Same layout as Linux, every option padded with NOPs to a 32-bit boundary.
+        options = b''
+        if data.get('mss') is not None:
+            options += struct.pack('!BBH', TCPOPT_MSS, 4, data['mss'])
+        timestamp = data.get('timestamp')
+        if data.get('sack_permitted'):
+            if timestamp is not None:
+                options += struct.pack('!BBBBII', TCPOPT_SACK_PERMITTED, 2, TCPOPT_TIMESTAMP, 10, *timestamp)
+                timestamp = None
+            else:
+                options += struct.pack('!BBBB', TCPOPT_NOP, TCPOPT_NOP, TCPOPT_SACK_PERMITTED, 2)
+        if timestamp is not None:
+            options += struct.pack('!BBBBII', TCPOPT_NOP, TCPOPT_NOP, TCPOPT_TIMESTAMP, 10, *timestamp)
+        if data.get('window_scale') is not None:
+            options += struct.pack('!BBBB', TCPOPT_NOP, TCPOPT_WINDOW_SCALE, 3, data['window_scale'])
+        blocks = data.get('sack_blocks')
+        if blocks:
+            # Four blocks fit in 40 bytes of options; three when timestamps are on.
+            blocks = blocks[:(40 - len(options) - 4) // 8]
+            options += struct.pack(f'!BBBB{2 * len(blocks)}I', TCPOPT_NOP, TCPOPT_NOP, TCPOPT_SACK,
+                                   2 + 8 * len(blocks), *(edge for block in blocks for edge in block))
+        return options
 
     def construct_udp_packet(self, data: Dict[str, Any]) -> bytes:
         header = struct.pack('!HHHH',
             data['src_port'],
             data['dst_port'],
             data['length'],
-            data['checksum']
+            data.get('checksum') or 0
         )
-        return header + data['data']
-
-
+        datagram = header + data['data']
+        if data.get('checksum') is None:
+            # A computed UDP checksum of zero is transmitted as all ones (RFC 768).
+            value = transport_checksum(ip_to_int(data['src_ip']), ip_to_int(data['dst_ip']), 17, datagram) or 0xFFFF
+            datagram = datagram[:6] + value.to_bytes(2, 'big') + datagram[8:]
+        return datagram
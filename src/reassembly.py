@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict
+from packet_parser import PacketParser, IP_HEADER
+from checksum import ip_header_checksum
+
+IP_MF = 0x2000
+IP_OFFMASK = 0x1FFF
+IP_FRAGMENTED = IP_MF | IP_OFFMASK  # set in any fragment, clear in a whole datagram
+IP_MAX_PACKET = 65535
+
+class FragmentQueue:
+    # One datagram being reassembled. Fragments are copied straight into place in buffer,
+    # behind room for a 20-byte header, so completion needs no further copy.
+    __slots__ = ('buffer', 'ranges', 'received', 'total', 'first', 'expires')
+
+    def __init__(self, size, expires):
+        self.buffer = bytearray(IP_HEADER.size + size)
+        self.ranges = []  # (start, end) payload byte ranges received
+        self.received = 0
+        self.total = None  # payload length, known once the last fragment arrives
+        self.first = None  # (dscp_ecn, ttl) of the offset-0 fragment
+        self.expires = expires
+
+class Reassembler:
+    # Fragmented IPv4 datagrams keyed by (src, dst, protocol, identification). Queues live in
+    # arrival order, which is also expiry order, and memory is charged by buffer size: going
+    # over memory_limit evicts the oldest queues down to three quarters of it, like Linux's
+    # ipfrag_high_thresh and ipfrag_low_thresh.
+    clock = time.monotonic
+    timeout = 30.0  # ipfrag_time
+    memory_limit = 4 * 1024 * 1024
+
+    def __init__(self):
+        self.queues = OrderedDict()
+        self.memory = 0
+        self.parser = PacketParser()
+        self.reassembled = 0
+        self.timeouts = 0
+        self.evictions = 0
+        self.malformed = 0
+
+    def __len__(self):
+        return len(self.queues)
+
+    def add(self, packet):
+        # Takes a fragment as an IPv4Header; returns the whole datagram once every fragment
+        # is in, otherwise None.
+        now = self.clock()
+        self._expire(now)
+        field = packet.flags_fragment_offset
+        start = (field & IP_OFFMASK) * 8
+        data = packet.data
+        end = start + len(data)
+        more = field & IP_MF
+        key = (packet.src, packet.dst, packet.protocol, packet.identification)
+        if (more and len(data) & 7) or end + IP_HEADER.size > IP_MAX_PACKET or not data:
+            self.malformed += 1
+            self._drop(key)
+            return None
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = FragmentQueue(end, now + self.timeout)
+            self._charge(len(queue.buffer))
+        elif end + IP_HEADER.size > len(queue.buffer):
+            grow = end + IP_HEADER.size - len(queue.buffer)
+            queue.buffer.extend(bytes(grow))
+            self._charge(grow)
+        if key not in self.queues:
+            return None  # evicted to make room for itself
+        if not self._place(queue, start, end, more):
+            self.malformed += 1
+            self._drop(key)
+            return None
+        queue.buffer[IP_HEADER.size + start:IP_HEADER.size + end] = data
+        if start == 0:
+            queue.first = (packet.dscp_ecn, packet.ttl)
+        if queue.received != queue.total:
+            return None
+        del self.queues[key]
+        self.memory -= len(queue.buffer)
+        self.reassembled += 1
+        return self._finish(key, queue)
+
+    def _place(self, queue, start, end, more) -> bool:
+        # Exact duplicates are ignored; any other overlap invalidates the datagram (RFC 5722
+        # reasoning, and what Linux does for IPv4 too).
+        for first, last in queue.ranges:
+            if start < last and first < end:
+                return (first, last) == (start, end)
+        if not more:
+            if queue.total is not None or end < max((last for _, last in queue.ranges), default=0):
+                return False
+            queue.total = end
+        elif queue.total is not None and end > queue.total:
+            return False
+        queue.ranges.append((start, end))
+        queue.received += end - start
+        return True
+
+    def _finish(self, key, queue):
+        src, dst, protocol, identification = key
+        dscp_ecn, ttl = queue.first
+        length = IP_HEADER.size + queue.total
+        buffer = queue.buffer
+        del buffer[length:]
+        IP_HEADER.pack_into(buffer, 0, 0x45, dscp_ecn, length, identification, 0, ttl, protocol, 0, src, dst)
+        buffer[10:12] = ip_header_checksum(buffer[:IP_HEADER.size]).to_bytes(2, 'big')
+        return self.parser.parse_ip_header(buffer)
+
+    def _charge(self, size):
+        self.memory += size
+        if self.memory > self.memory_limit:
+            low = self.memory_limit * 3 // 4
+            while self.memory > low and self.queues:
+                _, queue = self.queues.popitem(last=False)
+                self.memory -= len(queue.buffer)
+                self.evictions += 1
+
+    def _drop(self, key):
+        queue = self.queues.pop(key, None)
+        if queue is not None:
+            self.memory -= len(queue.buffer)
+
+    def _expire(self, now):
+        queues = self.queues
+        while queues:
+            key, queue = next(iter(queues.items()))
+            if queue.expires > now:
+                break
+            del queues[key]
+            self.memory -= len(queue.buffer)
+            self.timeouts += 1
@@ -0,0 +1,96 @@
+MIN_STORAGE = 4096
+
+class RingBuffer:
+    # Storage is allocated on the first write, doubles up to capacity as needed and is
+    # released whenever the ring drains, so an idle connection holds no buffer memory.
+    __slots__ = ('capacity', 'buffer', 'view', 'head', 'size', 'high_watermark', 'low_watermark')
+
+    def __init__(self, capacity: int = 65536, high_watermark: int = None, low_watermark: int = None):
+        self.capacity = capacity
+        self.buffer = None
+        self.view = None
+        self.head = 0
+        self.size = 0
+        self.high_watermark = capacity if high_watermark is None else high_watermark
+        self.low_watermark = capacity // 4 if low_watermark is None else low_watermark
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self.size
+
+    @property
+    def allocated(self) -> int:
+        return 0 if self.buffer is None else len(self.buffer)
+
+    @property
+    def above_high_watermark(self) -> bool:
+        return self.size >= self.high_watermark
+
+    @property
+    def below_low_watermark(self) -> bool:
+        return self.size <= self.low_watermark
+
+    def _reserve(self, needed: int):
+        allocated = self.allocated
+        if needed <= allocated:
+            return
+        buffer = bytearray(min(self.capacity, max(needed, allocated * 2, MIN_STORAGE)))
+        if self.size:
+            buffer[:self.size] = self.peek(self.size)  # unwrapped into the new storage
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.head = 0
+
+    def _release(self):
+        self.buffer = None
+        self.view = None
+        self.head = 0
+
+    def write(self, data) -> int:
+        # Copies as much of data as fits and returns the number of bytes accepted.
+        length = min(len(data), self.capacity - self.size)
+        if length <= 0:
+            return 0
+        self._reserve(self.size + length)
+        allocated = len(self.buffer)
+        source = memoryview(data)
+        tail = (self.head + self.size) % allocated
+        first = min(length, allocated - tail)
+        self.view[tail:tail + first] = source[:first]
+        if length > first:
+            self.view[:length - first] = source[first:length]
+        self.size += length
+        return length
+
+    def peek(self, length: int, offset: int = 0):
+        # Returns a memoryview when the range is contiguous; a wrapped range is joined into one bytes copy.
+        length = max(0, min(length, self.size - offset))
+        if self.buffer is None:
+            return b''
+        allocated = len(self.buffer)
+        start = (self.head + offset) % allocated
+        end = start + length
+        if end <= allocated:
+            return self.view[start:end]
+        return b''.join((self.view[start:], self.view[:end - allocated]))
+
+    def consume(self, length: int) -> int:
+        length = min(length, self.size)
+        self.size -= length
+        if self.size == 0:
+            self._release()
+        else:
+            self.head = (self.head + length) % len(self.buffer)
+        return length
+
+    def read(self, length: int = None) -> bytes:
+        data = bytes(self.peek(self.size if length is None else length))
+        self.consume(len(data))
+        return data
+
+    def clear(self):
+        self.size = 0
+        self._release()
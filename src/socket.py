@@ -1,21 +1,75 @@
 from enum import Enum
 from collections import deque
-from tcp_protocol import TCPProtocol, TCPFlags, TCPState
+import random
+from tcp_protocol import TCPProtocol, TCPFlags, TCPState, SEQ_MASK
+from syn_queue import HalfOpen, SynQueue, SynCookies
 from udp_protocol import UDPProtocol
+from flow_table import IPPROTO_TCP, IPPROTO_UDP, WILDCARD_IP
+from packet_parser import ip_to_int, ip_to_str
+
+TCP_NODELAY = 1
+TCP_CORK = 3
+TCP_QUICKACK = 12
+TCP_CONGESTION = 13
 
 class SocketType(Enum):
 	TCP = 1
 	UDP = 2
 
 class Socket:
-	def __init__(self, ip, port, socket_type = SocketType.TCP):
+	__slots__ = ('ip', 'port', 'socket_type', 'protocol', 'backlog', 'syn_queue', 'pending_connections',
+		'syn_queue_overflows', 'accept_queue_overflows', 'listen_drops', 'syn_cookies_sent', 'syn_cookies_failed',
+		'is_listening', 'flow_table', 'on_ready')
+	syn_backlog = 128
+	syncookies = True
+	cookies = SynCookies()
+
+	def __init__(self, ip, port, socket_type = SocketType.TCP, flow_table = None, protocol = None):
 		self.ip = ip
 		self.port = port
 		self.socket_type = socket_type
-		self.protocol = self._create_protocol()
+		self.protocol = protocol if protocol is not None else self._create_protocol()
 		self.backlog = 5
-		self.pending_connections = deque(maxlen=self.backlog)
+		# Listener state is created by listen(), so connected sockets do not carry it.
+		self.syn_queue = None  # half-open handshakes
+		self.pending_connections = None  # accept queue: completed handshakes only, up to backlog
+		self.syn_queue_overflows = 0
+		self.accept_queue_overflows = 0
+		self.listen_drops = 0
+		self.syn_cookies_sent = 0
+		self.syn_cookies_failed = 0
 		self.is_listening = False
+		self.flow_table = None
+		self.on_ready = None  # callable(socket) run after every packet the socket handles
+		if flow_table is not None:
+			self.attach(flow_table)
+
+	@property
+	def ip_protocol(self):
+		return IPPROTO_TCP if self.socket_type == SocketType.TCP else IPPROTO_UDP
+
+	def attach(self, flow_table):
+		self.flow_table = flow_table
+		if self.socket_type == SocketType.UDP:
+			flow_table.add_listener(IPPROTO_UDP, self.ip, self.port, self)
+		elif self.is_listening:
+			flow_table.add_listener(IPPROTO_TCP, self.ip, self.port, self)
+		elif self.protocol.dst_ip is not None:
+			self._register_flow(self)
+
+	def _register_flow(self, endpoint):
+		self.flow_table.add_flow(self.ip_protocol, self.ip, self.port, self.protocol.dst_ip, self.protocol.dst_port, endpoint)
+
+	def _unregister(self):
+		if self.flow_table is None:
+			return
+		if self.socket_type == SocketType.UDP or self.is_listening:
+			self.flow_table.remove_listener(self.ip_protocol, self.ip, self.port, self)
+		if self.is_listening:
+			for conn in self.pending_connections:
+				self.flow_table.remove_flow(IPPROTO_TCP, conn.src_ip, conn.src_port, conn.dst_ip, conn.dst_port, conn)
+		elif self.protocol.dst_ip is not None:
+			self.flow_table.remove_flow(self.ip_protocol, self.ip, self.port, self.protocol.dst_ip, self.protocol.dst_port, self)
 
 	def _create_protocol(self):
 		if self.socket_type == SocketType.TCP:
@@ -28,8 +82,12 @@ class Socket:
 	def listen(self, backlog=5):
 		if self.socket_type == SocketType.TCP:
 			self.backlog = backlog
+			self.syn_queue = SynQueue(self.syn_backlog)
+			self.pending_connections = deque()
 			self.protocol.set_state(TCPState.LISTEN)
 			self.is_listening = True
+			if self.flow_table is not None:
+				self.flow_table.add_listener(IPPROTO_TCP, self.ip, self.port, self)
 			# self.protocol.listen(backlog)
 			return True
 		else:
@@ -38,8 +96,12 @@ class Socket:
 	def accept(self):
 		if self.socket_type == SocketType.TCP and self.is_listening:
 			if self.pending_connections:
-				new_conn = self.pending_connections.popleft(0)
-				return Socket._from_protocol(new_conn)
+				new_conn = self.pending_connections.popleft()
+				new_socket = Socket._from_protocol(new_conn)
+				if self.flow_table is not None:
+					new_socket.flow_table = self.flow_table
+					new_socket._register_flow(new_socket)
+				return new_socket
 			return None
 		else:
 			raise NotImplementedError("Accept is only supported for TCP sockets")
@@ -47,45 +109,195 @@ class Socket:
 	def connect(self, dst_ip, dst_port):
 		self.protocol.dst_ip   = dst_ip
 		self.protocol.dst_port = dst_port
+		if self.flow_table is not None:
+			time_wait = self.flow_table.time_wait
+			key = (ip_to_int(self.ip), self.port, self.protocol.dst_ip, dst_port)
+			if self.socket_type == SocketType.TCP and time_wait is not None and not time_wait.reuse_for_connect(key, self.protocol):
+				raise ValueError(f"Address in use: {self.ip}:{self.port} -> {dst_ip}:{dst_port} is in TIME_WAIT")
+			self._register_flow(self)
 
 		return self.protocol.connect()
 		
 	def send(self, data):
 		return self.protocol.send(data)
+
+	def poll_output(self):
+		if self.socket_type == SocketType.TCP:
+			return self.protocol.poll_output()
+		return []
 	
+	def setsockopt(self, option, value):
+		if self.socket_type != SocketType.TCP:
+			raise ValueError(f"Unsupported option for {self.socket_type.name} sockets: {option}")
+		if option == TCP_CONGESTION:
+			self.protocol.set_congestion_control(value)
+		elif option == TCP_NODELAY:
+			self.protocol.set_nodelay(bool(value))
+		elif option == TCP_CORK:
+			self.protocol.set_cork(bool(value))
+		elif option == TCP_QUICKACK:
+			# Unlike Linux the setting is sticky: quick ACK stays on until cleared.
+			self.protocol.set_delayed_ack(not value)
+		else:
+			raise ValueError(f"Unsupported socket option: {option}")
+
+	def getsockopt(self, option):
+		if self.socket_type == SocketType.TCP:
+			if option == TCP_CONGESTION:
+				return self.protocol.congestion.name
+			if option == TCP_NODELAY:
+				return int(self.protocol.nodelay)
+			if option == TCP_CORK:
+				return int(self.protocol.cork)
+			if option == TCP_QUICKACK:
+				return int(not self.protocol.delayed_ack)
+		raise ValueError(f"Unsupported socket option: {option}")
+
 	def recv(self, buffer_size):
 		if self.socket_type == SocketType.TCP:
-			return self.protocol.get_received_data()[:buffer_size]
+			return self.protocol.get_received_data(buffer_size)
 		
 		else:
 			return self.protocol.receive(buffer_size)
-		
+
+	def send_to(self, data, addr):
+		if self.socket_type == SocketType.UDP:
+			return self.protocol.send_to(data, addr)
+		raise NotImplementedError("send_to is only supported for UDP sockets")
+
+	def send_many(self, datagrams):
+		# sendmmsg(2)-style: (data, addr) pairs written to the device as one batch.
+		if self.socket_type == SocketType.UDP:
+			return self.protocol.send_many(datagrams)
+		raise NotImplementedError("send_many is only supported for UDP sockets")
+
+	def recv_many(self, max_datagrams):
+		# recvmmsg(2)-style: up to max_datagrams queued Datagrams (data, addr) in one call.
+		if self.socket_type == SocketType.UDP:
+			return self.protocol.receive_many(max_datagrams)
+		raise NotImplementedError("recv_many is only supported for UDP sockets")
+
 	def close(self):
 		if self.socket_type == SocketType.TCP:
-			self.protocol.close()
+			if self.is_listening:
+				self._unregister()
+				self.syn_queue.clear()
+				self.is_listening = False
+				self.protocol.set_state(TCPState.CLOSED)
+				return None
+			packet = self.protocol.close()
+			if self.protocol.state == TCPState.CLOSED:
+				self._unregister()
+			return packet
 		else:
+			self._unregister()
 			return None  # UDP is connectionless, so no need to close
 		
+	def abort(self):
+		if self.socket_type != SocketType.TCP or self.is_listening:
+			return self.close()
+		packet = self.protocol.abort()
+		self._unregister()
+		return packet
+
 	def handle_packet(self, packet):
+		response = self._handle_packet(packet)
+		if self.on_ready is not None:
+			self.on_ready(self)
+		return response
+
+	def _handle_packet(self, packet):
 		if self.socket_type == SocketType.TCP:
 			if self.is_listening and self.protocol.state == TCPState.LISTEN:
-				if packet['flags'] & TCPFlags.SYN:
-					new_conn = TCPProtocol(self.ip, self.port, packet['src_ip'], packet['src_port'])
-					new_conn.state = TCPState.SYN_RECEIVED
-					new_conn.acknowledgment_number = packet['seq_num'] + 1
-					new_conn.sequence_number = packet['ack_num']
-					self.pending_connections.append(new_conn)
-					return new_conn._create_syn_ack_packet()
-			return self.protocol.handle_packet(packet)
+				flags = packet['flags']
+				if flags & TCPFlags.SYN:
+					return self._handle_listen_syn(packet)
+				if flags & TCPFlags.ACK and not flags & TCPFlags.RST:
+					return self._handle_listen_ack(packet)
+				return None
+			response = self.protocol.handle_packet(packet)
+			if self.protocol.state == TCPState.TIME_WAIT and self.flow_table is not None and self.flow_table.time_wait is not None:
+				self._enter_time_wait()
+			elif self.protocol.state == TCPState.CLOSED and not self.is_listening:
+				self._unregister()
+			return response
 		else:
 			return self.protocol.handle_packet(packet)
 
+	def _enter_time_wait(self):
+		# The table keeps only what TIME_WAIT needs, so the connection itself can be freed.
+		protocol = self.protocol
+		self._unregister()
+		key = (ip_to_int(self.ip), self.port, protocol.dst_ip, protocol.dst_port)
+		self.flow_table.time_wait.add(key, protocol.sequence_number, protocol.acknowledgment_number,
+			protocol.ts_recent if protocol.ts_enabled else None)
+		protocol.set_state(TCPState.CLOSED)
+
+	def _local_ip(self, packet):
+		return ip_to_int(packet.get('dst_ip', self.ip) if self.ip == WILDCARD_IP else self.ip)
+
+	def _handle_listen_syn(self, packet):
+		local_ip = self._local_ip(packet)
+		entry = self.syn_queue.get((ip_to_int(packet['src_ip']), packet['src_port'], local_ip))
+		if entry is not None and entry.irs == packet['seq_num']:
+			return TCPProtocol.create_syn_ack(self.port, entry)  # retransmitted SYN
+		if len(self.pending_connections) >= self.backlog:
+			self.accept_queue_overflows += 1
+			self.listen_drops += 1
+			return None
+		now = TCPProtocol.clock()
+		entry = HalfOpen(local_ip, packet, random.getrandbits(32), now)
+		if self.syn_queue.full(now):
+			self.syn_queue_overflows += 1
+			if not self.syncookies:
+				self.listen_drops += 1
+				return None
+			# Nothing is stored: the ISN encodes the MSS, and the other options are not offered.
+			entry.iss = self.cookies.encode(local_ip, self.port, entry.remote_ip, entry.remote_port, entry.irs, entry.mss)
+			entry.window_scale = entry.timestamp = None
+			entry.sack_permitted = False
+			self.syn_cookies_sent += 1
+			return TCPProtocol.create_syn_ack(self.port, entry)
+		self.syn_queue.add(entry)
+		return TCPProtocol.create_syn_ack(self.port, entry)
+
+	def _handle_listen_ack(self, packet):
+		local_ip = self._local_ip(packet)
+		remote_ip = ip_to_int(packet['src_ip'])
+		key = (remote_ip, packet['src_port'], local_ip)
+		iss = (packet['ack_num'] - 1) & SEQ_MASK
+		entry = self.syn_queue.get(key)
+		if entry is None or entry.iss != iss:
+			if not self.syncookies:
+				return None
+			irs = (packet['seq_num'] - 1) & SEQ_MASK
+			mss = self.cookies.decode(local_ip, self.port, remote_ip, packet['src_port'], irs, iss)
+			if mss is None:
+				self.syn_cookies_failed += 1
+				return None
+			syn = {'src_ip': remote_ip, 'src_port': packet['src_port'], 'seq_num': irs, 'mss': mss}
+			entry = HalfOpen(local_ip, syn, iss, TCPProtocol.clock())
+		if len(self.pending_connections) >= self.backlog:
+			self.accept_queue_overflows += 1
+			self.listen_drops += 1
+			return None
+		self.syn_queue.pop(key)
+		new_conn = TCPProtocol.from_half_open(self.port, entry)
+		new_conn.timers = self.protocol.timers
+		new_conn.output = self.protocol.output
+		response = new_conn.handle_packet(packet)
+		self.pending_connections.append(new_conn)
+		if self.flow_table is not None:
+			self.flow_table.add_flow(IPPROTO_TCP, local_ip, self.port, new_conn.dst_ip, new_conn.dst_port, new_conn)
+		return response
+
 	def set_blocking(self, flag):
 		# self.protocol.set_blocking(flag)
 		pass
 
 	def get_peer_name(self):
-		return self.protocol.dst_ip, self.protocol.dst_port
+		ip = self.protocol.dst_ip
+		return (ip_to_str(ip) if isinstance(ip, int) else ip), self.protocol.dst_port
 	
 	def get_sock_name(self):
 		return self.ip, self.port
@@ -93,13 +305,10 @@ class Socket:
 	@staticmethod
 	def _from_protocol(protocol):
 		if isinstance(protocol, TCPProtocol):
-			socket = Socket(protocol.src_ip, protocol.src_port, SocketType.TCP)
+			return Socket(protocol.src_ip, protocol.src_port, SocketType.TCP, protocol=protocol)
 		
 		elif isinstance(protocol, UDPProtocol):
-			socket = Socket(protocol.src_ip, protocol.src_port, SocketType.UDP)
+			return Socket(protocol.src_ip, protocol.src_port, SocketType.UDP, protocol=protocol)
 
 		else:
 			raise ValueError(f"Unsupported protocol: {protocol}")
-		
-		socket.protocol = protocol
-		return socket
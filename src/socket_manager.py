@@ -1,14 +1,29 @@
 from typing import Dict, Any
-from tcp_protocol import TCPProtocol
+from tcp_protocol import TCPProtocol, TCPFlags
 from udp_protocol import UDPProtocol
+from packet_parser import PacketParser, IPv4Header, ip_to_int
+from flow_table import FlowTable, IPPROTO_TCP, IPPROTO_UDP
+from checksum import verify_ip_header, verify_transport
+from time_wait import TimeWaitTable
+from reassembly import Reassembler, IP_FRAGMENTED
 
 class SocketInterface:
     def create_socket(self, protocol: str):
         raise NotImplementedError
 
 class SocketManager(SocketInterface):
-    def __init__(self):
+    def __init__(self, verify_checksums: bool = False):
         self.sockets: Dict[str, Any] = {}
+        self.verify_checksums = verify_checksums
+        self.checksum_drops = 0
+        self.flow_table = FlowTable()
+        self.flow_table.time_wait = TimeWaitTable(self.flow_table)
+        self.packet_parser = PacketParser()
+        self.reassembler = Reassembler()
+        # The owning stack's plumbing, handed to every socket added here.
+        self.timers = None
+        self.output = None  # callable(segment) for TCP segments sent outside handle_packet
+        self.link = None  # EthernetLayer UDP datagrams are sent through
 
     def create_socket(self, protocol: str):
         if protocol.lower() == 'tcp':
@@ -22,6 +37,18 @@ class SocketManager(SocketInterface):
         self.sockets[socket_id] = socket
         return socket_id
 
+    def add_socket(self, socket):
+        socket_id = f"{socket.socket_type.name.lower()}_{id(socket)}"
+        self.sockets[socket_id] = socket
+        protocol = socket.protocol
+        if isinstance(protocol, TCPProtocol):
+            protocol.timers = self.timers
+            protocol.output = self.output
+        elif self.link is not None:
+            protocol.link = self.link
+        socket.attach(self.flow_table)
+        return socket_id
+
     def get_socket(self, socket_id: str):
         return self.sockets.get(socket_id)
 
@@ -30,15 +57,37 @@ class SocketManager(SocketInterface):
             self.sockets[socket_id].close()
             del self.sockets[socket_id]
 
-    def handle_packet(self, packet: Dict[str, Any]):
-        protocol = 'tcp' if packet['protocol'] == 6 else 'udp' if packet['protocol'] == 17 else None
-        if not protocol:
-            raise ValueError(f"Unsupported protocol: {packet['protocol']}")
-        
-        for socket in self.sockets.values():
-            if isinstance(socket, TCPProtocol) and protocol == 'tcp':
-                socket.handle_packet(packet)
-            elif isinstance(socket, UDPProtocol) and protocol == 'udp':
-                socket.handle_packet(packet)
+    def handle_packet(self, packet):
+        # Unfragmented packets, nearly all of them, cost one test on the way past reassembly.
+        if isinstance(packet, IPv4Header) and packet.flags_fragment_offset & IP_FRAGMENTED:
+            packet = self.reassembler.add(packet)
+            if packet is None:
+                return None
+        protocol = packet['protocol']
+        if protocol == IPPROTO_TCP:
+            segment = self.packet_parser.parse_tcp_header(packet['data'], packet)
+        elif protocol == IPPROTO_UDP:
+            segment = self.packet_parser.parse_udp_header(packet['data'], packet)
+        else:
+            raise ValueError(f"Unsupported protocol: {protocol}")
 
+        if isinstance(packet, IPv4Header):
+            src, dst = packet.src, packet.dst
+        else:
+            src, dst = ip_to_int(packet['src_ip']), ip_to_int(packet['dst_ip'])
+        if self.verify_checksums and not self._checksums_valid(packet, segment, src, dst):
+            self.checksum_drops += 1
+            return None
+        endpoint = self.flow_table.lookup(protocol, dst, segment.dst_port, src, segment.src_port)
+        if endpoint is None:
+            if protocol == IPPROTO_TCP and not segment['flags'] & TCPFlags.RST:
+                return TCPProtocol.create_reset(segment)  # nothing listens on the port
+            return None
+        return endpoint.handle_packet(segment)
 
+    def _checksums_valid(self, packet, segment, src: int, dst: int) -> bool:
+        if isinstance(packet, IPv4Header) and not verify_ip_header(packet.raw[:packet.ihl * 4]):
+            return False
+        if packet['protocol'] == IPPROTO_UDP and segment.checksum == 0:
+            return True  # sender did not compute a UDP checksum
+        return verify_transport(src, dst, packet['protocol'], packet['data'])
@@ -0,0 +1,210 @@
+import _socket  # the standard socket module is shadowed by socket.py here
+import logging
+import os
+import random
+import struct
+from virtual_device_manager import VirtualDeviceInterface, ReceiveBatch, FRAME_OVERHEAD
+from socket_manager import SocketManager
+from packet_parser import PacketParser, ETH_HEADER, mac_to_bytes, ip_to_int
+from ethernet import EthernetLayer, ETH_P_ARP
+from reassembly import IP_FRAGMENTED, IP_MAX_PACKET
+from flow_table import IPPROTO_TCP, IPPROTO_UDP
+from event_loop import EventLoop
+
+PORTS = struct.Struct('!HH')
+IP_DF = 0x4000
+ARP_FRAME = b'\x00'  # channel message kinds: an ARP frame every worker learns from,
+IP_PACKET = b'\x01'  # or an IP packet for the flows of the receiving worker
+
+def flow_hash(src: int, src_port: int, dst: int, dst_port: int) -> int:
+    # Symmetric in the two endpoints and the same in every process (unlike hash(), which is
+    # salted per interpreter), so a flow maps to one worker whichever way a packet goes.
+    a, b = (src << 16) | src_port, (dst << 16) | dst_port
+    if a > b:
+        a, b = b, a
+    h = (a * 0x9E3779B97F4A7C15 ^ b) & 0xFFFFFFFFFFFFFFFF
+    h = ((h ^ (h >> 31)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    return h >> 32
+
+def flow_owner(packet, workers: int) -> int:
+    # Fragments carry no ports past the first, so they are steered by addresses alone; the
+    # worker that reassembles them steers the whole datagram again.
+    if packet.protocol in (IPPROTO_TCP, IPPROTO_UDP) and not packet.flags_fragment_offset & IP_FRAGMENTED:
+        src_port, dst_port = PORTS.unpack_from(packet.data)
+        return flow_hash(packet.src, src_port, packet.dst, dst_port) % workers
+    return flow_hash(packet.src, 0, packet.dst, 0) % workers
+
+class NetworkStack:
+    # One complete stack: a device queue, its link layer, a SocketManager with its own flow
+    # table and the EventLoop driving them. With several workers each one owns the flows that
+    # hash to its index and passes packets for other flows to their owner over a channel.
+    def __init__(self, config, device, index=0, inbox=None, outboxes=()):
+        self.config = config
+        self.device = device
+        self.index = index
+        self.inbox = inbox  # our end of the channel other workers send to
+        self.outboxes = outboxes  # sending ends, one per worker
+        self.workers = max(len(outboxes), 1)
+        self.logger = logging.getLogger(__name__)
+        self.socket_manager = SocketManager(config.get('verify_checksums', False))
+        self.packet_parser = PacketParser()
+        self.edge_triggered = config.get('event_loop_edge_triggered', False)
+        self.event_loop = EventLoop(config.get('event_loop_backend', 'epoll'), self.edge_triggered, config.get('timer_resolution', 0.01))
+        self.link = EthernetLayer(device, mac_to_bytes(config.get('mac_address', '02:00:00:00:00:01')),
+                                  config.get('ip_address', '10.0.0.2'), config.get('netmask', '255.255.255.0'), config.get('gateway'))
+        # Timers and output belong to this stack, not the process, so several stacks can share one process.
+        self.link.timers = self.event_loop.timers
+        self.socket_manager.flow_table.time_wait.timers = self.event_loop.timers
+        self.socket_manager.timers = self.event_loop.timers
+        self.socket_manager.output = self.transmit
+        self.socket_manager.link = self.link
+        self.rx_batch = ReceiveBatch(config.get('rx_batch_size', 32), config.get('mtu', 1500) + FRAME_OVERHEAD)
+        self.forwarded = 0
+        self.forward_drops = 0
+        self.ident = random.getrandbits(16)
+
+    def handle_read(self, fd):
+        # An edge-triggered backend does not wake us again for frames already queued, so a full
+        # batch is followed by another drain until one comes back short.
+        batch = self.rx_batch
+        while True:
+            count = batch.drain(self.device)
+            self.logger.debug(f"Drained {count} frames from fd {fd}")
+            for frame in batch:
+                try:
+                    if self.workers > 1 and ETH_HEADER.unpack_from(frame)[2] == ETH_P_ARP:
+                        self._broadcast(frame)
+                    packet = self.link.handle_frame(frame)
+                    if packet is None:
+                        continue  # ARP, or not addressed to us
+                    self.transmit(self.deliver(self.packet_parser.parse_ip_header(packet)))
+                except Exception as e:
+                    self.logger.error(f"Error handling read: {e}")
+            if not self.edge_triggered or count < len(batch.views):
+                return
+
+    def deliver(self, packet):
+        if self.workers > 1:
+            if packet.flags_fragment_offset & IP_FRAGMENTED:
+                owner = flow_owner(packet, self.workers)
+                if owner != self.index:
+                    return self._forward(owner, packet)
+                packet = self.socket_manager.reassembler.add(packet)
+                if packet is None:
+                    return None
+            owner = flow_owner(packet, self.workers)
+            if owner != self.index:
+                return self._forward(owner, packet)
+        return self.socket_manager.handle_packet(packet)
+
+    def transmit(self, segments):
+        # TCP hands back what it wants sent as segment dicts: one, a list of them, or None.
+        if not segments:
+            return
+        if isinstance(segments, dict):
+            segments = (segments,)
+        parser = self.packet_parser
+        for segment in segments:
+            tcp = parser.construct_tcp_packet({'data_offset': 5, 'urgent_pointer': 0, **segment})
+            record = segment.get('record')
+            if record is not None:
+                record.checksum = int.from_bytes(tcp[16:18], 'big')  # patched, not recomputed, on retransmission
+            self.ident = (self.ident + 1) & 0xFFFF
+            dst = ip_to_int(segment['dst_ip'])
+            self.link.send(dst, parser.construct_ip_packet({
+                'version': 4, 'ihl': 5, 'dscp_ecn': 0, 'total_length': 20 + len(tcp), 'identification': self.ident,
+                'flags_fragment_offset': IP_DF, 'ttl': 64, 'protocol': IPPROTO_TCP,
+                'src_ip': segment['src_ip'], 'dst_ip': dst, 'data': tcp}))
+
+    def _forward(self, owner, packet):
+        # A full channel drops the packet, as a full NIC queue would.
+        try:
+            self.outboxes[owner].sendmsg([IP_PACKET, packet.raw[:packet.total_length]])
+            self.forwarded += 1
+        except BlockingIOError:
+            self.forward_drops += 1
+        return None
+
+    def _broadcast(self, frame):
+        for index, outbox in enumerate(self.outboxes):
+            if index != self.index:
+                try:
+                    outbox.sendmsg([ARP_FRAME, frame])
+                except BlockingIOError:
+                    self.forward_drops += 1
+
+    def handle_channel(self, fd):
+        while True:
+            try:
+                message = self.inbox.recv(IP_MAX_PACKET + 1)
+            except BlockingIOError:
+                return
+            try:
+                if message[:1] == ARP_FRAME:
+                    self.link.handle_frame(memoryview(message)[1:], answer=False)
+                else:
+                    self.transmit(self.deliver(self.packet_parser.parse_ip_header(memoryview(message)[1:])))
+            except Exception as e:
+                self.logger.error(f"Error handling forwarded packet: {e}")
+
+    def handle_error(self, fd):
+        self.logger.error(f"Error on file descriptor: {fd}")
+
+    def run(self, setup=None):
+        # setup(stack) opens the application's sockets; with several workers it runs in each,
+        # so every worker listens for the connections that hash to it.
+        self.device.set_blocking(False)
+        self.event_loop.add_handler(self.device.fd, read_handler=self.handle_read, error_handler=self.handle_error)
+        if self.inbox is not None:
+            self.inbox.setblocking(False)
+            self.event_loop.add_handler(self.inbox.fileno(), read_handler=self.handle_channel, error_handler=self.handle_error)
+        if setup is not None:
+            setup(self)
+        try:
+            self.logger.info(f"Worker {self.index}: starting event loop...")
+            self.event_loop.run()
+        except KeyboardInterrupt:
+            self.logger.info(f"Worker {self.index}: shutting down...")
+        finally:
+            self.device.close()
+            self.event_loop.stop()
+
+def run(config, setup=None):
+    # One NetworkStack per worker process, each on its own queue of a multi-queue TAP device.
+    # Stack-wide knobs are set by the caller first, so every worker inherits them.
+    workers = config.get('workers', 1)
+    device_name = config.get('device_name', 'tap0')
+    if workers <= 1:
+        NetworkStack(config, VirtualDeviceInterface(device_name)).run(setup)
+        return
+    queues = VirtualDeviceInterface.open_queues(device_name, workers)
+    channels = [_socket.socketpair(_socket.AF_UNIX, _socket.SOCK_SEQPACKET) for _ in range(workers)]
+    for inbox, outbox in channels:
+        outbox.setblocking(False)
+    pids = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                for other, queue in enumerate(queues):
+                    if other != index:
+                        queue.close()
+                NetworkStack(config, queues[index], index, channels[index][0],
+                             [outbox for _, outbox in channels]).run(setup)
+            except Exception:
+                logging.getLogger(__name__).exception(f"Worker {index} failed")
+                status = 1
+            finally:
+                os._exit(status)
+        pids.append(pid)
+    for queue in queues:
+        queue.close()
+    for inbox, outbox in channels:
+        inbox.close()
+        outbox.close()
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except KeyboardInterrupt:
+            os.waitpid(pid, 0)  # the workers got the same interrupt and are shutting down
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from packet_parser import ip_to_int
+
+SEQ_MASK = 0xFFFFFFFF
+COOKIE_BITS = 24
+COOKIE_MASK = (1 << COOKIE_BITS) - 1
+COOKIE_PERIOD = 64  # seconds per counter tick, as in Linux
+COOKIE_MAX_AGE = 2  # ticks a cookie stays valid
+COOKIE_MSS = (536, 1220, 1300, 1440, 1460, 4312, 8960)
+
+class HalfOpen:
+    # What a listener remembers about a SYN until the handshake completes; addresses are ints.
+    __slots__ = ('local_ip', 'remote_ip', 'remote_port', 'irs', 'iss', 'mss', 'window_scale',
+                 'sack_permitted', 'timestamp', 'window_size', 'created')
+
+    def __init__(self, local_ip, packet, iss, created):
+        self.local_ip = local_ip
+        self.remote_ip = ip_to_int(packet['src_ip'])
+        self.remote_port = packet['src_port']
+        self.irs = packet['seq_num']
+        self.iss = iss
+        self.mss = packet.get('mss')
+        self.window_scale = packet.get('window_scale')
+        self.sack_permitted = bool(packet.get('sack_permitted'))
+        self.timestamp = packet.get('timestamp')
+        self.window_size = packet.get('window_size')
+        self.created = created
+
+    @property
+    def key(self):
+        return (self.remote_ip, self.remote_port, self.local_ip)
+
+    def get(self, key, default=None):
+        # Lets TCPProtocol read negotiated options from an entry as it would from the SYN.
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+class SynQueue:
+    def __init__(self, limit: int = 128, timeout: float = 3.0):
+        self.limit = limit
+        self.timeout = timeout
+        self.entries = OrderedDict()  # oldest first
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def full(self, now: float) -> bool:
+        # Half-open entries past their timeout are reclaimed before the queue counts as full.
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            if now - oldest.created < self.timeout:
+                break
+            self.entries.popitem(last=False)
+        return len(self.entries) >= self.limit
+
+    def add(self, entry: HalfOpen):
+        self.entries[entry.key] = entry
+
+    def pop(self, key):
+        return self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+class SynCookies:
+    # Stateless SYN-ACK ISNs in the style of Linux: the cookie carries a coarse timestamp and
+    # an MSS index under a keyed hash of the 4-tuple, so the final ACK can rebuild the entry.
+    def __init__(self, secret: bytes = None, clock=time.monotonic):
+        self.secret = secret or os.urandom(16)
+        self.clock = clock
+
+    def _hash(self, local_ip, local_port, remote_ip, remote_port, salt):
+        data = f'{local_ip}|{local_port}|{remote_ip}|{remote_port}|{salt}'.encode()
+        return int.from_bytes(hashlib.blake2b(data, key=self.secret, digest_size=4).digest(), 'big')
+
+    def _count(self):
+        return int(self.clock() / COOKIE_PERIOD)
+
+    def encode(self, local_ip, local_port, remote_ip, remote_port, irs, mss) -> int:
+        index = max([i for i, value in enumerate(COOKIE_MSS) if value <= (mss or COOKIE_MSS[0])] or [0])
+        count = self._count()
+        flow = (local_ip, local_port, remote_ip, remote_port)
+        return (self._hash(*flow, 'seq') + irs + (count << COOKIE_BITS)
+                + ((self._hash(*flow, count) + index) & COOKIE_MASK)) & SEQ_MASK
+
+    def decode(self, local_ip, local_port, remote_ip, remote_port, irs, cookie):
+        # Returns the encoded MSS, or None when the cookie is forged or stale.
+        flow = (local_ip, local_port, remote_ip, remote_port)
+        cookie = (cookie - self._hash(*flow, 'seq') - irs) & SEQ_MASK
+        count = self._count()
+        age = (count - (cookie >> COOKIE_BITS)) & (SEQ_MASK >> COOKIE_BITS)
+        if age >= COOKIE_MAX_AGE:
+            return None
+        index = (cookie - self._hash(*flow, count - age)) & COOKIE_MASK
+        return COOKIE_MSS[index] if index < len(COOKIE_MSS) else None
@@ -1,7 +1,38 @@
-from enum import Enum
+from enum import IntEnum
+from collections import deque
 import random
+import time
+from ring_buffer import RingBuffer
+from ooo_queue import OutOfOrderQueue
+from checksum import update_checksum16, update_checksum32
+from packet_parser import ip_to_int
+from congestion_control import create_congestion_control
 
-class TCPState(Enum):
+SEQ_MASK = 0xFFFFFFFF
+RTO_INITIAL = 1.0
+RTO_MIN = 0.2
+RTO_MAX = 60.0
+DUPACK_THRESHOLD = 3
+MAX_SACK_BLOCKS = 3
+TIMESTAMP_OPTION_SIZE = 12  # NOP, NOP, kind, length, TSval, TSecr
+SACK_OPTION_SIZE = 4  # NOP, NOP, kind, length; each block adds 8
+DEFAULT_MSS = 536  # RFC 9293 3.7.1, assumed when the peer sends no MSS option
+MAX_WINDOW_SCALE = 14
+
+def seq_lt(a, b):
+    return ((a - b) & SEQ_MASK) >= 0x80000000
+
+def window_shift(size):
+    # Smallest RFC 7323 shift that lets a 16-bit window field describe size bytes.
+    shift = 0
+    while (size >> shift) > 0xFFFF and shift < MAX_WINDOW_SCALE:
+        shift += 1
+    return shift
+
+def seq_le(a, b):
+    return a == b or seq_lt(a, b)
+
+class TCPState(IntEnum):
     CLOSED       = 0
     LISTEN       = 1
     SYN_SENT     = 2
@@ -22,7 +53,51 @@ class TCPFlags:
     ACK = 0x10
     URG = 0x20
 
+DISPATCH_FLAGS = TCPFlags.SYN | TCPFlags.ACK | TCPFlags.FIN | TCPFlags.RST  # the bits handle_packet dispatches on
+PREDICTION_FLAGS = DISPATCH_FLAGS | TCPFlags.URG  # PSH does not disturb the fast path
+SLOW_PATH = object()
+SENDING_STATES = (TCPState.ESTABLISHED, TCPState.CLOSE_WAIT)
+FIN_STATES = (TCPState.FIN_WAIT_1, TCPState.CLOSING, TCPState.LAST_ACK)  # closed by us, FIN not yet acknowledged
+DRAINING_STATES = SENDING_STATES + FIN_STATES  # the send ring still drains, and the FIN goes out behind it
+
+class Segment:
+    __slots__ = ('seq', 'end', 'sent_at', 'retransmitted', 'sacked', 'lost', 'header', 'checksum')
+
+    def __init__(self, seq, end, sent_at):
+        self.seq = seq
+        self.end = end
+        self.sent_at = sent_at
+        self.retransmitted = False
+        self.sacked = False
+        self.lost = False
+        self.header = None  # (flags, ack, window, timestamp) of the first transmission
+        self.checksum = None  # its wire checksum, filled in by whoever builds the segment
+
+    def __len__(self):
+        return (self.end - self.seq) & SEQ_MASK
+
 class TCPProtocol:
+    # One instance per connection, so per-connection state lives in slots; stack-wide
+    # knobs stay class attributes. Buffers and queues are only allocated while in use.
+    __slots__ = ('state', 'sequence_number', 'acknowledgment_number', 'src_addr', 'src_port', 'dst_addr',
+                 'dst_port', 'mss', 'wscale_ok', 'rcv_wscale', 'snd_wscale', 'ts_enabled', 'ts_recent',
+                 'snd_una', 'snd_wnd', 'congestion', 'pacing_budget', 'pacing_stamp', 'srtt', 'rttvar', 'rto',
+                 'rto_timer', 'retransmit_queue', 'sacked_bytes', 'lost_bytes', 'highest_sacked', 'dupacks',
+                 'in_recovery', 'recover', 'retransmit_head', 'retransmissions', 'timeouts', 'sack_enabled',
+                 'out_of_order', 'delayed_ack', 'nodelay', 'cork', 'push', 'ack_timer', 'ack_pending',
+                 'ack_pending_bytes', 'ack_due', 'acks_saved', 'send_buffer', 'recv_buffer', 'fin_seq', 'timers', 'output')
+    send_buffer_size = 256 * 1024
+    recv_buffer_size = 256 * 1024
+    out_of_order_limit = 256 * 1024  # bytes held beyond a hole per connection
+    default_congestion_control = 'newreno'
+    default_delayed_ack = True
+    default_mss = 1460
+    default_window_scaling = True
+    default_timestamps = True
+    default_sack = True
+    delayed_ack_timeout = 0.04
+    clock = staticmethod(time.monotonic)
+
     def __init__(self, src_ip, src_port, dst_ip=None, dst_port=None):
         self.state = TCPState.CLOSED
         self.sequence_number  = random.randint(0, 2**32 - 1)
@@ -31,93 +106,465 @@ class TCPProtocol:
         self.src_port   = src_port
         self.dst_ip     = dst_ip
         self.dst_port   = dst_port
-        self.window_size = 65535
-        self.mss = 1460
-        self.send_buffer = []
-        self.recv_buffer = []
+        self.mss = self.default_mss
+        self.wscale_ok = self.default_window_scaling
+        self.rcv_wscale = window_shift(self.recv_buffer_size) if self.wscale_ok else 0
+        self.snd_wscale = 0
+        self.ts_enabled = self.default_timestamps
+        self.ts_recent = 0
+        self.snd_una = self.sequence_number  # oldest unacknowledged; sequence_number is snd_nxt
+        self.snd_wnd = 65535
+        self.congestion = create_congestion_control(self.default_congestion_control, self._mss_cache(), self.clock)
+        self.pacing_budget = 0.0
+        self.pacing_stamp = None
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = RTO_INITIAL
+        self.rto_timer = None
+        self.retransmit_queue = None  # deque of Segment records while data is in flight; the bytes stay in send_buffer
+        self.sacked_bytes = 0
+        self.lost_bytes = 0
+        self.highest_sacked = None
+        self.dupacks = 0
+        self.in_recovery = False
+        self.recover = self.sequence_number
+        self.retransmit_head = False  # the first retransmission of an episode ignores pipe
+        self.retransmissions = 0
+        self.timeouts = 0
+        self.sack_enabled = self.default_sack
+        self.out_of_order = None  # OutOfOrderQueue, created on the first hole
+        self.delayed_ack = self.default_delayed_ack
+        self.nodelay = False
+        self.cork = False
+        self.push = False  # uncorking sends the held tail once, bypassing Nagle
+        self.ack_timer = None
+        self.ack_pending = 0  # in-order segments received but not yet acknowledged
+        self.ack_pending_bytes = 0
+        self.ack_due = False
+        self.acks_saved = 0
+        self.send_buffer = RingBuffer(self.send_buffer_size)
+        self.recv_buffer = RingBuffer(self.recv_buffer_size)
+        self.fin_seq = None  # sequence number of our FIN once it has been sent
+        # Set by the stack the connection belongs to; several stacks may share a process.
+        self.timers = None  # TimerWheel driving RTO; without one, on_retransmit_timeout must be called by the owner
+        self.output = None  # callable(packet) for segments generated outside handle_packet
         
+    # Addresses are kept as 32-bit ints; dotted strings are accepted on assignment.
+    @property
+    def src_ip(self):
+        return self.src_addr
+
+    @src_ip.setter
+    def src_ip(self, ip):
+        self.src_addr = ip_to_int(ip) if ip is not None else None
+
+    @property
+    def dst_ip(self):
+        return self.dst_addr
+
+    @dst_ip.setter
+    def dst_ip(self, ip):
+        self.dst_addr = ip_to_int(ip) if ip is not None else None
+
     def handle_packet(self, packet):
-        if self.state == TCPState.CLOSED:
-            if packet['flags'] & TCPFlags.SYN:
-                return self._handle_syn(packet)
-        elif self.state == TCPState.LISTEN:
-            if packet['flags'] & TCPFlags.SYN:
-                return self._handle_syn_listen(packet)
-        elif self.state == TCPState.SYN_SENT:
-            if packet['flags'] & TCPFlags.SYN and packet['flags'] & TCPFlags.ACK:
-                return self._handle_syn_ack(packet)
-        elif self.state == TCPState.SYN_RECEIVED:
-            if packet['flags'] & TCPFlags.ACK:
-                return self._handle_ack(packet)
-        elif self.state == TCPState.ESTABLISHED:
-            if packet['flags'] & TCPFlags.FIN:
-                return self._handle_fin(packet)
-            elif packet['flags'] & TCPFlags.ACK:
-                return self._handle_ack(packet)
-        elif self.state == TCPState.FIN_WAIT_1:
-            if packet['flags'] & TCPFlags.FIN and packet['flags'] & TCPFlags.ACK:
-                return self._handle_fin_ack(packet)
-            elif packet['flags'] & TCPFlags.ACK:
-                return self._handle_ack(packet)
-        elif self.state == TCPState.FIN_WAIT_2:
-            if packet['flags'] & TCPFlags.FIN:
-                return self._handle_fin(packet)
-        elif self.state == TCPState.CLOSING:
-            if packet['flags'] & TCPFlags.ACK:
-                return self._handle_ack(packet)
-        elif self.state == TCPState.LAST_ACK:
-            if packet['flags'] & TCPFlags.ACK:
-                return self._handle_ack(packet)
-        
-        return None
+        flags = packet['flags']
+        # Header prediction: an in-order segment on an established connection with nothing
+        # unusual going on is either a pure ACK for new data or in-order data for us.
+        if (self.state == TCPState.ESTABLISHED and flags & PREDICTION_FLAGS == TCPFlags.ACK
+                and packet['seq_num'] == self.acknowledgment_number):
+            response = self._fast_path(packet)
+            if response is not SLOW_PATH:
+                return response
+        if self.ts_enabled and packet.get('timestamp') and seq_le(packet['seq_num'], self.acknowledgment_number):
+            self.ts_recent = packet['timestamp'][0]
+        handler = self.dispatch[self.state][flags & DISPATCH_FLAGS]
+        return None if handler is None else handler(self, packet)
+
+    def _fast_path(self, packet):
+        # Every check comes before any state changes, so SLOW_PATH leaves the segment untouched.
+        ack, data, window = packet['ack_num'], packet.get('data'), packet.get('window_size')
+        if (self.lost_bytes or self.sacked_bytes or self.in_recovery or self.out_of_order
+                or (window is not None and window << self.snd_wscale != self.snd_wnd) or packet.get('sack_blocks')):
+            return SLOW_PATH
+        if data:
+            if ack != self.snd_una or len(data) > self.recv_buffer.free:
+                return SLOW_PATH
+        elif not 0 < (ack - self.snd_una) & SEQ_MASK <= (self.sequence_number - self.snd_una) & SEQ_MASK:
+            return SLOW_PATH
+        timestamp = packet.get('timestamp') if self.ts_enabled else None
+        if timestamp:
+            self.ts_recent = timestamp[0]
+        if not data:
+            acked = self._ack_new_data(ack, timestamp)
+            self.congestion.on_ack(acked, (self.sequence_number - ack) & SEQ_MASK)
+            self._arm_retransmit_timer(restart=True)
+            if self._unsent():
+                self._flush()
+            return None
+        self.recv_buffer.write(data)
+        self.acknowledgment_number = (self.acknowledgment_number + len(data)) & SEQ_MASK
+        return None if self._delay_ack(len(data)) else self._create_ack_packet()
+
+    def _handle_established_ack(self, packet):
+        # Also serves FIN_WAIT_1 and FIN_WAIT_2: after our FIN the peer may still send data.
+        response = self._handle_ack(packet)
+        if packet.get('data'):
+            return self._handle_data(packet)
+        return response
 
     def _handle_syn(self, packet):
         self.state = TCPState.SYN_RECEIVED
         self.acknowledgment_number = packet['seq_num'] + 1
+        self._process_syn_options(packet)
         return self._create_syn_ack_packet()
  
-    def _handle_syn_listen(self, packet):
-        if len(self.pending_connections) < self.backlog:
-            new_conn = TCPProtocol(self.src_ip, self.src_port, packet['src_ip'], packet['src_port'])
-            new_conn.state = TCPState.SYN_RECEIVED
-            new_conn.acknowledgment_number = packet['seq_num'] + 1
-            new_conn.sequence_number = packet['ack_num']
-            self.pending_connections.append(new_conn)
-            return self._create_syn_ack_packet()
-        return None
-
     def _handle_syn_ack(self, packet):
+        ack = packet['ack_num']
+        if ack != self.sequence_number:
+            return None  # does not acknowledge our SYN
         self.state = TCPState.ESTABLISHED
-        self.acknowledgment_number = packet['seq_num'] + 1
-        self.sequence_number = packet['ack_num']
+        self.acknowledgment_number = (packet['seq_num'] + 1) & SEQ_MASK
+        self._process_syn_options(packet)
+        self._ack_new_data(ack, packet.get('timestamp') if self.ts_enabled else None)
+        self.in_recovery = False  # a retransmitted SYN left the connection in timeout recovery
+        self._arm_retransmit_timer(restart=True)
         return self._create_ack_packet()
 
+    @classmethod
+    def from_half_open(cls, local_port, entry):
+        # Builds the connection for a listener's completed handshake; the final ACK moves it to ESTABLISHED.
+        conn = cls(entry.local_ip, local_port, entry.remote_ip, entry.remote_port)
+        conn.state = TCPState.SYN_RECEIVED
+        conn.acknowledgment_number = (entry.irs + 1) & SEQ_MASK
+        conn.sequence_number = conn.snd_una = entry.iss
+        conn._process_syn_options(entry)
+        return conn
+
+    @classmethod
+    def create_syn_ack(cls, local_port, entry):
+        # SYN-ACK for a SYN queue entry, sent without allocating a connection.
+        packet = {
+            'src_ip': entry.local_ip,
+            'dst_ip': entry.remote_ip,
+            'src_port': local_port,
+            'dst_port': entry.remote_port,
+            'seq_num': entry.iss,
+            'ack_num': (entry.irs + 1) & SEQ_MASK,
+            'flags': TCPFlags.SYN | TCPFlags.ACK,
+            'window_size': min(cls.recv_buffer_size, 0xFFFF),
+            'data': b'',
+            'mss': cls.default_mss
+        }
+        if cls.default_window_scaling and entry.window_scale is not None:
+            packet['window_scale'] = window_shift(cls.recv_buffer_size)
+        if cls.default_sack and entry.sack_permitted:
+            packet['sack_permitted'] = True
+        if cls.default_timestamps and entry.timestamp is not None:
+            packet['timestamp'] = (int(cls.clock() * 1000) & SEQ_MASK, entry.timestamp[0])
+        return packet
+
+    @staticmethod
+    def create_reset(segment):
+        # RST for a segment no connection owns (RFC 9293 3.10.7.1); the caller never answers a RST.
+        flags = segment['flags']
+        packet = {
+            'src_ip': segment['dst_ip'],
+            'dst_ip': segment['src_ip'],
+            'src_port': segment['dst_port'],
+            'dst_port': segment['src_port'],
+            'window_size': 0,
+            'data': b''
+        }
+        if flags & TCPFlags.ACK:
+            packet.update(seq_num=segment['ack_num'], ack_num=0, flags=TCPFlags.RST)
+        else:
+            length = len(segment['data']) + bool(flags & TCPFlags.SYN) + bool(flags & TCPFlags.FIN)
+            packet.update(seq_num=0, ack_num=(segment['seq_num'] + length) & SEQ_MASK, flags=TCPFlags.RST | TCPFlags.ACK)
+        return packet
+
+    def _process_syn_options(self, packet):
+        # Options are negotiated on the SYN exchange only; whatever the peer did not offer stays off.
+        self.mss = min(self.default_mss, packet.get('mss') or DEFAULT_MSS)
+        window_scale = packet.get('window_scale')
+        if self.wscale_ok and window_scale is not None:
+            self.snd_wscale = window_scale
+        else:
+            self.wscale_ok = False
+            self.snd_wscale = self.rcv_wscale = 0
+        self.sack_enabled = self.sack_enabled and bool(packet.get('sack_permitted'))
+        timestamp = packet.get('timestamp')
+        self.ts_enabled = self.ts_enabled and timestamp is not None
+        if self.ts_enabled:
+            self.ts_recent = timestamp[0]
+        self.snd_wnd = packet.get('window_size', self.snd_wnd)  # never scaled on a SYN
+        if self.congestion.mss != self._mss_cache():
+            self.set_congestion_control(self.congestion.name)
+
     def _handle_ack(self, packet):
         if self.state == TCPState.SYN_RECEIVED:
             self.state = TCPState.ESTABLISHED
-        elif self.state == TCPState.FIN_WAIT_1:
-            self.state = TCPState.FIN_WAIT_2
-        elif self.state == TCPState.CLOSING:
-            self.state = TCPState.TIME_WAIT
-        elif self.state == TCPState.LAST_ACK:
-            self.state = TCPState.CLOSED
-        
-        self.sequence_number = packet['ack_num']
+            self.snd_una = self.sequence_number = packet['ack_num']
+            self.snd_wnd = self._peer_window(packet)
+            if packet.get('data'):
+                return self._handle_data(packet)  # the handshake's final ACK may carry the first bytes
+            return None
+
+        self._process_ack(packet)
+        if self.fin_seq is not None and self.snd_una == self.sequence_number:  # everything including our FIN is acknowledged
+            if self.state == TCPState.FIN_WAIT_1:
+                self.state = TCPState.FIN_WAIT_2
+            elif self.state == TCPState.CLOSING:
+                self.state = TCPState.TIME_WAIT
+            elif self.state == TCPState.LAST_ACK:
+                self.state = TCPState.CLOSED
         return None
 
+    def _process_ack(self, packet):
+        ack = packet['ack_num']
+        sack_blocks = packet.get('sack_blocks')
+        if sack_blocks and self.retransmit_queue:
+            self._process_sack(sack_blocks)
+        window = self._peer_window(packet)
+        if seq_lt(self.snd_una, ack) and seq_le(ack, self.sequence_number):
+            acked = self._ack_new_data(ack, packet.get('timestamp') if self.ts_enabled else None)
+            if self.in_recovery:
+                if seq_le(self.recover, ack):
+                    self.in_recovery = False
+                elif self.retransmit_queue and not self.retransmit_queue[0].sacked:
+                    # RFC 6582 partial ACK: the next hole is resent at once.
+                    self._mark_lost(self.retransmit_queue[0])
+                    self.retransmit_head = True
+            else:
+                self.congestion.on_ack(acked, (self.sequence_number - ack) & SEQ_MASK)
+            self._arm_retransmit_timer(restart=True)
+        elif ack == self.snd_una and self.retransmit_queue and not packet.get('data') and window == self.snd_wnd:
+            self.dupacks += 1
+            if not self.in_recovery and (self.dupacks >= DUPACK_THRESHOLD or self.sacked_bytes >= DUPACK_THRESHOLD * self.mss):
+                self._enter_recovery()
+            elif self.in_recovery and sack_blocks:
+                self._mark_sack_holes()
+        self.snd_wnd = window
+        if self.lost_bytes or self._unsent():
+            self._flush()  # the ACK may have opened cwnd or the peer's window
+
+    def _ack_new_data(self, ack, timestamp):
+        acked = (ack - self.snd_una) & SEQ_MASK
+        self._acknowledge_segments(ack, timestamp)
+        # The send ring holds data from snd_una on; a FIN's sequence slot has no byte to consume.
+        self.send_buffer.consume(acked)
+        self.snd_una = ack
+        self.dupacks = 0
+        return acked
+
+    def _peer_window(self, packet):
+        window = packet.get('window_size')
+        return self.snd_wnd if window is None else window << self.snd_wscale
+
+    def _acknowledge_segments(self, ack, timestamp=None):
+        queue = self.retransmit_queue
+        sample = None
+        while queue and seq_le(queue[0].end, ack):
+            segment = queue.popleft()
+            if segment.sacked:
+                self.sacked_bytes -= len(segment)
+            if segment.lost:
+                self.lost_bytes -= len(segment)
+            if not segment.retransmitted:
+                sample = segment.sent_at  # Karn: never sample retransmitted segments
+        if queue and seq_lt(queue[0].seq, ack):
+            head = queue[0]
+            if head.lost:
+                self.lost_bytes -= (ack - head.seq) & SEQ_MASK
+            head.seq = ack
+            head.checksum = None  # the payload changed, so the checksum cannot be patched
+        if queue is not None and not queue:
+            self.retransmit_queue = None  # nothing left in flight
+        if timestamp and timestamp[1]:
+            # RFC 7323 RTTM: the echoed TSval times retransmitted segments too.
+            self._update_rtt(((self._ts_now() - timestamp[1]) & SEQ_MASK) / 1000)
+        elif sample is not None:
+            self._update_rtt(self.clock() - sample)
+
+    def _process_sack(self, blocks):
+        for left, right in blocks:
+            if not seq_lt(self.snd_una, right):
+                continue  # D-SACK or stale block
+            for segment in self.retransmit_queue:
+                if seq_le(right, segment.seq):
+                    break
+                if not segment.sacked and seq_le(left, segment.seq) and seq_le(segment.end, right):
+                    segment.sacked = True
+                    self.sacked_bytes += len(segment)
+                    if segment.lost:
+                        segment.lost = False
+                        self.lost_bytes -= len(segment)
+            if self.highest_sacked is None or seq_lt(self.highest_sacked, right):
+                self.highest_sacked = right
+
+    def _mark_lost(self, segment):
+        if not segment.lost and not segment.sacked:
+            segment.lost = True
+            self.lost_bytes += len(segment)
+
+    def _mark_sack_holes(self):
+        if self.highest_sacked is None:
+            return
+        for segment in self.retransmit_queue:
+            if not seq_lt(segment.seq, self.highest_sacked):
+                break
+            if not segment.retransmitted:
+                self._mark_lost(segment)
+
+    def _enter_recovery(self):
+        self.in_recovery = True
+        self.recover = self.sequence_number
+        self.congestion.on_loss((self.sequence_number - self.snd_una) & SEQ_MASK)
+        self._mark_lost(self.retransmit_queue[0])
+        self._mark_sack_holes()
+        self.retransmit_head = True
+
+    def _update_rtt(self, rtt):
+        # RFC 6298 section 2
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + max(4 * self.rttvar, 0.001), RTO_MIN), RTO_MAX)
+        self.congestion.on_rtt_sample(rtt)
+
+    def _arm_retransmit_timer(self, restart=False):
+        if self.timers is None:
+            return
+        if self.rto_timer is not None and self.rto_timer.active:
+            if not restart:
+                return
+            self.rto_timer.cancel()
+        self.rto_timer = self.timers.schedule(self.rto, self.on_retransmit_timeout) if self.retransmit_queue else None
+
+    def on_retransmit_timeout(self):
+        if not self.retransmit_queue:
+            return
+        self.timeouts += 1
+        self.rto = min(self.rto * 2, RTO_MAX)
+        self.congestion.on_loss((self.sequence_number - self.snd_una) & SEQ_MASK, timeout=True)
+        # The receiver may have reneged, so the SACK scoreboard is discarded and everything is resent.
+        self.sacked_bytes = self.lost_bytes = 0
+        self.highest_sacked = None
+        for segment in self.retransmit_queue:
+            segment.sacked = False
+            segment.lost = True
+            self.lost_bytes += len(segment)
+        self.dupacks = 0
+        self.in_recovery = True
+        self.recover = self.sequence_number
+        self._arm_retransmit_timer(restart=True)
+        self._flush()
+
+    def _unsent(self):
+        return len(self.send_buffer) > (self.sequence_number - self.snd_una) & SEQ_MASK
+
+    def _flush(self):
+        if self.output is not None:
+            for packet in self.poll_output():
+                self.output(packet)
+
+    def _handle_data(self, packet):
+        seq, data = packet['seq_num'], packet['data']
+        behind = (self.acknowledgment_number - seq) & SEQ_MASK
+        if behind < len(data):
+            accepted = self.recv_buffer.write(data[behind:] if behind else data)
+            self.acknowledgment_number = (self.acknowledgment_number + accepted) & SEQ_MASK
+            if self.out_of_order:
+                self._drain_out_of_order()
+                return self._create_ack_packet()  # a filled hole is reported at once
+            if self._delay_ack(accepted):
+                return None
+        elif seq_lt(self.acknowledgment_number, seq):
+            # Anything past the advertised window is cut off; the rest waits for the hole.
+            room = self.recv_buffer.free - ((seq - self.acknowledgment_number) & SEQ_MASK)
+            if room > 0:
+                if self.out_of_order is None:
+                    self.out_of_order = OutOfOrderQueue(self.out_of_order_limit)
+                self.out_of_order.insert(self.acknowledgment_number, seq, data[:room])
+        return self._create_ack_packet()
+
+    def _delay_ack(self, length):
+        # RFC 1122 4.2.3.2: ACK at least every second full-sized segment and within the timeout.
+        if not self.delayed_ack or self.timers is None or not length:
+            return False
+        if self.ack_pending_bytes + length >= 2 * self.mss:
+            return False
+        self.ack_pending += 1
+        self.ack_pending_bytes += length
+        if self.ack_timer is None:
+            self.ack_timer = self.timers.schedule(self.delayed_ack_timeout, self.on_delayed_ack_timeout)
+        return True
+
+    def on_delayed_ack_timeout(self):
+        self.ack_timer = None
+        if self.ack_pending:
+            self.ack_pending -= 1  # the segment this ACK is sent for is not a saving
+            self.ack_due = True
+            self._flush()
+
+    def _drain_out_of_order(self):
+        while True:
+            chunk = self.out_of_order.pop(self.acknowledgment_number)
+            if chunk is None:
+                break
+            accepted = self.recv_buffer.write(chunk)
+            self.acknowledgment_number = (self.acknowledgment_number + accepted) & SEQ_MASK
+
     def _handle_fin(self, packet):
-        self.acknowledgment_number = packet['seq_num'] + 1
+        # The ACK field and any data come first; the FIN is consumed only in order, right
+        # behind the data. One that is not waits for the peer to retransmit it.
+        if packet['flags'] & TCPFlags.ACK:
+            self._handle_ack(packet)
+        data = packet.get('data') or b''
+        if data:
+            self._handle_data(packet)
+        fin = (packet['seq_num'] + len(data)) & SEQ_MASK
+        if fin != self.acknowledgment_number:
+            return self._create_ack_packet()
+        self.acknowledgment_number = (fin + 1) & SEQ_MASK
         if self.state == TCPState.ESTABLISHED:
             self.state = TCPState.CLOSE_WAIT
-            return self._create_ack_packet()
+        elif self.state == TCPState.FIN_WAIT_1:
+            self.state = TCPState.CLOSING  # simultaneous close; the ACK of our FIN ends it
         elif self.state == TCPState.FIN_WAIT_2:
             self.state = TCPState.TIME_WAIT
+        return self._create_ack_packet()
+
+    def _handle_rst(self, packet):
+        # RFC 9293 3.10.7 with the RFC 5961 3.2 check: in SYN_SENT a RST must acknowledge our
+        # SYN; otherwise only one at exactly rcv_nxt resets the connection, one elsewhere in the
+        # receive window draws a challenge ACK, and the rest are dropped.
+        if self.state == TCPState.SYN_SENT:
+            if packet['flags'] & TCPFlags.ACK and packet['ack_num'] == self.sequence_number:
+                self._reset()  # refused
+            return None
+        offset = (packet['seq_num'] - self.acknowledgment_number) & SEQ_MASK
+        if offset == 0:
+            self._reset()
+            return None
+        if offset < max(self.recv_buffer.free, 1):
             return self._create_ack_packet()
+        return None
 
-    def _handle_fin_ack(self, packet):
-        self.acknowledgment_number = packet['seq_num'] + 1
-        self.state = TCPState.TIME_WAIT
-        return self._create_ack_packet()
+    def _reset(self):
+        # Drops the connection at once: nothing more is sent, retransmitted or acknowledged.
+        self.state = TCPState.CLOSED
+        for timer in (self.rto_timer, self.ack_timer):
+            if timer is not None:
+                timer.cancel()
+        self.rto_timer = self.ack_timer = None
+        self.retransmit_queue = None
+        self.sacked_bytes = self.lost_bytes = 0
+        self.ack_pending = self.ack_pending_bytes = 0
+        self.ack_due = False
+        self.send_buffer.consume(len(self.send_buffer))
 
     def _create_syn_ack_packet(self):
         return self._create_packet(TCPFlags.SYN | TCPFlags.ACK)
@@ -126,10 +573,33 @@ class TCPProtocol:
         return self._create_packet(TCPFlags.ACK)
 
     def _create_fin_packet(self):
-        return self._create_packet(TCPFlags.FIN | TCPFlags.ACK)
+        # The FIN takes one sequence number and is retransmitted like data until it is acknowledged.
+        packet = self._create_packet(TCPFlags.FIN | TCPFlags.ACK)
+        self.fin_seq = self.sequence_number
+        self._queue_segment((self.sequence_number + 1) & SEQ_MASK)
+        return packet
+
+    def _queue_segment(self, end):
+        # Records sequence_number..end as in flight and advances sequence_number past it.
+        if self.retransmit_queue is None:
+            self.retransmit_queue = deque()
+        self.retransmit_queue.append(Segment(self.sequence_number, end, self.clock()))
+        self.sequence_number = end
+        self._arm_retransmit_timer()
+
+    def _fin_wanted(self):
+        return self.fin_seq is None and self.state in FIN_STATES
 
     def _create_packet(self, flags):
-        return {
+        # Every segment carries the current ACK, so anything outgoing settles a pending delayed ACK.
+        if self.ack_pending or self.ack_due:
+            self.acks_saved += self.ack_pending
+            self.ack_pending = self.ack_pending_bytes = 0
+            self.ack_due = False
+            if self.ack_timer is not None:
+                self.ack_timer.cancel()
+                self.ack_timer = None
+        packet = {
             'src_ip': self.src_ip,
             'dst_ip': self.dst_ip,
             'src_port': self.src_port,
@@ -137,44 +607,263 @@ class TCPProtocol:
             'seq_num': self.sequence_number,
             'ack_num': self.acknowledgment_number,
             'flags': flags,
-            'window_size': self.window_size,
+            'window_size': self._receive_window(flags & TCPFlags.SYN),
             'data': b''
         }
+        if self.out_of_order and self.sack_enabled:
+            packet['sack_blocks'] = self.out_of_order.sack_blocks(MAX_SACK_BLOCKS)
+        if self.ts_enabled:
+            packet['timestamp'] = (self._ts_now(), self.ts_recent)
+        if flags & TCPFlags.SYN:
+            packet['mss'] = self.default_mss
+            if self.wscale_ok:
+                packet['window_scale'] = self.rcv_wscale
+            if self.sack_enabled:
+                packet['sack_permitted'] = True
+        return packet
+
+    def _receive_window(self, syn=False):
+        if syn:
+            return min(self.recv_buffer.free, 0xFFFF)
+        return min(self.recv_buffer.free >> self.rcv_wscale, 0xFFFF)
+
+    def _ts_now(self):
+        return int(self.clock() * 1000) & SEQ_MASK
     
-    def _create_data_packet(self):
-        data = bytes(self.send_buffer[:self.mss])
-        self.send_buffer = self.send_buffer[self.mss:]
-        packet = self._create_packet(TCPFlags.PSH | TCPFlags.ACK)
-        packet['data'] = data
+    def _create_data_packet(self, offset, length):
+        # Data stays in the send ring until it is acknowledged; offset is relative to snd_una.
+        flags = TCPFlags.ACK
+        if offset + length == len(self.send_buffer):
+            flags |= TCPFlags.PSH
+            if self._fin_wanted():
+                flags |= TCPFlags.FIN  # the FIN rides on the last segment
+        packet = self._create_packet(flags)
+        packet['data'] = bytes(self.send_buffer.peek(length, offset))
+        end = (self.sequence_number + length) & SEQ_MASK
+        if flags & TCPFlags.FIN:
+            self.fin_seq = end
+            end = (end + 1) & SEQ_MASK
+        self._queue_segment(end)
+        if 'sack_blocks' not in packet:
+            # The record rides along so the stack can store the checksum it computes.
+            record = self.retransmit_queue[-1]
+            record.header = (flags, packet['ack_num'], packet['window_size'], packet.get('timestamp'))
+            packet['record'] = record
         return packet
 
+    def _mss_cache(self):
+        # Payload of a full segment, as Linux's mss_cache: the negotiated MSS less the
+        # options every segment carries. Congestion control counts in these.
+        return self.mss - TIMESTAMP_OPTION_SIZE if self.ts_enabled else self.mss
+
+    def _send_mss(self):
+        # As tcp_current_mss: SACK blocks riding on outgoing segments take their room too.
+        if self.out_of_order and self.sack_enabled:
+            return self._mss_cache() - SACK_OPTION_SIZE - 8 * min(len(self.out_of_order.ranges), MAX_SACK_BLOCKS)
+        return self._mss_cache()
+
+    def _rewrite_checksum(self, segment, packet):
+        # RFC 1624: the payload is the same, so patch the first transmission's checksum
+        # for the header fields that moved instead of summing the data again.
+        flags, ack, window, timestamp = segment.header
+        value = update_checksum16(segment.checksum, flags, packet['flags'])
+        value = update_checksum32(value, ack, packet['ack_num'])
+        value = update_checksum16(value, window, packet['window_size'])
+        if timestamp is not None:
+            value = update_checksum32(value, timestamp[0], packet['timestamp'][0])
+            value = update_checksum32(value, timestamp[1], packet['timestamp'][1])
+        return value
+
+    def _create_retransmit_packet(self, segment):
+        length = len(segment)
+        if self.state == TCPState.SYN_SENT:
+            packet = self._create_packet(TCPFlags.SYN)  # the only segment in flight is the SYN
+        else:
+            fin = self.fin_seq is not None and segment.end == (self.fin_seq + 1) & SEQ_MASK
+            packet = self._create_packet(TCPFlags.FIN | TCPFlags.ACK if fin else TCPFlags.ACK)
+            packet['data'] = bytes(self.send_buffer.peek(length - fin, (segment.seq - self.snd_una) & SEQ_MASK))
+        packet['seq_num'] = segment.seq
+        blocks = packet.get('sack_blocks')
+        if blocks:
+            # The segment was cut before these blocks existed; send only as many as still fit.
+            room = self.mss - len(packet['data']) - (TIMESTAMP_OPTION_SIZE if self.ts_enabled else 0) - SACK_OPTION_SIZE
+            if room >= 8:
+                packet['sack_blocks'] = blocks[:room // 8]
+            else:
+                del packet['sack_blocks']
+        if segment.checksum is not None and 'sack_blocks' not in packet:
+            packet['checksum'] = self._rewrite_checksum(segment, packet)
+        segment.lost = False
+        segment.retransmitted = True
+        segment.sent_at = self.clock()
+        self.lost_bytes -= length
+        self.retransmissions += 1
+        return packet
+
+    def poll_output(self):
+        # Segments everything the peer's window allows; call after send() or on a writable event.
+        packets = []
+        sending = self.state in DRAINING_STATES
+        if not sending and not self.lost_bytes and not self.ack_due:
+            return packets
+        buffered = len(self.send_buffer) if sending else 0
+        mss = self._send_mss()
+        cwnd = self.congestion.cwnd
+        budget = self._pacing_budget()
+        in_flight = (self.sequence_number - self.snd_una) & SEQ_MASK
+        # RFC 6675 pipe: bytes believed to be in the network.
+        pipe = max(in_flight - self.sacked_bytes - self.lost_bytes, 0)
+        force, self.retransmit_head = self.retransmit_head, False
+        if self.lost_bytes:
+            for segment in self.retransmit_queue:
+                if not self.lost_bytes or (pipe >= cwnd and not force):
+                    break
+                if segment.lost:
+                    packets.append(self._create_retransmit_packet(segment))
+                    pipe += len(segment)
+                    force = False
+        while True:
+            in_flight = (self.sequence_number - self.snd_una) & SEQ_MASK
+            length = min(mss, buffered - in_flight, self.snd_wnd - in_flight, cwnd - pipe)
+            if length <= 0:
+                break
+            if length < mss and length == buffered - in_flight and self._hold_partial(in_flight):
+                break
+            if budget is not None:
+                if budget < length and in_flight:
+                    break  # paced out; the next ACK or writable event resumes sending
+                budget -= length
+            packets.append(self._create_data_packet(in_flight, length))
+            pipe += length
+        if self._fin_wanted() and not self._unsent():
+            packets.append(self._create_fin_packet())
+        self.push = False
+        if budget is not None:
+            self.pacing_budget = max(budget, 0.0)
+        if self.ack_due:
+            packets.append(self._create_ack_packet())
+        return packets
+
+    def _hold_partial(self, in_flight):
+        # A sub-MSS tail waits for more writes: always while corked, and under Nagle
+        # (RFC 896) while earlier data is unacknowledged.
+        if self.push or self.state not in SENDING_STATES:
+            return False  # pushed, or closing: nothing more will be written
+        return self.cork or (not self.nodelay and in_flight > 0)
+
+    def _pacing_budget(self):
+        rate = self.congestion.pacing_rate
+        if not rate:
+            return None
+        now = self.clock()
+        if self.pacing_stamp is not None:
+            # Allow at most a couple of segments of accumulated credit.
+            self.pacing_budget = min(self.pacing_budget + rate * (now - self.pacing_stamp), 2 * self.mss)
+        self.pacing_stamp = now
+        return self.pacing_budget
+
+    def set_congestion_control(self, name):
+        self.congestion = create_congestion_control(name, self._mss_cache(), self.clock)
+
+    def set_nodelay(self, enabled):
+        self.nodelay = enabled
+        if enabled:
+            self._flush()
+
+    def set_cork(self, enabled):
+        self.cork = enabled
+        if not enabled:
+            self.push = True
+            self._flush()
+
+    def set_delayed_ack(self, enabled):
+        self.delayed_ack = enabled
+        if not enabled and self.ack_pending:
+            self.ack_pending -= 1
+            self.ack_due = True
+            self._flush()
+
     def set_state(self, state):
         self.state = state
         
     def connect(self):
+        # The SYN takes one sequence number and is retransmitted with backoff until the SYN-ACK.
         if self.state == TCPState.CLOSED:
             self.state = TCPState.SYN_SENT
-            return self._create_packet(TCPFlags.SYN)
+            packet = self._create_packet(TCPFlags.SYN)
+            self._queue_segment((self.sequence_number + 1) & SEQ_MASK)
+            return packet
         return None
 
     def close(self):
+        # The FIN is queued behind unsent data: returns the FIN, or the segments poll_output() allows.
         if self.state == TCPState.ESTABLISHED:
             self.state = TCPState.FIN_WAIT_1
-            return self._create_fin_packet()
         elif self.state == TCPState.CLOSE_WAIT:
             self.state = TCPState.LAST_ACK
+        else:
+            return None
+        if not self._unsent():
             return self._create_fin_packet()
-        return None
+        return self.poll_output()
+
+    def abort(self):
+        # RFC 9293 3.10.5: a synchronised peer is sent a RST, then the connection is dropped.
+        packet = None
+        if self.state in (TCPState.SYN_RECEIVED, TCPState.ESTABLISHED, TCPState.FIN_WAIT_1,
+                          TCPState.FIN_WAIT_2, TCPState.CLOSE_WAIT):
+            packet = self._create_packet(TCPFlags.RST)
+        self._reset()
+        return packet
 
     def send(self, data):
-        if self.state == TCPState.ESTABLISHED:
-            self.send_buffer.extend(data)
-            return self._create_data_packet()
-        return None
+        # Copies what fits into the send ring and returns the byte count, raising BlockingIOError
+        # when nothing does. Segments go out through output when it is set; otherwise the caller
+        # collects them with poll_output().
+        if self.state not in SENDING_STATES:
+            raise ValueError(f"Cannot send in state {self.state.name}")
+        accepted = self.send_buffer.write(data)
+        if not accepted and data:
+            raise BlockingIOError("Send buffer is full")
+        self._flush()
+        return accepted
+
+    @property
+    def writable(self):
+        return not self.send_buffer.above_high_watermark
 
-    def get_received_data(self):
-        data = bytes(self.recv_buffer)
-        self.recv_buffer.clear()
-        return data
+    def get_received_data(self, max_bytes=None):
+        return self.recv_buffer.read(max_bytes)
 
+def _dispatch_table(rules):
+    # Expands (state, required flags, handler) rules into a table indexed by
+    # [state][flags & DISPATCH_FLAGS]; the first matching rule for a state wins.
+    table = []
+    for state in TCPState:
+        row = [None] * (DISPATCH_FLAGS + 1)
+        for flags in range(DISPATCH_FLAGS + 1):
+            for rule_state, required, handler in rules:
+                if rule_state == state and flags & required == required and not flags & ~DISPATCH_FLAGS:
+                    row[flags] = handler
+                    break
+        table.append(tuple(row))
+    return tuple(table)
 
+TCPProtocol.dispatch = _dispatch_table((
+    # RST comes first in every state that honours it; TIME_WAIT ignores it (RFC 1337).
+    *((state, TCPFlags.RST, TCPProtocol._handle_rst) for state in (
+        TCPState.SYN_SENT, TCPState.SYN_RECEIVED, TCPState.ESTABLISHED, TCPState.FIN_WAIT_1,
+        TCPState.FIN_WAIT_2, TCPState.CLOSE_WAIT, TCPState.CLOSING, TCPState.LAST_ACK)),
+    (TCPState.CLOSED,       TCPFlags.SYN,                TCPProtocol._handle_syn),
+    (TCPState.SYN_SENT,     TCPFlags.SYN | TCPFlags.ACK, TCPProtocol._handle_syn_ack),
+    (TCPState.SYN_RECEIVED, TCPFlags.ACK,                TCPProtocol._handle_ack),
+    (TCPState.ESTABLISHED,  TCPFlags.FIN,                TCPProtocol._handle_fin),
+    (TCPState.ESTABLISHED,  TCPFlags.ACK,                TCPProtocol._handle_established_ack),
+    (TCPState.FIN_WAIT_1,   TCPFlags.FIN,                TCPProtocol._handle_fin),
+    (TCPState.FIN_WAIT_1,   TCPFlags.ACK,                TCPProtocol._handle_established_ack),
+    (TCPState.FIN_WAIT_2,   TCPFlags.FIN,                TCPProtocol._handle_fin),
+    (TCPState.FIN_WAIT_2,   TCPFlags.ACK,                TCPProtocol._handle_established_ack),
+    (TCPState.CLOSE_WAIT,   TCPFlags.ACK,                TCPProtocol._handle_ack),
+    (TCPState.CLOSING,      TCPFlags.ACK,                TCPProtocol._handle_ack),
+    (TCPState.LAST_ACK,     TCPFlags.ACK,                TCPProtocol._handle_ack),
+))
@@ -0,0 +1,153 @@
+import time
+from collections import OrderedDict
+from packet_parser import ip_to_int
+from flow_table import IPPROTO_TCP
+from tcp_protocol import TCPFlags, SEQ_MASK
+
+SEQ_HALF = 1 << 31
+TIME_WAIT_LEN = 60.0  # 2 * MSL, as in Linux
+REUSE_DELAY = 1.0  # seconds since the last timestamp before a connect may reuse the tuple
+
+class TimeWait:
+    # All that is left of a connection after the active close.
+    __slots__ = ('snd_nxt', 'rcv_nxt', 'ts_recent', 'stamp')
+
+    def __init__(self, snd_nxt, rcv_nxt, ts_recent, stamp):
+        self.snd_nxt = snd_nxt
+        self.rcv_nxt = rcv_nxt
+        self.ts_recent = ts_recent
+        self.stamp = stamp
+
+class TimeWaitTable:
+    # Connections in TIME_WAIT, keyed by (local_ip, local_port, remote_ip, remote_port) with
+    # int addresses. Every entry lives for the same timeout, so insertion order is expiry order
+    # and one timer for the oldest entry expires everything due in a batch.
+    timers = None  # TimerWheel; without one, entries are expired as new ones are added
+    clock = time.monotonic
+    timeout = TIME_WAIT_LEN
+    expiry_batch = 1.0  # entries expiring this close together are reaped by one timer
+    max_buckets = 262144
+    reuse = True  # tw_reuse: connect() may take over a tuple when timestamps protect it
+
+    def __init__(self, flow_table=None):
+        self.flow_table = flow_table  # for handing a recycled tuple's SYN to its listener
+        self.entries = OrderedDict()  # oldest first
+        self.timer = None
+        self.expired = 0
+        self.recycled = 0
+        self.overflows = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def add(self, key, snd_nxt, rcv_nxt, ts_recent=None) -> bool:
+        now = self.clock()
+        self._expire(now)
+        if key not in self.entries and len(self.entries) >= self.max_buckets:
+            self.overflows += 1
+            return False  # the connection just closes, as Linux does on bucket overflow
+        self.entries.pop(key, None)
+        self.entries[key] = TimeWait(snd_nxt, rcv_nxt, ts_recent, now)
+        self._arm_timer()
+        return True
+
+    def _expire(self, now):
+        deadline = now - self.timeout
+        entries = self.entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry.stamp > deadline:
+                break
+            del entries[key]
+            self.expired += 1
+
+    def _arm_timer(self):
+        if self.timers is None or self.timer is not None or not self.entries:
+            return
+        oldest = next(iter(self.entries.values()))
+        delay = oldest.stamp + self.timeout + self.expiry_batch - self.clock()
+        self.timer = self.timers.schedule(delay, self.on_timer)
+
+    def on_timer(self):
+        self.timer = None
+        self._expire(self.clock())
+        self._arm_timer()
+
+    def reuse_for_connect(self, key, protocol) -> bool:
+        # Returns False when the tuple is still protected by TIME_WAIT. A reused tuple starts
+        # its sequence space beyond anything the old connection sent, as Linux does.
+        entry = self.entries.get(key)
+        if entry is None:
+            return True
+        now = self.clock()
+        if now - entry.stamp >= self.timeout:
+            del self.entries[key]
+            self.expired += 1
+            return True
+        if not (self.reuse and protocol.ts_enabled and entry.ts_recent is not None and now - entry.stamp >= REUSE_DELAY):
+            return False
+        del self.entries[key]
+        self.recycled += 1
+        protocol.sequence_number = protocol.snd_una = (entry.snd_nxt + 0xFFFF + 2) & SEQ_MASK
+        return True
+
+    def _syn_acceptable(self, entry, packet):
+        # RFC 6191 with timestamps, otherwise RFC 1122 4.2.2.13: the new SYN must be
+        # provably newer than anything from the old incarnation.
+        timestamp = packet.get('timestamp')
+        if entry.ts_recent is not None and timestamp:
+            return 0 < (timestamp[0] - entry.ts_recent) & SEQ_MASK < SEQ_HALF
+        return 0 < (packet['seq_num'] - entry.rcv_nxt) & SEQ_MASK < SEQ_HALF
+
+    def handle_packet(self, packet):
+        key = (ip_to_int(packet['dst_ip']), packet['dst_port'], ip_to_int(packet['src_ip']), packet['src_port'])
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = self.clock()
+        flags = packet['flags']
+        stale = now - entry.stamp >= self.timeout
+        if stale or (flags & TCPFlags.SYN and not flags & TCPFlags.ACK and self._syn_acceptable(entry, packet)):
+            del self.entries[key]
+            if stale:
+                self.expired += 1
+            else:
+                self.recycled += 1
+            endpoint = self.flow_table.lookup(IPPROTO_TCP, *key) if self.flow_table is not None else None
+            return None if endpoint is None else endpoint.handle_packet(packet)
+        if flags & TCPFlags.FIN:
+            # The peer missed our ACK of its FIN: ACK again and restart the 2MSL wait.
+            self.entries.move_to_end(key)
+            entry.stamp = now
+            if packet.get('timestamp'):
+                entry.ts_recent = packet['timestamp'][0]
+            return self._create_ack(key, entry, now)
+        if flags & TCPFlags.SYN:
+            return self._create_ack(key, entry, now)
+        return None  # RSTs are ignored too (RFC 1337)
+
+    def _create_ack(self, key, entry, now):
+        local_ip, local_port, remote_ip, remote_port = key
+        packet = {
+            'src_ip': local_ip,
+            'dst_ip': remote_ip,
+            'src_port': local_port,
+            'dst_port': remote_port,
+            'seq_num': entry.snd_nxt,
+            'ack_num': entry.rcv_nxt,
+            'flags': TCPFlags.ACK,
+            'window_size': 0,
+            'data': b''
+        }
+        if entry.ts_recent is not None:
+            packet['timestamp'] = (int(now * 1000) & SEQ_MASK, entry.ts_recent)
+        return packet
+
+    def clear(self):
+        self.entries.clear()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
@@ -0,0 +1,112 @@
+import math
+import time
+from typing import Callable, Optional
+
+SLOT_BITS = 6
+SLOTS     = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+
+class Timer:
+    __slots__ = ('tick', 'callback', 'args', 'wheel', '_slot')
+
+    def __init__(self, tick: int, callback: Callable, args: tuple, wheel: 'TimerWheel'):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.wheel = wheel
+        self._slot = None
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+    def cancel(self):
+        if self._slot is not None:
+            del self._slot[self]
+            self._slot = None
+            self.wheel.count -= 1
+
+# Hierarchical timing wheel: O(1) schedule and cancel; expiry cost is
+# proportional to the timers that fire plus one cascade every SLOTS ticks.
+class TimerWheel:
+    def __init__(self, resolution: float = 0.01, levels: int = 6, clock: Callable[[], float] = time.monotonic):
+        self.resolution = resolution
+        self.levels = levels
+        self.clock = clock
+        self.start = clock()
+        self.current = 0  # next tick to be processed
+        self.count = 0
+        self.wheels = [[{} for _ in range(SLOTS)] for _ in range(levels)]
+        self.max_ticks = 1 << (SLOT_BITS * levels)
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        tick = math.ceil((self.clock() - self.start + max(delay, 0)) / self.resolution)
+        timer = Timer(max(tick, self.current), callback, args, self)
+        self._insert(timer)
+        self.count += 1
+        return timer
+
+    def cancel(self, timer: Timer):
+        timer.cancel()
+
+    def _insert(self, timer: Timer):
+        delta = min(timer.tick - self.current, self.max_ticks - 1)
+        level = 0
+        while delta >= SLOTS << (SLOT_BITS * level):
+            level += 1
+        slot = self.wheels[level][((self.current + delta) >> (SLOT_BITS * level)) & SLOT_MASK]
+        slot[timer] = None
+        timer._slot = slot
+
+    def _cascade(self, level: int):
+        index = (self.current >> (SLOT_BITS * level)) & SLOT_MASK
+        slot = self.wheels[level][index]
+        self.wheels[level][index] = {}
+        for timer in slot:
+            self._insert(timer)
+        if index == 0 and level + 1 < self.levels:
+            self._cascade(level + 1)
+
+    def advance(self, now: Optional[float] = None) -> int:
+        now_tick = int(((self.clock() if now is None else now) - self.start) / self.resolution)
+        fired = 0
+        while self.current <= now_tick:
+            if self.count == 0:
+                self.current = now_tick + 1
+                break
+            index = self.current & SLOT_MASK
+            if index == 0:
+                self._cascade(1)
+            slot = self.wheels[0][index]
+            self.current += 1
+            if not slot:
+                continue
+            self.wheels[0][index] = {}
+            for timer in list(slot):
+                if timer._slot is not slot:
+                    continue  # cancelled by an earlier callback in this slot
+                timer._slot = None
+                self.count -= 1
+                fired += 1
+                timer.callback(*timer.args)
+        return fired
+
+    def next_deadline(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        level0 = self.wheels[0]
+        base = self.current & SLOT_MASK
+        for offset in range(SLOTS - base):
+            if level0[base + offset]:
+                return self.start + (self.current + offset) * self.resolution
+        # Nothing due in this block: wake up for the next cascade.
+        return self.start + (self.current - base + SLOTS) * self.resolution
+
+    def timeout(self) -> Optional[float]:
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.clock())
+
+    def __len__(self):
+        return self.count
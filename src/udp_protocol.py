@@ -1,29 +1,182 @@
+import random
+import struct
+import time
+from collections import OrderedDict, deque
+from checksum import sum_words, finish, pseudo_header_sum
+from packet_parser import IP_HEADER, UDP_HEADER, ip_to_int
+from flow_table import IPPROTO_UDP
+
+IP_DF = 0x4000
+
+class Datagram:
+    __slots__ = ('data', 'addr')
+
+    def __init__(self, data, addr):
+        self.data = data
+        self.addr = addr
+
+class HeaderTemplate:
+    # IPv4 and UDP headers for one destination, built once. Per datagram only the lengths,
+    # the IP identification and the two checksums are patched, and the checksums start from
+    # sums precomputed over the fixed fields. The link layer adds its own header.
+    __slots__ = ('header', 'dst_ip', 'ip_sum', 'udp_sum')
+
+    def __init__(self, src_ip, dst_ip, src_port, dst_port, ttl=64):
+        ip = IP_HEADER.pack(0x45, 0, 0, 0, IP_DF, ttl, IPPROTO_UDP, 0, src_ip, dst_ip)
+        udp = UDP_HEADER.pack(src_port, dst_port, 0, 0)
+        self.header = ip + udp
+        self.dst_ip = dst_ip
+        self.ip_sum = sum_words(ip)
+        self.udp_sum = pseudo_header_sum(src_ip, dst_ip, IPPROTO_UDP, 0) + src_port + dst_port
+
+    def build(self, payload, ident):
+        # The UDP length is counted twice: once in the pseudo-header and once in the header.
+        length = UDP_HEADER.size + len(payload)
+        total = IP_HEADER.size + length
+        ip_sum = (self.ip_sum + total + ident) % 0xFFFF or 0xFFFF
+        header = bytearray(self.header)
+        struct.pack_into('!HH', header, 2, total, ident)
+        struct.pack_into('!H', header, 10, ~ip_sum & 0xFFFF)
+        struct.pack_into('!HH', header, 24, length, finish(sum_words(payload, self.udp_sum + 2 * length)) or 0xFFFF)
+        return header
+
 class UDPProtocol:
-    def __init__(self):
-        self.connections = {}
+    # Datagrams from every peer share one bounded receive queue, dropped at the tail when
+    # it is full. Peers are tracked in LRU order and evicted when idle or over max_peers.
+    # Sends are framed from a cached HeaderTemplate per destination.
+    recv_queue_limit = 256  # datagrams
+    recv_buffer_size = 256 * 1024  # bytes of payload, like SO_RCVBUF
+    max_peers = 1024
+    peer_idle_timeout = 60.0
+    clock = time.monotonic
+    link = None  # EthernetLayer datagrams are sent through
+    ttl = 64
+    mtu = 1500
+    max_templates = 256
+
+    def __init__(self, src_ip=None, src_port=None):
+        self.src_ip = src_ip
+        self.src_port = src_port
+        self.dst_ip = None
+        self.dst_port = None
+        self.connections = OrderedDict()  # peer address -> UDPConnection, least recently used first
+        self.receive_queue = deque()
+        self.queued_bytes = 0
+        self.drops = 0
+        self.dropped_bytes = 0
+        self.peer_evictions = 0
+        self.templates = {}  # (dst_ip, dst_port) -> HeaderTemplate, oldest first
+        self.ident = random.getrandbits(16)
+        self.datagrams_sent = 0
 
     def handle_packet(self, packet):
-        source_addr = (packet.source_ip, packet.source_port)
-        if source_addr not in self.connections:
-            self.connections[source_addr] = self._create_connection(source_addr)
-        
-        return self.connections[source_addr].process_packet(packet)
+        source_addr = (packet['src_ip'], packet['src_port'])
+        now = self.clock()
+        connection = self.connections.get(source_addr)
+        if connection is None:
+            connection = self.connections[source_addr] = self._admit(source_addr, now)
+        else:
+            self.connections.move_to_end(source_addr)
+        connection.last_seen = now
+        self._enqueue(packet['data'], source_addr)
+        return connection.process_packet(packet)
+
+    def _admit(self, addr, now):
+        connections = self.connections
+        while connections:
+            oldest = next(iter(connections.values()))
+            if now - oldest.last_seen < self.peer_idle_timeout and len(connections) < self.max_peers:
+                break
+            connections.popitem(last=False)
+            self.peer_evictions += 1
+        return self._create_connection(addr)
 
     def _create_connection(self, addr):
         return UDPConnection(addr)
 
+    def _enqueue(self, data, addr):
+        size = len(data)
+        if len(self.receive_queue) >= self.recv_queue_limit or self.queued_bytes + size > self.recv_buffer_size:
+            self.drops += 1
+            self.dropped_bytes += size
+            return False
+        # The payload may be a view into a reused receive buffer, so it is copied here.
+        self.receive_queue.append(Datagram(bytes(data), addr))
+        self.queued_bytes += size
+        return True
+
+    def receive(self, buffer_size=None):
+        # Like recv(2) on a datagram socket: one datagram per call, truncated to buffer_size.
+        batch = self.receive_many(1)
+        if not batch:
+            return None
+        data = batch[0].data
+        return data if buffer_size is None else data[:buffer_size]
+
+    def receive_many(self, count):
+        queue = self.receive_queue
+        batch = [queue.popleft() for _ in range(min(count, len(queue)))]
+        for datagram in batch:
+            self.queued_bytes -= len(datagram.data)
+        return batch
+
+    def connect(self):
+        return None  # nothing to exchange; send() now goes to dst_ip/dst_port
+
+    def _template(self, addr):
+        template = self.templates.get(addr)
+        if template is None:
+            if len(self.templates) >= self.max_templates:
+                del self.templates[next(iter(self.templates))]
+            template = self.templates[addr] = HeaderTemplate(
+                ip_to_int(self.src_ip), ip_to_int(addr[0]), self.src_port, addr[1], self.ttl)
+        return template
+
+    def send_many(self, datagrams) -> int:
+        # sendmmsg(2)-style: datagrams is an iterable of (data, addr) pairs, addr None meaning the
+        # connected peer. Every packet is built first and the link is handed the whole batch;
+        # returns the number of datagrams it accepted.
+        if self.link is None:
+            raise ValueError("No link to send UDP datagrams through")
+        limit = self.mtu - IP_HEADER.size - UDP_HEADER.size
+        ident = self.ident
+        packets = []
+        for data, addr in datagrams:
+            if addr is None:
+                if self.dst_ip is None:
+                    raise ValueError("Datagram has no destination and the socket is not connected")
+                addr = (self.dst_ip, self.dst_port)
+            if len(data) > limit:
+                raise ValueError(f"Datagram of {len(data)} bytes exceeds the {limit} byte payload the MTU allows")
+            ident = (ident + 1) & 0xFFFF
+            template = self._template(addr)
+            packets.append((template.dst_ip, (template.build(data, ident), data)))
+        self.ident = ident
+        sent = self.link.send_many(packets)
+        self.datagrams_sent += sent
+        return sent
+
+    def send_to(self, data, addr) -> int:
+        return self.send_many(((data, addr),))
+
+    def send(self, data) -> int:
+        return self.send_many(((data, None),))
+
 class UDPConnection:
+    # What UDPProtocol remembers about one peer.
+    __slots__ = ('remote_addr', 'last_seen', 'datagrams', 'bytes_received')
+
     def __init__(self, remote_addr):
         self.remote_addr = remote_addr
-        self.received_packets = []
+        self.last_seen = 0.0
+        self.datagrams = 0
+        self.bytes_received = 0
 
     def process_packet(self, packet):
-        self.received_packets.append(packet)
+        self.datagrams += 1
+        self.bytes_received += len(packet['data'])
         # In UDP, we don't need to send an acknowledgment
         return None
 
     def send(self, data):
-        # Create and return a UDP packet with the given data
-        pass
-
-
+        raise NotImplementedError("Datagrams are sent through UDPProtocol.send_to or Socket.send_to")
@@ -0,0 +1,153 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
+import asyncio
+import unittest
+from unittest.mock import patch
+from aio import StackDriver
+from config import Config
+from stack import NetworkStack
+from virtual_device_manager import SocketPairInterface
+
+
+class TestStackDriver(unittest.TestCase):
+    def setUp(self):
+        self.stacks = []
+        for index, device in enumerate(SocketPairInterface.pair(), 1):
+            config = Config()
+            config.set('ip_address', f'10.0.0.{index}')
+            config.set('mac_address', f'02:00:00:00:00:0{index}')
+            stack = NetworkStack(config, device)
+            self.addCleanup(stack.device.close)
+            self.stacks.append(stack)
+
+    def _run(self, main):
+        async def runner():
+            drivers = [StackDriver(stack) for stack in self.stacks]
+            for driver in drivers:
+                driver.start()
+            try:
+                return await asyncio.wait_for(main(*drivers), 5)
+            finally:
+                for driver in drivers:
+                    driver.stop()
+        return asyncio.run(runner())
+
+    def test_echo_over_streams(self):
+        async def main(server_driver, client_driver):
+            async def echo(reader, writer):
+                while data := await reader.read(4096):
+                    writer.write(data)
+                writer.close()
+
+            server = await server_driver.start_server(echo, port=7)
+            reader, writer = await client_driver.open_connection('10.0.0.1', 7)
+            self.assertEqual(writer.get_extra_info('peername'), ('10.0.0.1', 7))
+            writer.write(b'ping')
+            first = await reader.readexactly(4)
+            payload = bytes(range(256)) * 400  # several windows' worth
+            writer.write(payload)
+            echoed = await reader.readexactly(len(payload))
+            writer.close()
+            rest = await reader.read()
+            await writer.wait_closed()
+            server.close()
+            await server.wait_closed()
+            return first, echoed == payload, rest
+
+        self.assertEqual(self._run(main), (b'ping', True, b''))
+
+    def test_close_delivers_buffered_data(self):
+        payload = bytes(range(256)) * 400
+
+        async def main(server_driver, client_driver):
+            async def send_and_close(reader, writer):
+                writer.write(payload)
+                writer.close()
+
+            await server_driver.start_server(send_and_close, port=8)
+            reader, writer = await client_driver.open_connection('10.0.0.1', 8)
+            received = await reader.read()
+            writer.close()
+            return received
+
+        self.assertEqual(self._run(main), payload)
+
+    def test_many_coroutines_share_one_stack(self):
+        async def main(server_driver, client_driver):
+            async def handle(reader, writer):
+                line = await reader.readline()
+                writer.write(line.upper())
+                writer.close()
+
+            await server_driver.start_server(handle, port=80)
+
+            async def client(n):
+                reader, writer = await client_driver.open_connection('10.0.0.1', 80)
+                writer.write(b'client %d\n' % n)
+                reply = await reader.readline()
+                writer.close()
+                return reply
+
+            # The first connection resolves the server's address: a burst of SYNs larger than
+            # EthernetLayer.pending_limit would otherwise lose the oldest while ARP is pending.
+            first = await client(0)
+            return [first] + await asyncio.gather(*(client(n) for n in range(1, 50)))
+
+        self.assertEqual(self._run(main), [b'CLIENT %d\n' % n for n in range(50)])
+
+    def test_ephemeral_ports_skip_tuples_in_use(self):
+        async def main(server_driver, client_driver):
+            await server_driver.start_server(lambda reader, writer: writer.close(), port=80)
+            with patch('aio.random.randint', return_value=40000):
+                connections = [await client_driver.open_connection('10.0.0.1', 80) for _ in range(2)]
+            for _, writer in connections:
+                writer.close()
+            return [writer.get_extra_info('sockname')[1] for _, writer in connections]
+
+        self.assertEqual(self._run(main), [40000, 40001])
+
+    def test_refused_connection(self):
+        async def main(server_driver, client_driver):
+            with self.assertRaises(ConnectionRefusedError):
+                await client_driver.open_connection('10.0.0.1', 9999)
+            return len(client_driver.stack.socket_manager.flow_table.flows)
+
+        self.assertEqual(self._run(main), 0)
+
+    def test_connect_timeout(self):
+        async def main(server_driver, client_driver):
+            with self.assertRaises(asyncio.TimeoutError):
+                await client_driver.open_connection('10.0.0.3', 80, timeout=0.2)  # nobody answers ARP
+            return len(client_driver.stack.socket_manager.flow_table.flows)
+
+        self.assertEqual(self._run(main), 0)
+
+    def test_abort_resets_the_connection(self):
+        async def main(server_driver, client_driver):
+            accepted = asyncio.get_running_loop().create_future()
+
+            async def handle(reader, writer):
+                accepted.set_result(None)
+                await reader.read()
+                writer.close()
+
+            await server_driver.start_server(handle, port=80)
+            _, writer = await client_driver.open_connection('10.0.0.1', 80)
+            await accepted
+            writer.transport.abort()
+            tables = [driver.stack.socket_manager.flow_table for driver in (server_driver, client_driver)]
+            for _ in range(100):
+                if not tables[0].flows:
+                    break
+                await asyncio.sleep(0.01)
+            return [(len(table.flows), len(table.time_wait)) for table in tables]
+
+        self.assertEqual(self._run(main), [(0, 0), (0, 0)])  # no FIN exchange, so no TIME_WAIT either
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import random
+import struct
+import unittest
+from checksum import (checksum, ip_header_checksum, transport_checksum, verify_ip_header,
+                      verify_transport, update_checksum16, update_checksum32)
+
+
+def reference_checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = 0
+    for i in range(0, len(data), 2):
+        total += (data[i] << 8) | data[i + 1]
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class TestChecksum(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(1624)
+
+    def test_known_ip_header(self):
+        header = bytes.fromhex('450000730000400040110000c0a80001c0a800c7')
+        self.assertEqual(ip_header_checksum(header), 0xB861)
+        self.assertTrue(verify_ip_header(header[:10] + b'\xb8\x61' + header[12:]))
+        self.assertFalse(verify_ip_header(header[:10] + b'\xb8\x62' + header[12:]))
+
+    def test_matches_reference_for_random_buffers(self):
+        for size in (0, 1, 2, 3, 20, 1499, 1500, 65535):
+            data = self.random.randbytes(size)
+            self.assertEqual(checksum(data), reference_checksum(data), size)
+
+    def test_memoryview_input(self):
+        data = self.random.randbytes(1500)
+        self.assertEqual(checksum(memoryview(data)[10:]), reference_checksum(data[10:]))
+
+    def test_transport_checksum_round_trip(self):
+        src, dst = 0x0A000001, 0x0A000002
+        segment = struct.pack('!HHIIBBHHH', 1234, 80, 1000, 2000, 5 << 4, 0x18, 8192, 0, 0) + b'hello'
+        value = transport_checksum(src, dst, 6, segment)
+        segment = segment[:16] + struct.pack('!H', value) + segment[18:]
+        self.assertTrue(verify_transport(src, dst, 6, segment))
+        self.assertFalse(verify_transport(src, dst + 1, 6, segment))
+
+    def test_incremental_update_matches_recompute(self):
+        src, dst = 0x0A000001, 0x0A000002
+        payload = self.random.randbytes(1460)
+
+        def segment(seq, window, value=0):
+            return struct.pack('!HHIIBBHHH', 1234, 80, seq, 2000, 5 << 4, 0x10, window, value, 0) + payload
+
+        original = transport_checksum(src, dst, 6, segment(0xFFFF0001, 512))
+        updated = update_checksum32(original, 0xFFFF0001, 0x00010203)
+        updated = update_checksum16(updated, 512, 65535)
+        self.assertTrue(verify_transport(src, dst, 6, segment(0x00010203, 65535, updated)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
+import unittest
+from congestion_control import NewReno, Cubic, BBR, create_congestion_control
+from tcp_protocol import TCPProtocol, TCPState
+from src.socket import Socket, SocketType, TCP_CONGESTION
+
+MSS = 1000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNewReno(unittest.TestCase):
+    def setUp(self):
+        self.cc = NewReno(MSS)
+
+    def test_slow_start_grows_per_ack(self):
+        self.cc.on_ack(MSS, 0)
+        self.assertEqual(self.cc.cwnd, 11 * MSS)
+
+    def test_congestion_avoidance_grows_per_window(self):
+        self.cc.ssthresh = self.cc.cwnd
+        for _ in range(10):
+            self.cc.on_ack(MSS, 0)
+        self.assertEqual(self.cc.cwnd, 11 * MSS)
+
+    def test_loss_halves_and_timeout_collapses(self):
+        self.cc.on_loss(20 * MSS)
+        self.assertEqual((self.cc.ssthresh, self.cc.cwnd), (10 * MSS, 10 * MSS))
+        self.cc.on_loss(20 * MSS, timeout=True)
+        self.assertEqual(self.cc.cwnd, MSS)
+
+
+class TestCubic(unittest.TestCase):
+    def test_backs_off_by_beta_and_regrows_toward_w_max(self):
+        clock = FakeClock()
+        cc = Cubic(MSS, clock)
+        cc.cwnd = 100 * MSS
+        cc.on_loss(100 * MSS)
+        self.assertEqual(cc.cwnd, 70 * MSS)
+        for _ in range(200):
+            clock.now += 0.05
+            cc.on_ack(MSS, cc.cwnd)
+        self.assertGreater(cc.cwnd, 90 * MSS)
+
+
+class TestBBR(unittest.TestCase):
+    def test_estimates_bandwidth_and_paces(self):
+        clock = FakeClock()
+        cc = BBR(MSS, clock)
+        cc.on_rtt_sample(0.01)
+        for _ in range(50):
+            clock.now += 0.01
+            cc.on_ack(10 * MSS, 10 * MSS)  # 1 MB/s delivered
+        self.assertAlmostEqual(cc.btl_bw, 1e6, delta=1e3)
+        self.assertTrue(cc.filled_pipe)
+        self.assertAlmostEqual(cc.cwnd, 20 * MSS, delta=MSS // 10)
+        self.assertIsNotNone(cc.pacing_rate)
+
+
+class TestCongestionControlSelection(unittest.TestCase):
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            create_congestion_control('vegas-ng', MSS)
+
+    def test_cwnd_limits_output(self):
+        tcp = TCPProtocol('10.0.0.1', 1000, '10.0.0.2', 80)
+        tcp.state = TCPState.ESTABLISHED
+        tcp.congestion.cwnd = 2 * tcp.congestion.mss
+        tcp.send(bytes(10 * tcp.congestion.mss))
+        self.assertEqual(len(tcp.poll_output()), 2)
+
+    def test_per_socket_selection(self):
+        socket = Socket('10.0.0.1', 1000, SocketType.TCP)
+        self.assertEqual(socket.getsockopt(TCP_CONGESTION), 'newreno')
+        socket.setsockopt(TCP_CONGESTION, 'cubic')
+        self.assertEqual(socket.getsockopt(TCP_CONGESTION), 'cubic')
+        with self.assertRaises(ValueError):
+            socket.setsockopt(TCP_CONGESTION, 'unknown')
+
+    def test_global_default(self):
+        previous = TCPProtocol.default_congestion_control
+        TCPProtocol.default_congestion_control = 'bbr'
+        try:
+            self.assertEqual(TCPProtocol('10.0.0.1', 1000).congestion.name, 'bbr')
+        finally:
+            TCPProtocol.default_congestion_control = previous
+
+if __name__ == '__main__':
+    unittest.main()
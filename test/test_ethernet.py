@@ -0,0 +1,149 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
+import unittest
+from ethernet import (EthernetLayer, ARP_HEADER, ARPHRD_ETHER, ARPOP_REQUEST, ARPOP_REPLY, ETH_P_ARP,
+                      BROADCAST_MAC, ZERO_MAC, REACHABLE, STALE, FAILED)
+from packet_parser import ETH_HEADER, ETH_P_IP, ip_to_int
+from virtual_device_manager import NetworkInterface
+from timer_wheel import TimerWheel
+
+OUR_MAC = b'\x02\x00\x00\x00\x00\x01'
+PEER_MAC = b'\x02\x00\x00\x00\x00\x02'
+GATEWAY_MAC = b'\x02\x00\x00\x00\x00\xfe'
+PEER, GATEWAY = ip_to_int('10.0.0.5'), ip_to_int('10.0.0.1')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDevice(NetworkInterface):
+    def __init__(self):
+        self.frames = []
+
+    def read(self, length):
+        return b''
+
+    def write(self, data):
+        self.frames.append(bytes(data))
+        return len(data)
+
+    def write_many(self, frames):
+        self.frames.extend(b''.join(frame) for frame in frames)
+        return len(frames)
+
+    def close(self):
+        pass
+
+    @property
+    def fd(self):
+        return -1
+
+
+def arp(op, sha, spa, tha, tpa, dst_mac=BROADCAST_MAC):
+    return (ETH_HEADER.pack(dst_mac, sha, ETH_P_ARP) +
+            ARP_HEADER.pack(ARPHRD_ETHER, ETH_P_IP, 6, 4, op, sha, spa, tha, tpa))
+
+
+class TestEthernetLayer(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.device = FakeDevice()
+        layer = type('EthernetLayer', (EthernetLayer,), {'clock': self.clock, 'pending_limit': 2})
+        self.link = layer(self.device, OUR_MAC, '10.0.0.2', '255.255.255.0', '10.0.0.1')
+
+    def _arp_frames(self):
+        return [ARP_HEADER.unpack_from(frame, ETH_HEADER.size) for frame in self.device.frames
+                if ETH_HEADER.unpack_from(frame)[2] == ETH_P_ARP]
+
+    def test_receive_filters_frames(self):
+        ip = b'\x45' + bytes(19)
+        self.assertEqual(bytes(self.link.handle_frame(ETH_HEADER.pack(OUR_MAC, PEER_MAC, ETH_P_IP) + ip)), ip)
+        self.assertEqual(bytes(self.link.handle_frame(ETH_HEADER.pack(BROADCAST_MAC, PEER_MAC, ETH_P_IP) + ip)), ip)
+        self.assertIsNone(self.link.handle_frame(ETH_HEADER.pack(PEER_MAC, OUR_MAC, ETH_P_IP) + ip))
+        self.assertIsNone(self.link.handle_frame(ETH_HEADER.pack(OUR_MAC, PEER_MAC, 0x86DD) + ip))
+        self.assertIsNone(self.link.handle_frame(b'short'))
+        self.assertEqual(self.link.frames_ignored, 3)
+
+    def test_answers_requests_for_our_address(self):
+        self.assertIsNone(self.link.handle_frame(arp(ARPOP_REQUEST, PEER_MAC, PEER, ZERO_MAC, self.link.ip)))
+        dst_mac, src_mac, ethertype = ETH_HEADER.unpack_from(self.device.frames[0])
+        self.assertEqual((dst_mac, src_mac, ethertype), (PEER_MAC, OUR_MAC, ETH_P_ARP))
+        reply = ARP_HEADER.unpack_from(self.device.frames[0], ETH_HEADER.size)
+        self.assertEqual(reply[4:], (ARPOP_REPLY, OUR_MAC, self.link.ip, PEER_MAC, PEER))
+        # The asker is learned, so replying to it needs no request of our own.
+        self.assertEqual(self.link.neighbours[PEER].state, REACHABLE)
+        # Requests for other hosts are neither answered nor learned from.
+        self.link.handle_frame(arp(ARPOP_REQUEST, GATEWAY_MAC, GATEWAY, ZERO_MAC, PEER))
+        self.assertEqual(len(self.device.frames), 1)
+        self.assertNotIn(GATEWAY, self.link.neighbours)
+
+    def test_pending_packets_flush_on_reply(self):
+        self.assertTrue(self.link.send(PEER, b'one'))
+        self.assertEqual(self.link.send_many([(PEER, (b't', b'wo')), (PEER, (b'three',))]), 2)
+        self.assertEqual(len(self._arp_frames()), 1)  # further requests wait for retrans_time
+        self.assertEqual(self.link.pending_drops, 1)  # bounded: the oldest packet made room
+        self.link.handle_frame(arp(ARPOP_REPLY, PEER_MAC, PEER, OUR_MAC, self.link.ip, OUR_MAC))
+        header = ETH_HEADER.pack(PEER_MAC, OUR_MAC, ETH_P_IP)
+        self.assertEqual(self.device.frames[1:], [header + b'two', header + b'three'])
+        self.link.send(PEER, b'four')
+        self.assertEqual(self.device.frames[-1], header + b'four')
+
+    def test_off_subnet_goes_through_gateway(self):
+        self.link.handle_frame(arp(ARPOP_REQUEST, GATEWAY_MAC, GATEWAY, ZERO_MAC, self.link.ip))
+        self.assertEqual(self.link.send_many([(ip_to_int('8.8.8.8'), (b'dns',))]), 1)
+        self.assertEqual(self.device.frames[-1], ETH_HEADER.pack(GATEWAY_MAC, OUR_MAC, ETH_P_IP) + b'dns')
+
+    def test_unanswered_resolution_becomes_negative(self):
+        self.link.send(PEER, b'x')
+        for _ in range(EthernetLayer.max_probes):
+            self.clock.now += EthernetLayer.retrans_time
+            self.link.send(PEER, b'x')
+        self.assertEqual(len(self._arp_frames()), EthernetLayer.max_probes)
+        self.assertEqual(self.link.neighbours[PEER].state, FAILED)
+        self.assertFalse(self.link.send(PEER, b'x'))
+        self.assertEqual(len(self._arp_frames()), EthernetLayer.max_probes)
+        self.clock.now += EthernetLayer.failed_time
+        self.assertTrue(self.link.send(PEER, b'x'))  # retried once the negative entry expires
+        self.assertEqual(len(self._arp_frames()), EthernetLayer.max_probes + 1)
+
+    def test_stale_entry_is_used_while_refreshing(self):
+        self.link.handle_frame(arp(ARPOP_REQUEST, PEER_MAC, PEER, ZERO_MAC, self.link.ip))
+        self.clock.now += EthernetLayer.reachable_time
+        self.assertTrue(self.link.send(PEER, b'x'))
+        self.assertEqual(self.link.neighbours[PEER].state, STALE)
+        self.assertEqual(self._arp_frames()[-1][4], ARPOP_REQUEST)
+        self.assertEqual(self.device.frames[-1], ETH_HEADER.pack(PEER_MAC, OUR_MAC, ETH_P_IP) + b'x')
+        self.link.handle_frame(arp(ARPOP_REPLY, PEER_MAC, PEER, OUR_MAC, self.link.ip, OUR_MAC))
+        self.assertEqual(self.link.neighbours[PEER].state, REACHABLE)
+
+    def test_retransmit_timer_resolves_without_traffic(self):
+        wheel = TimerWheel(0.01, clock=self.clock)
+        self.link.timers = wheel
+        self.link.send(PEER, b'x')
+        for _ in range(EthernetLayer.max_probes):
+            self.clock.now += EthernetLayer.retrans_time
+            wheel.advance()
+        self.assertEqual(len(self._arp_frames()), EthernetLayer.max_probes)
+        self.assertEqual(self.link.neighbours[PEER].state, FAILED)
+        self.assertEqual(self.link.pending_drops, 1)
+
+    def test_neighbour_table_is_bounded(self):
+        self.link.max_neighbours = 2
+        for host in range(3):
+            self.link.send(ip_to_int(f'10.0.0.{10 + host}'), b'x')
+        self.assertEqual(list(self.link.neighbours), [ip_to_int('10.0.0.11'), ip_to_int('10.0.0.12')])
+        self.assertEqual(self.link.pending_drops, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
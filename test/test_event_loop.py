@@ -1,10 +1,17 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import select
 import unittest
 from unittest.mock import Mock, patch
-from event_loop import EventLoop
+from config import Config
+from event_loop import EventLoop, EpollBackend, SelectBackend, EVENT_READ, EVENT_WRITE
 
 class TestEventLoop(unittest.TestCase):
     def setUp(self):
-        self.event_loop = EventLoop()
+        self.event_loop = EventLoop('select')
 
     def test_add_handler(self):
         mock_read = Mock()
@@ -58,6 +65,66 @@ class TestEventLoop(unittest.TestCase):
         handlers = self.event_loop.get_handlers()
         self.assertEqual(handlers[1]['read'], mock_handler)
 
+    def test_select_backend_keeps_interest_sets(self):
+        self.event_loop.add_handler(3, Mock(), Mock())
+        self.event_loop.add_handler(4, Mock())
+        self.assertEqual(self.event_loop.backend.read_fds, {3, 4})
+        self.assertEqual(self.event_loop.backend.write_fds, {3})
+        self.event_loop.remove_handler(3)
+        self.assertEqual(self.event_loop.backend.read_fds, {4})
+        self.assertEqual(self.event_loop.backend.write_fds, set())
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            EventLoop('kqueue-ng')
+
+    def test_default_backend_matches_config(self):
+        expected = EpollBackend if hasattr(select, 'epoll') else SelectBackend
+        self.assertEqual(Config().get('event_loop_backend'), 'epoll')
+        loop = EventLoop()
+        self.assertIsInstance(loop.backend, expected)
+        loop.backend.close()
+
+
+@unittest.skipUnless(hasattr(select, 'epoll'), "epoll is not available")
+class TestEpollEventLoop(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = EventLoop('epoll')
+        self.read_fd, self.write_fd = os.pipe()
+
+    def tearDown(self):
+        self.event_loop.backend.close()
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def test_dispatches_ready_fds(self):
+        received = []
+
+        def on_read(fd):
+            received.append(os.read(fd, 16))
+            self.event_loop.stop()
+
+        self.event_loop.add_handler(self.read_fd, on_read)
+        os.write(self.write_fd, b'ping')
+        self.event_loop.run()
+        self.assertEqual(received, [b'ping'])
+
+    def test_interest_is_updated_in_place(self):
+        self.event_loop.add_handler(self.write_fd, write_handler=Mock())
+        self.assertEqual(self.event_loop.backend.poll(0), [(self.write_fd, EVENT_WRITE)])
+        self.event_loop.add_handler(self.write_fd, read_handler=Mock())
+        self.assertEqual(self.event_loop.backend.poll(0), [])
+        self.event_loop.remove_handler(self.write_fd)
+        self.assertNotIn(self.write_fd, self.event_loop.backend.registered)
+
+    def test_edge_triggered_reports_once(self):
+        loop = EventLoop('epoll', edge_triggered=True)
+        loop.add_handler(self.read_fd, Mock())
+        os.write(self.write_fd, b'x')
+        self.assertEqual(loop.backend.poll(0), [(self.read_fd, EVENT_READ)])
+        self.assertEqual(loop.backend.poll(0), [])
+        loop.backend.close()
+
 if __name__ == '__main__':
     unittest.main()
 
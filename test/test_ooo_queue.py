@@ -0,0 +1,62 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import unittest
+from ooo_queue import OutOfOrderQueue
+
+
+class TestOutOfOrderQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue = OutOfOrderQueue(limit=100)
+
+    def test_overlapping_ranges_merge(self):
+        alphabet = b'abcdefghijklmnopqrstuvwxyz'
+        self.assertTrue(self.queue.insert(0, 10, alphabet[:5]))
+        self.assertTrue(self.queue.insert(0, 30, alphabet[20:]))
+        self.assertTrue(self.queue.insert(0, 13, alphabet[3:22]))
+        self.assertEqual(self.queue.sack_blocks(4), [(10, 36)])
+        self.assertEqual(len(self.queue), 26)
+        self.assertEqual(bytes(self.queue.pop(10)), alphabet)
+
+    def test_adjacent_ranges_merge(self):
+        self.queue.insert(0, 10, b'aa')
+        self.queue.insert(0, 12, b'bb')
+        self.assertEqual(self.queue.sack_blocks(4), [(10, 14)])
+
+    def test_pop_waits_for_hole(self):
+        self.queue.insert(0, 10, b'abc')
+        self.assertIsNone(self.queue.pop(5))
+        self.assertEqual(bytes(self.queue.pop(11)), b'bc')
+        self.assertEqual(len(self.queue), 0)
+
+    def test_pop_discards_covered_ranges(self):
+        self.queue.insert(0, 10, b'abc')
+        self.queue.insert(0, 20, b'xyz')
+        self.assertEqual(bytes(self.queue.pop(21)), b'yz')
+        self.assertEqual(len(self.queue), 0)
+
+    def test_memory_limit(self):
+        self.assertTrue(self.queue.insert(0, 10, bytes(90)))
+        self.assertFalse(self.queue.insert(0, 200, bytes(20)))
+        self.assertEqual(self.queue.drops, 1)
+        # Data already held does not count twice.
+        self.assertTrue(self.queue.insert(0, 50, bytes(60)))
+        self.assertEqual(len(self.queue), 100)
+
+    def test_sequence_wraparound(self):
+        rcv_nxt = 0xFFFFFFF0
+        self.queue.insert(rcv_nxt, 0xFFFFFFFC, b'abcd')
+        self.queue.insert(rcv_nxt, 0, b'efgh')
+        self.assertEqual(self.queue.sack_blocks(4), [(0xFFFFFFFC, 4)])
+        self.assertEqual(bytes(self.queue.pop(0xFFFFFFFC)), b'abcdefgh')
+
+    def test_most_recent_block_first(self):
+        self.queue.insert(0, 10, b'a')
+        self.queue.insert(0, 30, b'b')
+        self.queue.insert(0, 20, b'c')
+        self.assertEqual(self.queue.sack_blocks(2), [(20, 21), (10, 11)])
+
+if __name__ == '__main__':
+    unittest.main()
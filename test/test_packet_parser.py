@@ -1,6 +1,11 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
 import unittest
 import struct
-from src.packet_parser import PacketParser
+from src.packet_parser import PacketParser, IPv4Header, ip_to_int, ip_to_str
 
 class TestPacketParser(unittest.TestCase):
     def setUp(self):
@@ -70,7 +75,9 @@ class TestPacketParser(unittest.TestCase):
         constructed_tcp = self.parser.construct_tcp_packet(tcp_data)
         parsed_tcp = self.parser.parse_tcp_packet(constructed_tcp)
         for key, value in tcp_data.items():
-            if key != 'data':
+            if key == 'data_offset':
+                self.assertEqual(parsed_tcp[key], value * 4)  # constructed in 32-bit words, parsed in bytes
+            elif key != 'data':
                 self.assertEqual(parsed_tcp[key], value)
 
         udp_data = {
@@ -82,6 +89,46 @@ class TestPacketParser(unittest.TestCase):
             if key != 'data':
                 self.assertEqual(parsed_udp[key], value)
 
+    def test_parse_ip_header_fast_path(self):
+        packet = struct.pack('!BBHHHBBH4s4s', (4 << 4) + 5, 0, 24, 7, 0, 64, 17, 0,
+                             b'\x0a\x00\x00\x01', b'\xc0\xa8\x01\x02') + b'abcd' + b'\x00' * 6
+        header = self.parser.parse_ip_header(packet)
+        self.assertIsInstance(header, IPv4Header)
+        self.assertFalse(hasattr(header, '__dict__'))
+        self.assertEqual(header.src, 0x0A000001)
+        self.assertEqual(header.dst_ip, '192.168.1.2')
+        self.assertEqual(header['identification'], 7)
+        self.assertIsInstance(header.data, memoryview)
+        self.assertEqual(header.data.obj, packet)
+        self.assertEqual(bytes(header.data), b'abcd')  # trailing link-layer padding is trimmed
+
+    def test_parse_tcp_header_fast_path(self):
+        segment = struct.pack('!HHIIBBHHH', 1234, 80, 1000, 2000, (5 << 4), 0x18, 8192, 0, 0) + b'payload'
+        ip = {'src_ip': '10.0.0.1', 'dst_ip': '10.0.0.2'}
+        header = self.parser.parse_tcp_header(segment, ip)
+        self.assertEqual((header.seq_num, header.ack_num, header.flags), (1000, 2000, 0x18))
+        self.assertEqual(header['src_ip'], '10.0.0.1')
+        self.assertEqual(bytes(header.data), b'payload')
+        self.assertEqual(header.get('missing', 'default'), 'default')
+        with self.assertRaises(KeyError):
+            header['missing']
+
+    def test_tcp_options_round_trip(self):
+        segment = self.parser.construct_tcp_packet({
+            'src_port': 1234, 'dst_port': 80, 'seq_num': 1000, 'ack_num': 0, 'data_offset': 5, 'flags': 0x02,
+            'window_size': 8192, 'checksum': 0, 'urgent_pointer': 0, 'data': b'',
+            'mss': 1460, 'sack_permitted': True, 'timestamp': (7, 0), 'window_scale': 7})
+        self.assertEqual(len(segment), 40)
+        header = self.parser.parse_tcp_header(segment)
+        self.assertEqual(header.data_offset, 40)
+        self.assertEqual((header.mss, header.window_scale, header.sack_permitted, header.timestamp),
+                         (1460, 7, True, (7, 0)))
+        self.assertIsNone(header.sack_blocks)
+
+    def test_ip_conversions(self):
+        self.assertEqual(ip_to_int('192.168.1.2'), 0xC0A80102)
+        self.assertEqual(ip_to_str(0xC0A80102), '192.168.1.2')
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,99 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
+import unittest
+from src.socket import Socket, SocketType
+from socket_manager import SocketManager
+from packet_parser import PacketParser
+from checksum import verify_ip_header
+from reassembly import Reassembler, IP_MF
+
+PARSER = PacketParser()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def fragment(payload, offset, more, ident=7, src='192.168.1.2'):
+    return PARSER.parse_ip_header(PARSER.construct_ip_packet({
+        'version': 4, 'ihl': 5, 'dscp_ecn': 0, 'total_length': 20 + len(payload), 'identification': ident,
+        'flags_fragment_offset': (IP_MF if more else 0) | offset // 8, 'ttl': 64, 'protocol': 17,
+        'src_ip': src, 'dst_ip': '192.168.1.1', 'data': payload}))
+
+
+def fragments(payload, size, **kwargs):
+    return [fragment(payload[i:i + size], i, i + size < len(payload), **kwargs) for i in range(0, len(payload), size)]
+
+
+class TestReassembler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.reassembler = type('Reassembler', (Reassembler,), {'clock': self.clock})()
+        self.payload = bytes(range(256)) * 12
+
+    def test_out_of_order_fragments(self):
+        pieces = fragments(self.payload, 1000)
+        self.assertIsNone(self.reassembler.add(pieces[3]))
+        self.assertIsNone(self.reassembler.add(pieces[1]))
+        self.assertIsNone(self.reassembler.add(pieces[1]))  # exact duplicate
+        self.assertIsNone(self.reassembler.add(pieces[0]))
+        packet = self.reassembler.add(pieces[2])
+        self.assertEqual(bytes(packet.data), self.payload)
+        self.assertEqual((packet.total_length, packet.flags_fragment_offset, packet.identification), (3092, 0, 7))
+        self.assertTrue(verify_ip_header(packet.raw[:20]))
+        self.assertEqual((len(self.reassembler), self.reassembler.memory), (0, 0))
+
+    def test_datagrams_are_kept_apart(self):
+        a, b = fragments(self.payload, 2000, ident=1), fragments(self.payload[::-1], 2000, ident=2)
+        self.reassembler.add(a[0])
+        self.reassembler.add(b[0])
+        self.assertEqual(bytes(self.reassembler.add(b[1]).data), self.payload[::-1])
+        self.assertEqual(bytes(self.reassembler.add(a[1]).data), self.payload)
+
+    def test_overlap_and_bad_lengths_drop_the_datagram(self):
+        self.reassembler.add(fragment(self.payload[:1000], 0, True))
+        self.assertIsNone(self.reassembler.add(fragment(self.payload[800:1600], 800, True)))
+        self.assertEqual((len(self.reassembler), self.reassembler.malformed), (0, 1))
+        self.assertIsNone(self.reassembler.add(fragment(b'x' * 13, 0, True)))  # not a multiple of 8
+        self.assertEqual(self.reassembler.malformed, 2)
+
+    def test_incomplete_datagrams_time_out(self):
+        self.reassembler.add(fragments(self.payload, 1000)[0])
+        self.clock.now += Reassembler.timeout
+        self.reassembler.add(fragments(self.payload, 1000, ident=8)[0])
+        self.assertEqual((len(self.reassembler), self.reassembler.timeouts), (1, 1))
+
+    def test_memory_limit_evicts_oldest(self):
+        self.reassembler.memory_limit = 5000
+        for ident in range(3):
+            self.reassembler.add(fragments(self.payload, 2000, ident=ident)[0])
+        self.assertLessEqual(self.reassembler.memory, 5000)
+        self.assertEqual([key[3] for key in self.reassembler.queues], [2])
+        self.assertEqual(self.reassembler.evictions, 2)
+
+
+class TestFragmentedDelivery(unittest.TestCase):
+    def test_fragmented_udp_reaches_socket(self):
+        manager = SocketManager(verify_checksums=True)
+        sock = Socket('192.168.1.1', 9000, SocketType.UDP)
+        manager.add_socket(sock)
+        payload = b'telemetry' * 400
+        datagram = PARSER.construct_udp_packet({'src_ip': '192.168.1.2', 'dst_ip': '192.168.1.1', 'src_port': 5000,
+                                                'dst_port': 9000, 'length': 8 + len(payload), 'data': payload})
+        for piece in fragments(datagram, 1480):
+            manager.handle_packet(piece)
+        self.assertEqual(sock.recv(65535), payload)
+        self.assertEqual(manager.checksum_drops, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import unittest
+from ring_buffer import RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.ring = RingBuffer(8, high_watermark=6, low_watermark=2)
+
+    def test_write_and_read(self):
+        self.assertEqual(self.ring.write(b'hello'), 5)
+        self.assertEqual(len(self.ring), 5)
+        self.assertEqual(self.ring.read(3), b'hel')
+        self.assertEqual(self.ring.read(), b'lo')
+        self.assertEqual(len(self.ring), 0)
+
+    def test_write_is_bounded_by_capacity(self):
+        self.assertEqual(self.ring.write(b'0123456789'), 8)
+        self.assertEqual(self.ring.free, 0)
+        self.assertEqual(self.ring.write(b'x'), 0)
+
+    def test_wraparound(self):
+        self.ring.write(b'abcdef')
+        self.ring.consume(4)
+        self.assertEqual(self.ring.write(b'ghijkl'), 6)
+        self.assertEqual(bytes(self.ring.peek(8)), b'efghijkl')
+        self.assertEqual(bytes(self.ring.peek(3, offset=1)), b'fgh')
+        self.assertEqual(self.ring.read(), b'efghijkl')
+
+    def test_contiguous_peek_is_a_view(self):
+        self.ring.write(b'abc')
+        view = self.ring.peek(3)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(view.obj, self.ring.buffer)
+
+    def test_watermarks(self):
+        self.ring.write(b'abcdef')
+        self.assertTrue(self.ring.above_high_watermark)
+        self.ring.consume(4)
+        self.assertFalse(self.ring.above_high_watermark)
+        self.assertTrue(self.ring.below_low_watermark)
+
+    def test_streaming_many_chunks(self):
+        ring = RingBuffer(64 * 1024)
+        chunk = bytes(range(256)) * 64
+        total = 0
+        for _ in range(400):
+            ring.write(chunk)
+            total += len(ring.read(len(chunk)))
+        self.assertEqual(total, 400 * len(chunk))
+
+    def test_storage_is_lazy_and_released_when_drained(self):
+        ring = RingBuffer(64 * 1024)
+        self.assertEqual(ring.allocated, 0)
+        self.assertEqual(ring.peek(10), b'')
+        ring.write(b'x' * 10)
+        self.assertEqual(ring.allocated, 4096)
+        ring.read()
+        self.assertEqual(ring.allocated, 0)
+
+    def test_growth_keeps_wrapped_data(self):
+        ring = RingBuffer(64 * 1024)
+        ring.write(bytes(4000))
+        ring.consume(3000)
+        ring.write(b'a' * 2000)  # wraps inside the first 4 KiB
+        ring.write(b'b' * 5000)  # forces growth
+        self.assertEqual(ring.allocated, 8192)
+        self.assertEqual(ring.read(), bytes(1000) + b'a' * 2000 + b'b' * 5000)
+
+if __name__ == '__main__':
+    unittest.main()
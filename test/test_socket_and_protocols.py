@@ -71,10 +71,13 @@ class TestSocketAndProtocols(unittest.TestCase):
         client_socket = Socket(self.client_ip, self.client_port, SocketType.TCP)
         server_socket.protocol.state = TCPState.ESTABLISHED
         client_socket.protocol.state = TCPState.ESTABLISHED
+        server_socket.protocol.acknowledgment_number = client_socket.protocol.sequence_number
+        client_socket.protocol.acknowledgment_number = server_socket.protocol.sequence_number
 
         # Client sends data
         data = b"Hello, Server!"
-        data_packet = client_socket.send(data)
+        self.assertEqual(client_socket.send(data), len(data))
+        data_packet = client_socket.poll_output()[0]
         self.assertIsNotNone(data_packet)
         self.assertEqual(data_packet['flags'], TCPFlags.PSH | TCPFlags.ACK)
         self.assertEqual(data_packet['data'], data)
@@ -94,6 +97,8 @@ class TestSocketAndProtocols(unittest.TestCase):
         client_socket = Socket(self.client_ip, self.client_port, SocketType.TCP)
         server_socket.protocol.state = TCPState.ESTABLISHED
         client_socket.protocol.state = TCPState.ESTABLISHED
+        server_socket.protocol.acknowledgment_number = client_socket.protocol.sequence_number
+        client_socket.protocol.acknowledgment_number = server_socket.protocol.sequence_number
 
         # Client initiates close
         fin_packet = client_socket.close()
@@ -0,0 +1,199 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
+import unittest
+from unittest.mock import patch
+from src.socket import Socket, SocketType
+from socket_manager import SocketManager
+from packet_parser import PacketParser, ip_to_int
+from flow_table import FlowTable, IPPROTO_TCP, WILDCARD_IP
+from tcp_protocol import TCPFlags, TCPState
+
+
+class TestFlowTable(unittest.TestCase):
+    def setUp(self):
+        self.table = FlowTable()
+
+    def test_established_flow_wins_over_listener(self):
+        listener, flow = object(), object()
+        self.table.add_listener(IPPROTO_TCP, '10.0.0.1', 80, listener)
+        self.table.add_flow(IPPROTO_TCP, '10.0.0.1', 80, '10.0.0.2', 5000, flow)
+        self.assertIs(self.table.lookup(IPPROTO_TCP, '10.0.0.1', 80, '10.0.0.2', 5000), flow)
+        self.assertIs(self.table.lookup(IPPROTO_TCP, '10.0.0.1', 80, '10.0.0.3', 5000), listener)
+
+    def test_wildcard_listener(self):
+        listener = object()
+        self.table.add_listener(IPPROTO_TCP, WILDCARD_IP, 80, listener)
+        self.assertIs(self.table.lookup(IPPROTO_TCP, '10.0.0.9', 80, '10.0.0.2', 5000), listener)
+        self.assertIsNone(self.table.lookup(IPPROTO_TCP, '10.0.0.9', 81, '10.0.0.2', 5000))
+
+    def test_remove_only_matching_endpoint(self):
+        first, second = object(), object()
+        self.table.add_flow(IPPROTO_TCP, '10.0.0.1', 80, '10.0.0.2', 5000, first)
+        self.table.remove_flow(IPPROTO_TCP, '10.0.0.1', 80, '10.0.0.2', 5000, second)
+        self.assertEqual(len(self.table), 1)
+        self.table.remove_flow(IPPROTO_TCP, '10.0.0.1', 80, '10.0.0.2', 5000, first)
+        self.assertEqual(len(self.table), 0)
+
+
+class TestSocketManager(unittest.TestCase):
+    def setUp(self):
+        self.manager = SocketManager()
+        self.parser = PacketParser()
+        self.server_ip = '192.168.1.1'
+        self.client_ip = '192.168.1.2'
+
+    def _ip_packet(self, segment, checksum=0):
+        tcp = dict(segment, data_offset=5, checksum=checksum, urgent_pointer=0)
+        return {
+            'protocol': IPPROTO_TCP,
+            'src_ip': segment['src_ip'],
+            'dst_ip': segment['dst_ip'],
+            'data': self.parser.construct_tcp_packet(tcp),
+        }
+
+    def test_handshake_is_demultiplexed_to_child(self):
+        server = Socket(self.server_ip, 8080, SocketType.TCP)
+        self.manager.add_socket(server)
+        server.listen()
+        client = Socket(self.client_ip, 12345, SocketType.TCP)
+
+        syn = client.connect(self.server_ip, 8080)
+        syn_ack = self.manager.handle_packet(self._ip_packet(syn))
+        self.assertEqual(syn_ack['flags'], TCPFlags.SYN | TCPFlags.ACK)
+        self.assertEqual(len(server.syn_queue), 1)
+        self.assertEqual(len(server.pending_connections), 0)
+
+        ack = client.handle_packet(syn_ack)
+        self.manager.handle_packet(self._ip_packet(ack))
+        child = server.pending_connections[0]
+        self.assertEqual(child.state, TCPState.ESTABLISHED)
+        self.assertEqual(len(server.syn_queue), 0)
+        self.assertIs(self.manager.flow_table.lookup(IPPROTO_TCP, self.server_ip, 8080, self.client_ip, 12345), child)
+        self.assertEqual(server.protocol.state, TCPState.LISTEN)
+
+    def test_parsed_header_is_demultiplexed(self):
+        server = Socket(self.server_ip, 8080, SocketType.TCP)
+        self.manager.add_socket(server)
+        server.listen()
+        syn = Socket(self.client_ip, 12345, SocketType.TCP).connect(self.server_ip, 8080)
+        ip_packet = self._ip_packet(syn)
+        raw = self.parser.construct_ip_packet({
+            'version': 4, 'ihl': 5, 'dscp_ecn': 0, 'total_length': 20 + len(ip_packet['data']),
+            'identification': 0, 'flags_fragment_offset': 0, 'ttl': 64, 'protocol': IPPROTO_TCP,
+            'header_checksum': 0, 'src_ip': self.client_ip, 'dst_ip': self.server_ip, 'data': ip_packet['data']})
+        syn_ack = self.manager.handle_packet(self.parser.parse_ip_header(raw))
+        self.assertEqual(syn_ack['flags'], TCPFlags.SYN | TCPFlags.ACK)
+        self.assertEqual(next(iter(server.syn_queue)).remote_ip, ip_to_int(self.client_ip))
+
+    def test_unmatched_segment_is_reset(self):
+        segment = {'src_ip': self.client_ip, 'dst_ip': self.server_ip, 'src_port': 1, 'dst_port': 2,
+                   'seq_num': 0, 'ack_num': 0, 'flags': TCPFlags.SYN, 'window_size': 0, 'data': b''}
+        reset = self.manager.handle_packet(self._ip_packet(segment))
+        self.assertEqual((reset['flags'], reset['seq_num'], reset['ack_num']), (TCPFlags.RST | TCPFlags.ACK, 0, 1))
+        self.assertEqual((reset['dst_ip'], reset['dst_port']), (self.client_ip, 1))
+        segment.update(flags=TCPFlags.ACK, seq_num=10, ack_num=500)
+        self.assertEqual(self.manager.handle_packet(self._ip_packet(segment))['seq_num'], 500)
+        segment['flags'] = TCPFlags.RST
+        self.assertIsNone(self.manager.handle_packet(self._ip_packet(segment)))
+
+    def test_connect_and_close_update_table(self):
+        client = Socket(self.client_ip, 12345, SocketType.TCP)
+        self.manager.add_socket(client)
+        client.connect(self.server_ip, 8080)
+        self.assertIs(self.manager.flow_table.lookup(IPPROTO_TCP, self.client_ip, 12345, self.server_ip, 8080), client)
+
+        listener = Socket(self.server_ip, 8080, SocketType.TCP)
+        self.manager.add_socket(listener)
+        listener.listen()
+        listener.close()
+        self.assertIsNone(self.manager.flow_table.lookup(IPPROTO_TCP, self.server_ip, 8080, self.client_ip, 1))
+
+    def test_checksum_verification_drops_corrupt_segments(self):
+        manager = SocketManager(verify_checksums=True)
+        server = Socket(self.server_ip, 8080, SocketType.TCP)
+        manager.add_socket(server)
+        server.listen()
+        syn = Socket(self.client_ip, 12345, SocketType.TCP).connect(self.server_ip, 8080)
+
+        self.assertIsNone(manager.handle_packet(self._ip_packet(syn, checksum=0x1234)))
+        self.assertEqual(manager.checksum_drops, 1)
+        syn_ack = manager.handle_packet(self._ip_packet(syn, checksum=None))
+        self.assertEqual(syn_ack['flags'], TCPFlags.SYN | TCPFlags.ACK)
+        self.assertEqual(manager.checksum_drops, 1)
+
+    def test_unsupported_protocol(self):
+        with self.assertRaises(ValueError):
+            self.manager.handle_packet({'protocol': 1, 'src_ip': '', 'dst_ip': '', 'data': b''})
+
+
+class TestListenQueues(unittest.TestCase):
+    def setUp(self):
+        self.server = Socket('192.168.1.1', 8080, SocketType.TCP)
+        self.server.listen(backlog=2)
+        self.server.syn_queue.limit = 2
+
+    def _connect(self, port):
+        client = Socket('192.168.1.2', port, SocketType.TCP)
+        syn_ack = self.server.handle_packet(client.connect('192.168.1.1', 8080))
+        return client, syn_ack
+
+    def _complete(self, client, syn_ack):
+        return self.server.handle_packet(client.handle_packet(syn_ack))
+
+    def test_accept_returns_completed_connection(self):
+        client, syn_ack = self._connect(5000)
+        self.assertIsNone(self.server.accept())
+        self._complete(client, syn_ack)
+        accepted = self.server.accept()
+        self.assertEqual(accepted.protocol.state, TCPState.ESTABLISHED)
+        self.assertEqual(accepted.protocol.sequence_number, client.protocol.acknowledgment_number)
+        self.assertEqual(accepted.protocol.snd_wscale, client.protocol.rcv_wscale)
+
+    def test_data_on_the_final_ack_is_delivered_once(self):
+        client, syn_ack = self._connect(5000)
+        ack = dict(client.handle_packet(syn_ack), data=b'hello', flags=TCPFlags.PSH | TCPFlags.ACK)
+        response = self.server.handle_packet(ack)
+        self.assertEqual(response['ack_num'], (ack['seq_num'] + 5) & 0xFFFFFFFF)
+        self.assertEqual(self.server.accept().recv(64), b'hello')
+
+    def test_syn_queue_overflow_falls_back_to_cookies(self):
+        self._connect(5000)
+        self._connect(5001)
+        client, syn_ack = self._connect(5002)
+        self.assertEqual(len(self.server.syn_queue), 2)
+        self.assertEqual((self.server.syn_queue_overflows, self.server.syn_cookies_sent), (1, 1))
+        self.assertNotIn('window_scale', syn_ack)
+        self._complete(client, syn_ack)
+        accepted = self.server.accept()
+        self.assertEqual(accepted.protocol.state, TCPState.ESTABLISHED)
+        self.assertEqual(accepted.protocol.mss, 1460)
+
+    def test_forged_ack_is_dropped(self):
+        ack = {'src_ip': '192.168.1.2', 'src_port': 6000, 'dst_ip': '192.168.1.1', 'dst_port': 8080,
+               'seq_num': 1, 'ack_num': 12345, 'flags': TCPFlags.ACK, 'window_size': 100, 'data': b''}
+        self.assertIsNone(self.server.handle_packet(ack))
+        self.assertEqual(self.server.syn_cookies_failed, 1)
+        self.assertEqual(len(self.server.pending_connections), 0)
+
+    def test_full_accept_queue_drops_syns(self):
+        for port in (5000, 5001):
+            self._complete(*self._connect(port))
+        self.assertIsNone(self._connect(5002)[1])
+        self.assertEqual((self.server.accept_queue_overflows, self.server.listen_drops), (1, 1))
+        self.assertIsNotNone(self.server.accept())
+        self.assertIsNotNone(self._connect(5002)[1])
+
+    def test_syncookies_disabled_drops_on_overflow(self):
+        with patch.object(Socket, 'syncookies', False):
+            self._connect(5000)
+            self._connect(5001)
+            self.assertIsNone(self._connect(5002)[1])
+        self.assertEqual(self.server.listen_drops, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
+import _socket
+import unittest
+from src.socket import Socket, SocketType
+from config import Config
+from ethernet import ARP_HEADER, ARPHRD_ETHER, ARPOP_REQUEST, ETH_P_ARP, BROADCAST_MAC, ZERO_MAC
+from packet_parser import PacketParser, ETH_HEADER, ETH_P_IP, ip_to_int
+from stack import NetworkStack, flow_hash, flow_owner
+from virtual_device_manager import NetworkInterface, QueueInterface, ReceiveBatch
+
+PARSER = PacketParser()
+PEER_MAC = b'\x02\x00\x00\x00\x00\x02'
+
+
+class FakeDevice(NetworkInterface):
+    def __init__(self):
+        self.incoming = []
+        self.frames = []
+
+    def read(self, length):
+        return self.incoming.pop(0) if self.incoming else b''
+
+    def write(self, data):
+        self.frames.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        pass
+
+    def set_blocking(self, flag):
+        pass
+
+    @property
+    def fd(self):
+        return -1
+
+
+def udp_packet(src_port, payload=b'hello'):
+    udp = PARSER.construct_udp_packet({'src_ip': '192.168.1.2', 'dst_ip': '192.168.1.1', 'src_port': src_port,
+                                       'dst_port': 9000, 'length': 8 + len(payload), 'data': payload})
+    return PARSER.construct_ip_packet({'version': 4, 'ihl': 5, 'dscp_ecn': 0, 'total_length': 20 + len(udp),
+                                       'identification': src_port, 'flags_fragment_offset': 0x4000, 'ttl': 64,
+                                       'protocol': 17, 'src_ip': '192.168.1.2', 'dst_ip': '192.168.1.1', 'data': udp})
+
+
+class TestFlowHash(unittest.TestCase):
+    def test_symmetric_and_spread(self):
+        a, b = ip_to_int('10.0.0.1'), ip_to_int('10.0.0.2')
+        self.assertEqual(flow_hash(a, 80, b, 5000), flow_hash(b, 5000, a, 80))
+        self.assertNotEqual(flow_hash(a, 80, b, 5000), flow_hash(a, 80, b, 5001))
+        counts = [0] * 4
+        for port in range(1024, 5024):
+            counts[flow_hash(a, port, b, 80) % 4] += 1
+        self.assertTrue(all(800 < count < 1200 for count in counts), counts)
+
+
+class TestWorkers(unittest.TestCase):
+    def setUp(self):
+        config = Config()
+        config.set('ip_address', '192.168.1.1')
+        self.channels = [_socket.socketpair(_socket.AF_UNIX, _socket.SOCK_SEQPACKET) for _ in range(2)]
+        for pair in self.channels:
+            self.addCleanup(pair[0].close)
+            self.addCleanup(pair[1].close)
+            pair[1].setblocking(False)
+        outboxes = [outbox for _, outbox in self.channels]
+        self.stacks = [NetworkStack(config, FakeDevice(), index, self.channels[index][0], outboxes) for index in range(2)]
+        self.sockets = []
+        for stack in self.stacks:
+            stack.inbox.setblocking(False)
+            sock = Socket('192.168.1.1', 9000, SocketType.UDP)
+            stack.socket_manager.add_socket(sock)
+            self.sockets.append(sock)
+
+    def test_flows_reach_their_owner(self):
+        ports = range(5000, 5040)
+        for port in ports:
+            self.stacks[0].deliver(PARSER.parse_ip_header(udp_packet(port)))
+        self.stacks[1].handle_channel(self.channels[1][0].fileno())
+        owners = [flow_owner(PARSER.parse_ip_header(udp_packet(port)), 2) for port in ports]
+        self.assertEqual(self.stacks[0].forwarded, owners.count(1))
+        for index, sock in enumerate(self.sockets):
+            received = sock.recv_many(64)
+            self.assertEqual(sorted(d.addr[1] for d in received), [p for p, o in zip(ports, owners) if o == index])
+
+    def test_fragments_are_steered_after_reassembly(self):
+        payload = b'f' * 3000
+        udp = PARSER.construct_udp_packet({'src_ip': '192.168.1.2', 'dst_ip': '192.168.1.1', 'src_port': 6000,
+                                           'dst_port': 9000, 'length': 8 + len(payload), 'data': payload})
+        for offset in range(0, len(udp), 1480):
+            piece = udp[offset:offset + 1480]
+            raw = PARSER.construct_ip_packet({'version': 4, 'ihl': 5, 'dscp_ecn': 0, 'total_length': 20 + len(piece),
+                                              'identification': 9, 'ttl': 64, 'protocol': 17,
+                                              'flags_fragment_offset': (0x2000 if offset + 1480 < len(udp) else 0) | offset // 8,
+                                              'src_ip': '192.168.1.2', 'dst_ip': '192.168.1.1', 'data': piece})
+            self.stacks[0].deliver(PARSER.parse_ip_header(raw))
+        for _ in range(2):
+            for index, stack in enumerate(self.stacks):
+                stack.handle_channel(self.channels[index][0].fileno())
+        owner = flow_owner(PARSER.parse_ip_header(udp_packet(6000)), 2)
+        self.assertEqual(self.sockets[owner].recv(65535), payload)
+        self.assertIsNone(self.sockets[1 - owner].recv(65535))
+
+    def test_arp_is_answered_once_and_learned_everywhere(self):
+        request = (ETH_HEADER.pack(BROADCAST_MAC, PEER_MAC, ETH_P_ARP) +
+                   ARP_HEADER.pack(ARPHRD_ETHER, ETH_P_IP, 6, 4, ARPOP_REQUEST, PEER_MAC, ip_to_int('192.168.1.2'),
+                                   ZERO_MAC, ip_to_int('192.168.1.1')))
+        self.stacks[0].device.incoming.append(request)
+        self.stacks[0].handle_read(-1)
+        self.stacks[1].handle_channel(self.channels[1][0].fileno())
+        self.assertEqual(len(self.stacks[0].device.frames), 1)
+        self.assertEqual(self.stacks[1].device.frames, [])
+        for stack in self.stacks:
+            self.assertEqual(stack.link.neighbours[ip_to_int('192.168.1.2')].mac, PEER_MAC)
+
+
+class TestStackPair(unittest.TestCase):
+    # Two stacks in one process over an in-memory link, driven by hand.
+    def setUp(self):
+        self.stacks = []
+        for index, device in enumerate(QueueInterface.pair(), 1):
+            config = Config()
+            config.set('ip_address', f'10.0.0.{index}')
+            config.set('mac_address', f'02:00:00:00:00:0{index}')
+            self.stacks.append(NetworkStack(config, device))
+
+    def pump(self):
+        for stack in self.stacks:
+            stack.event_loop.timers.advance()
+        while any(stack.device.inbox for stack in self.stacks):
+            for stack in self.stacks:
+                stack.handle_read(-1)
+
+    def test_tcp(self):
+        server, client = self.stacks
+        listener = Socket('10.0.0.1', 80, SocketType.TCP)
+        listener.listen(8)
+        server.socket_manager.add_socket(listener)
+        sock = Socket('10.0.0.2', 40000, SocketType.TCP)
+        client.socket_manager.add_socket(sock)
+        client.transmit(sock.connect('10.0.0.1', 80))
+        self.pump()
+        conn = listener.accept()
+        self.assertIsNotNone(conn)
+        self.assertIs(conn.protocol.timers, server.event_loop.timers)
+        self.assertIs(sock.protocol.timers, client.event_loop.timers)
+        payload = bytes(range(256)) * 64
+        self.assertEqual(sock.send(payload), len(payload))
+        received = b''
+        while len(received) < len(payload):
+            self.pump()
+            received += conn.recv(None) or b''
+        self.assertEqual(received, payload)
+
+    def test_retransmitted_segments_carry_valid_checksums(self):
+        server, client = self.stacks
+        server.socket_manager.verify_checksums = True
+        listener = Socket('10.0.0.1', 80, SocketType.TCP)
+        listener.listen(8)
+        server.socket_manager.add_socket(listener)
+        sock = Socket('10.0.0.2', 40000, SocketType.TCP)
+        client.socket_manager.add_socket(sock)
+        client.transmit(sock.connect('10.0.0.1', 80))
+        self.pump()
+        conn = listener.accept()
+        payload = bytes(range(256)) * 16
+        sock.send(payload)
+        server.device.inbox.clear()  # lost on the wire
+        sock.protocol.on_retransmit_timeout()
+        received = b''
+        while len(received) < len(payload):
+            self.pump()
+            received += conn.recv(None) or b''
+        self.assertEqual(received, payload)
+        self.assertGreater(sock.protocol.retransmissions, 0)
+        self.assertEqual(server.socket_manager.checksum_drops, 0)
+
+    def test_udp(self):
+        server, client = self.stacks
+        receiver = Socket('10.0.0.1', 9000, SocketType.UDP)
+        server.socket_manager.add_socket(receiver)
+        sender = Socket('10.0.0.2', 5000, SocketType.UDP)
+        client.socket_manager.add_socket(sender)
+        sender.send_to(b'resolve', ('10.0.0.1', 9000))
+        self.pump()
+        self.assertEqual(receiver.recv(64), b'resolve')
+        self.assertEqual(sender.send_many([(b'datagram %d' % i, ('10.0.0.1', 9000)) for i in range(100)]), 100)
+        self.pump()
+        self.assertEqual([d.data for d in receiver.recv_many(128)], [b'datagram %d' % i for i in range(100)])
+
+    def test_edge_triggered_read_drains_the_queue(self):
+        server, client = self.stacks
+        receiver = Socket('10.0.0.1', 9000, SocketType.UDP)
+        server.socket_manager.add_socket(receiver)
+        sender = Socket('10.0.0.2', 5000, SocketType.UDP)
+        client.socket_manager.add_socket(sender)
+        sender.send_to(b'resolve', ('10.0.0.1', 9000))
+        self.pump()
+        receiver.recv(64)
+        server.edge_triggered = True
+        server.rx_batch = ReceiveBatch(4)
+        sender.send_many([(b'datagram %d' % i, ('10.0.0.1', 9000)) for i in range(10)])
+        server.handle_read(-1)
+        self.assertEqual(len(receiver.recv_many(16)), 10)
+        self.assertEqual(server.rx_batch.histogram, [0, 0, 1, 0, 2])
+
+if __name__ == '__main__':
+    unittest.main()
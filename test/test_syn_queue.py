@@ -0,0 +1,64 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import unittest
+from syn_queue import HalfOpen, SynQueue, SynCookies, COOKIE_PERIOD
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def syn(port, seq=1000, **options):
+    return dict({'src_ip': '10.0.0.2', 'src_port': port, 'seq_num': seq}, **options)
+
+
+class TestSynQueue(unittest.TestCase):
+    def test_entry_keeps_syn_options(self):
+        entry = HalfOpen('10.0.0.1', syn(5000, mss=1400, window_scale=7, sack_permitted=True), 42, 0.0)
+        self.assertEqual(entry.key, (0x0A000002, 5000, '10.0.0.1'))
+        self.assertEqual((entry.get('mss'), entry.get('window_scale'), entry.get('timestamp')), (1400, 7, None))
+        self.assertEqual(entry.get('window_size', 100), 100)
+        self.assertFalse(hasattr(entry, '__dict__'))
+
+    def test_full_reclaims_expired_entries(self):
+        queue = SynQueue(limit=2, timeout=3.0)
+        queue.add(HalfOpen('10.0.0.1', syn(1), 1, 0.0))
+        queue.add(HalfOpen('10.0.0.1', syn(2), 2, 1.0))
+        self.assertTrue(queue.full(2.0))
+        self.assertFalse(queue.full(3.5))
+        self.assertEqual([entry.remote_port for entry in queue], [2])
+
+
+class TestSynCookies(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cookies = SynCookies(b'k' * 16, self.clock)
+        self.flow = ('10.0.0.1', 80, '10.0.0.2', 5000)
+
+    def test_round_trip_encodes_mss(self):
+        cookie = self.cookies.encode(*self.flow, 1000, 1460)
+        self.assertEqual(self.cookies.decode(*self.flow, 1000, cookie), 1460)
+        cookie = self.cookies.encode(*self.flow, 0xFFFFFFFF, 1350)
+        self.assertEqual(self.cookies.decode(*self.flow, 0xFFFFFFFF, cookie), 1300)
+
+    def test_forged_or_mismatched_cookie_is_rejected(self):
+        cookie = self.cookies.encode(*self.flow, 1000, 1460)
+        self.assertIsNone(self.cookies.decode('10.0.0.1', 80, '10.0.0.3', 5000, 1000, cookie))
+        self.assertIsNone(self.cookies.decode(*self.flow, 1000, cookie ^ (1 << 20)))
+
+    def test_cookie_expires(self):
+        cookie = self.cookies.encode(*self.flow, 1000, 1460)
+        self.clock.now += COOKIE_PERIOD
+        self.assertEqual(self.cookies.decode(*self.flow, 1000, cookie), 1460)
+        self.clock.now += COOKIE_PERIOD
+        self.assertIsNone(self.cookies.decode(*self.flow, 1000, cookie))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,18 @@ import sys
 import os
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
 sys.path.insert(0, project_root)
 
 
 import unittest
 from unittest.mock import Mock
-from src.tcp_protocol import TCPProtocol, TCPState, TCPFlags
+from src.tcp_protocol import TCPProtocol, TCPState, TCPFlags, RTO_INITIAL, RTO_MIN
+from timer_wheel import TimerWheel
+from packet_parser import PacketParser
+from src.socket import Socket, SocketType, TCP_QUICKACK, TCP_NODELAY, TCP_CORK
+
+SEGMENT = 1460 - 12  # payload of a full segment: the default MSS less the timestamp option
 
 class TestTCPProtocol(unittest.TestCase):
     def setUp(self):
@@ -26,12 +32,16 @@ class TestTCPProtocol(unittest.TestCase):
         self.assertEqual(response['flags'], TCPFlags.SYN | TCPFlags.ACK)
 
     def test_handle_syn_ack_in_syn_sent_state(self):
-        self.tcp.state = TCPState.SYN_SENT
-        packet = {'flags': TCPFlags.SYN | TCPFlags.ACK, 'seq_num': 2000, 'ack_num': self.tcp.sequence_number + 1}
+        iss = self.tcp.sequence_number
+        self.tcp.connect()
+        self.assertIsNone(self.tcp.handle_packet({'flags': TCPFlags.SYN | TCPFlags.ACK, 'seq_num': 2000, 'ack_num': iss}))
+        packet = {'flags': TCPFlags.SYN | TCPFlags.ACK, 'seq_num': 2000, 'ack_num': (iss + 1) & 0xFFFFFFFF}
         response = self.tcp.handle_packet(packet)
         self.assertEqual(self.tcp.state, TCPState.ESTABLISHED)
         self.assertEqual(self.tcp.acknowledgment_number, 2001)
         self.assertEqual(response['flags'], TCPFlags.ACK)
+        self.assertEqual(self.tcp.snd_una, self.tcp.sequence_number)
+        self.assertIsNone(self.tcp.retransmit_queue)
 
     def test_handle_ack_in_syn_received_state(self):
         self.tcp.state = TCPState.SYN_RECEIVED
@@ -42,12 +52,33 @@ class TestTCPProtocol(unittest.TestCase):
 
     def test_handle_fin_in_established_state(self):
         self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.acknowledgment_number = 4000
         packet = {'flags': TCPFlags.FIN, 'seq_num': 4000}
         response = self.tcp.handle_packet(packet)
         self.assertEqual(self.tcp.state, TCPState.CLOSE_WAIT)
         self.assertEqual(self.tcp.acknowledgment_number, 4001)
         self.assertEqual(response['flags'], TCPFlags.ACK)
 
+    def test_fin_with_data_keeps_the_data(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.acknowledgment_number = 4000
+        self.tcp.send(b'request')
+        packet = {'flags': TCPFlags.FIN | TCPFlags.ACK, 'seq_num': 4000, 'ack_num': self.tcp.sequence_number,
+                  'data': b'hello'}
+        response = self.tcp.handle_packet(packet)
+        self.assertEqual(self.tcp.state, TCPState.CLOSE_WAIT)
+        self.assertEqual(response['ack_num'], 4006)
+        self.assertEqual(self.tcp.get_received_data(), b'hello')
+        self.assertEqual(self.tcp.snd_una, self.tcp.sequence_number)
+
+    def test_fin_past_a_hole_is_not_consumed(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.acknowledgment_number = 4000
+        response = self.tcp.handle_packet({'flags': TCPFlags.FIN | TCPFlags.ACK, 'seq_num': 4100,
+                                           'ack_num': self.tcp.sequence_number, 'data': b'tail'})
+        self.assertEqual(self.tcp.state, TCPState.ESTABLISHED)
+        self.assertEqual(response['ack_num'], 4000)
+
     def test_connect(self):
         response = self.tcp.connect()
         self.assertEqual(self.tcp.state, TCPState.SYN_SENT)
@@ -62,18 +93,569 @@ class TestTCPProtocol(unittest.TestCase):
     def test_send_data(self):
         self.tcp.state = TCPState.ESTABLISHED
         data = b'Hello, World!'
-        response = self.tcp.send(data)
+        self.assertEqual(self.tcp.send(data), len(data))
+        response = self.tcp.poll_output()[0]
         self.assertIn(data, response['data'])
         self.assertEqual(response['flags'], TCPFlags.PSH | TCPFlags.ACK)
 
+    def test_in_order_data_is_buffered(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.acknowledgment_number = 5000
+        packet = {'flags': TCPFlags.PSH | TCPFlags.ACK, 'seq_num': 5000, 'ack_num': self.tcp.sequence_number, 'data': b'abcdef'}
+        response = self.tcp.handle_packet(packet)
+        self.assertEqual(response['ack_num'], 5006)
+        self.assertEqual(self.tcp.get_received_data(4), b'abcd')
+        self.assertEqual(self.tcp.get_received_data(), b'ef')
+
+    def test_send_fills_peer_window(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.snd_wnd = 4000
+        iss = self.tcp.sequence_number
+        data = bytes(range(256)) * 20
+        self.assertEqual(self.tcp.send(data), len(data))
+        packets = self.tcp.poll_output()
+        self.assertEqual([len(p['data']) for p in packets], [SEGMENT, SEGMENT, 4000 - 2 * SEGMENT])
+        self.assertEqual(packets[1]['seq_num'], (iss + SEGMENT) & 0xFFFFFFFF)
+        self.assertEqual(b''.join(p['data'] for p in packets), data[:4000])
+        self.assertFalse(packets[-1]['flags'] & TCPFlags.PSH)
+        self.assertEqual(self.tcp.poll_output(), [])
+
+    def test_full_segments_fit_the_mtu_with_their_options(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.acknowledgment_number = 5000
+        self.tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 5100, 'ack_num': self.tcp.sequence_number,
+                                'data': b'x' * 100})  # a hole, so outgoing segments carry a SACK block
+        self.tcp.send(bytes(3 * SEGMENT))
+        parser = PacketParser()
+        packets = self.tcp.poll_output()
+        self.assertEqual(len(packets[0]['data']), SEGMENT - 12)
+        for packet in packets:
+            segment = parser.construct_tcp_packet(dict(packet, data_offset=5, checksum=0, urgent_pointer=0))
+            self.assertLessEqual(20 + len(segment), 1500)
+
+    def test_cumulative_ack_advances_window(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.snd_wnd = 2 * SEGMENT
+        iss = self.tcp.sequence_number
+        data = bytes(5000)
+        self.tcp.send(data)
+        self.assertEqual(len(self.tcp.poll_output()), 2)
+        ack = {'flags': TCPFlags.ACK, 'seq_num': 0, 'ack_num': (iss + SEGMENT) & 0xFFFFFFFF, 'window_size': 2 * SEGMENT}
+        self.assertIsNone(self.tcp.handle_packet(ack))
+        self.assertEqual(self.tcp.snd_una, (iss + SEGMENT) & 0xFFFFFFFF)
+        self.assertEqual(len(self.tcp.send_buffer), 5000 - SEGMENT)
+        packets = self.tcp.poll_output()
+        self.assertEqual([p['seq_num'] for p in packets], [(iss + 2 * SEGMENT) & 0xFFFFFFFF])
+
+    def test_ack_outside_window_is_ignored(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        iss = self.tcp.sequence_number
+        self.tcp.send(b'abc')
+        self.tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 0, 'ack_num': (iss + 100) & 0xFFFFFFFF})
+        self.assertEqual(self.tcp.snd_una, iss)
+        self.assertEqual(len(self.tcp.send_buffer), 3)
+
+    def test_send_returns_bytes_accepted(self):
+        self.tcp.state = TCPState.ESTABLISHED
+        capacity = self.tcp.send_buffer.capacity
+        self.assertEqual(self.tcp.send(bytes(capacity + 100)), capacity)
+        with self.assertRaises(BlockingIOError):
+            self.tcp.send(b'x')
+        self.assertEqual(self.tcp.send(b''), 0)
+
+    def test_send_before_connect_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.tcp.send(b'x')
+
     def test_receive_data(self):
         self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.acknowledgment_number = 5000
         data = b'Received data'
-        packet = {'data': data, 'seq_num': 5000}
-        response = self.tcp.receive(packet)
+        packet = {'flags': TCPFlags.ACK, 'data': data, 'seq_num': 5000, 'ack_num': self.tcp.sequence_number}
+        response = self.tcp.handle_packet(packet)
         self.assertEqual(self.tcp.get_received_data(), data)
         self.assertEqual(response['flags'], TCPFlags.ACK)
         self.assertEqual(self.tcp.acknowledgment_number, 5000 + len(data))
 
+
+def configured(**knobs):
+    # Stack-wide knobs are class attributes, so tests set them on a throwaway subclass.
+    return type('TCPProtocol', (TCPProtocol,), knobs)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetransmission(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sent = []
+        self.tcp = configured(clock=self.clock)('192.168.1.1', 12345, '192.168.1.2', 80)
+        self.tcp.timers = TimerWheel(resolution=0.01, clock=self.clock)
+        self.tcp.output = self.sent.append
+        self.tcp.state = TCPState.ESTABLISHED
+        self.iss = self.tcp.sequence_number
+
+    def _send(self, data):
+        # Sends data and returns the first flight, leaving self.sent for what follows.
+        self.tcp.send(data)
+        flight, self.sent[:] = self.sent[:], []
+        return flight
+
+    def _seq(self, offset):
+        return (self.iss + offset) & 0xFFFFFFFF
+
+    def _ack(self, offset, sack=None):
+        packet = {'flags': TCPFlags.ACK, 'seq_num': 0, 'ack_num': self._seq(offset), 'window_size': 65535}
+        if sack:
+            packet['sack_blocks'] = [(self._seq(left), self._seq(right)) for left, right in sack]
+        return self.tcp.handle_packet(packet)
+
+    def test_rtt_estimator(self):
+        self.tcp.send(b'x' * 100)
+        self.clock.now += 0.1
+        self._ack(100)
+        self.assertAlmostEqual(self.tcp.srtt, 0.1)
+        self.assertAlmostEqual(self.tcp.rttvar, 0.05)
+        self.assertAlmostEqual(self.tcp.rto, 0.3)
+        self.tcp.send(b'x' * 100)
+        self.clock.now += 0.02
+        self._ack(200)
+        self.assertAlmostEqual(self.tcp.srtt, 0.09)
+        self.assertAlmostEqual(self.tcp.rto, max(0.09 + 4 * self.tcp.rttvar, RTO_MIN))
+
+    def test_timeout_retransmits_and_backs_off(self):
+        self._send(b'a' * 1000)
+        self.clock.now += RTO_INITIAL + 0.02
+        self.tcp.timers.advance()
+        self.assertEqual(self.tcp.timeouts, 1)
+        self.assertEqual([(p['seq_num'], len(p['data'])) for p in self.sent], [(self.iss, 1000)])
+        self.assertEqual(self.tcp.rto, 2 * RTO_INITIAL)
+        self.assertEqual(self.tcp.congestion.cwnd, SEGMENT)
+        # Karn's rule: the ACK of a retransmitted segment gives no RTT sample.
+        self._ack(1000)
+        self.assertIsNone(self.tcp.srtt)
+        self.assertEqual(len(self.tcp.timers), 0)
+
+    def test_fast_retransmit_after_three_dupacks(self):
+        self._send(bytes(SEGMENT * 5))
+        self._ack(SEGMENT)
+        for _ in range(3):
+            self._ack(SEGMENT)
+        self.assertTrue(self.tcp.in_recovery)
+        self.assertEqual([(p['seq_num'], len(p['data'])) for p in self.sent], [(self._seq(SEGMENT), SEGMENT)])
+        self.assertEqual(self.tcp.retransmissions, 1)
+        # A partial ACK retransmits the next hole; a full ACK ends recovery.
+        self._ack(2 * SEGMENT)
+        self.assertEqual(self.sent[-1]['seq_num'], self._seq(2 * SEGMENT))
+        self._ack(SEGMENT * 5)
+        self.assertFalse(self.tcp.in_recovery)
+        self.assertEqual(self.tcp.lost_bytes, 0)
+
+    def test_ack_sends_what_cwnd_held_back(self):
+        self.assertEqual(len(self._send(bytes(SEGMENT * 12))), 10)
+        self.assertEqual(self.tcp.sequence_number, self._seq(SEGMENT * 10))  # initial cwnd
+        self._ack(2 * SEGMENT)
+        self.assertEqual([(p['seq_num'], len(p['data'])) for p in self.sent],
+                         [(self._seq(SEGMENT * 10), SEGMENT), (self._seq(SEGMENT * 11), SEGMENT)])
+
+    def test_close_sends_fin_behind_buffered_data(self):
+        self._send(bytes(SEGMENT * 12))
+        self.assertEqual(self.tcp.close(), [])  # cwnd is full, so the tail and the FIN wait
+        self.assertEqual(self.tcp.state, TCPState.FIN_WAIT_1)
+        self._ack(SEGMENT * 10)
+        self.assertEqual(self.tcp.state, TCPState.FIN_WAIT_1)
+        self.assertEqual([(p['seq_num'], len(p['data']), p['flags'] & TCPFlags.FIN) for p in self.sent],
+                         [(self._seq(SEGMENT * 10), SEGMENT, 0), (self._seq(SEGMENT * 11), SEGMENT, TCPFlags.FIN)])
+        self._ack(SEGMENT * 12 + 1)
+        self.assertEqual(self.tcp.state, TCPState.FIN_WAIT_2)
+
+    def test_lost_fin_is_retransmitted(self):
+        self.tcp.close()
+        self.clock.now += RTO_INITIAL + 0.02
+        self.tcp.timers.advance()
+        self.assertEqual([(p['seq_num'], p['flags']) for p in self.sent], [(self.iss, TCPFlags.FIN | TCPFlags.ACK)])
+        self._ack(1)
+        self.assertEqual(self.tcp.state, TCPState.FIN_WAIT_2)
+        self.assertEqual(len(self.tcp.timers), 0)
+
+    def test_fin_is_retransmitted_with_its_data(self):
+        self.tcp.set_cork(True)
+        self.tcp.send(b'x' * 100)
+        [packet] = self.tcp.close()
+        self.assertEqual((len(packet['data']), packet['flags'] & TCPFlags.FIN), (100, TCPFlags.FIN))
+        self.clock.now += RTO_INITIAL + 0.02
+        self.tcp.timers.advance()
+        self.assertEqual([(p['seq_num'], p['data'], p['flags'] & TCPFlags.FIN) for p in self.sent],
+                         [(self.iss, b'x' * 100, TCPFlags.FIN)])
+
+    def test_retransmission_patches_the_first_checksum(self):
+        parser = PacketParser()
+        [packet] = self._send(b'x' * 100)
+        wire = parser.construct_tcp_packet({'data_offset': 5, 'urgent_pointer': 0, **packet})
+        packet['record'].checksum = int.from_bytes(wire[16:18], 'big')  # as the stack does
+        self.tcp.acknowledgment_number += 7
+        self.clock.now += RTO_INITIAL + 0.02
+        self.tcp.timers.advance()
+        [packet] = self.sent
+        self.assertIsNotNone(packet.get('checksum'))
+        fields = {'data_offset': 5, 'urgent_pointer': 0, **packet}
+        self.assertEqual(parser.construct_tcp_packet(fields), parser.construct_tcp_packet({**fields, 'checksum': None}))
+
+    def test_retransmission_drops_sack_blocks_that_do_not_fit(self):
+        self._send(bytes(SEGMENT))
+        self.tcp.acknowledgment_number = 5000
+        self.tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 5100, 'ack_num': self.iss, 'data': b'x' * 100})
+        self.clock.now += RTO_INITIAL + 0.02
+        self.tcp.timers.advance()
+        [packet] = self.sent
+        self.assertEqual(len(packet['data']), SEGMENT)
+        self.assertNotIn('sack_blocks', packet)
+
+    def test_lost_syn_is_retransmitted_with_backoff(self):
+        tcp = configured(clock=self.clock)('192.168.1.1', 12345, '192.168.1.2', 80)
+        tcp.timers, tcp.output = self.tcp.timers, self.sent.append
+        iss = tcp.sequence_number
+        syn = tcp.connect()
+        for rto in (RTO_INITIAL, 2 * RTO_INITIAL):
+            self.clock.now += rto + 0.02
+            tcp.timers.advance()
+        self.assertEqual([(p['seq_num'], p['flags'], p['mss']) for p in self.sent], [(iss, TCPFlags.SYN, syn['mss'])] * 2)
+        self.assertEqual(tcp.rto, 4 * RTO_INITIAL)
+        tcp.handle_packet({'flags': TCPFlags.SYN | TCPFlags.ACK, 'seq_num': 7000, 'ack_num': (iss + 1) & 0xFFFFFFFF,
+                           'window_size': 65535, 'mss': 1460})
+        self.assertEqual(tcp.state, TCPState.ESTABLISHED)
+        self.assertFalse(tcp.in_recovery)
+        self.assertEqual(len(tcp.timers), 0)
+
+    def test_simultaneous_close_goes_through_closing(self):
+        self.tcp.acknowledgment_number = 7000
+        self.tcp.close()
+        self.tcp.handle_packet({'flags': TCPFlags.FIN | TCPFlags.ACK, 'seq_num': 7000, 'ack_num': self.iss,
+                                'window_size': 65535})
+        self.assertEqual(self.tcp.state, TCPState.CLOSING)
+        self.assertEqual(self.tcp.acknowledgment_number, 7001)
+        self._ack(1)
+        self.assertEqual(self.tcp.state, TCPState.TIME_WAIT)
+
+    def test_sack_retransmits_only_holes(self):
+        self._send(bytes(SEGMENT * 6))
+        # Segments 1 and 3 are lost; 2, 4 and 5 arrive.
+        self._ack(0, [(SEGMENT, 2 * SEGMENT)])
+        self._ack(0, [(SEGMENT, 2 * SEGMENT), (3 * SEGMENT, 4 * SEGMENT)])
+        self._ack(0, [(SEGMENT, 2 * SEGMENT), (3 * SEGMENT, 5 * SEGMENT)])
+        self.assertTrue(self.tcp.in_recovery)
+        self.assertEqual([p['seq_num'] for p in self.sent], [self._seq(0), self._seq(2 * SEGMENT)])
+        self.assertEqual(self.tcp.sacked_bytes, SEGMENT * 3)
+
+    def test_receiver_generates_sack_blocks(self):
+        self.tcp.acknowledgment_number = 5000
+        data = {'flags': TCPFlags.ACK, 'ack_num': self.iss}
+        response = self.tcp.handle_packet(dict(data, seq_num=5100, data=b'b' * 100))
+        self.assertEqual(response['ack_num'], 5000)
+        self.assertEqual(response['sack_blocks'], [(5100, 5200)])
+        response = self.tcp.handle_packet(dict(data, seq_num=5300, data=b'd' * 100))
+        self.assertEqual(response['sack_blocks'], [(5300, 5400), (5100, 5200)])
+        response = self.tcp.handle_packet(dict(data, seq_num=5000, data=b'a' * 100))
+        self.assertEqual(response['ack_num'], 5200)
+        self.assertEqual(response['sack_blocks'], [(5300, 5400)])
+        response = self.tcp.handle_packet(dict(data, seq_num=5200, data=b'c' * 100))
+        self.assertEqual(response['ack_num'], 5400)
+        self.assertNotIn('sack_blocks', response)
+        self.assertEqual(self.tcp.get_received_data(), b'a' * 100 + b'b' * 100 + b'c' * 100 + b'd' * 100)
+
+    def test_sack_option_round_trip(self):
+        parser = PacketParser()
+        segment = parser.construct_tcp_packet({
+            'src_port': 1, 'dst_port': 2, 'seq_num': 3, 'ack_num': 4, 'data_offset': 5, 'flags': TCPFlags.ACK,
+            'window_size': 100, 'checksum': 0, 'urgent_pointer': 0, 'data': b'xy',
+            'sack_blocks': [(10, 20), (30, 40)]})
+        header = parser.parse_tcp_header(segment)
+        self.assertEqual(header.data_offset, 40)
+        self.assertEqual(header.sack_blocks, [(10, 20), (30, 40)])
+        self.assertEqual(bytes(header.data), b'xy')
+
+    def test_reordered_segments_are_reassembled(self):
+        self.tcp.acknowledgment_number = 5000
+        data = {'flags': TCPFlags.ACK, 'ack_num': self.iss}
+        payload = bytes(range(200))
+        for seq in (5150, 5050, 5100):
+            self.tcp.handle_packet(dict(data, seq_num=seq, data=payload[seq - 5000:seq - 4950]))
+        self.assertEqual(self.tcp.acknowledgment_number, 5000)
+        response = self.tcp.handle_packet(dict(data, seq_num=5000, data=payload[:60]))
+        self.assertEqual(response['ack_num'], 5200)
+        self.assertEqual(self.tcp.get_received_data(), payload)
+        self.assertEqual(len(self.tcp.out_of_order), 0)
+
+    def test_receive_window_tracks_free_space(self):
+        self.tcp.acknowledgment_number = 5000
+        window = self.tcp._create_ack_packet()['window_size']
+        response = self.tcp.handle_packet({'flags': TCPFlags.ACK, 'ack_num': self.iss, 'seq_num': 5000,
+                                           'data': bytes(4096)})
+        self.assertEqual(response['window_size'], window - (4096 >> self.tcp.rcv_wscale))
+        self.tcp.get_received_data()
+        self.assertEqual(self.tcp._create_ack_packet()['window_size'], window)
+
+    def test_data_beyond_window_is_not_queued(self):
+        self.tcp.acknowledgment_number = 5000
+        self.tcp.handle_packet({'flags': TCPFlags.ACK, 'ack_num': self.iss,
+                                'seq_num': 5000 + self.tcp.recv_buffer.free - 10, 'data': bytes(100)})
+        self.assertEqual(len(self.tcp.out_of_order), 10)
+
+
+class TestDelayedAck(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sent = []
+        self.tcp = TCPProtocol('192.168.1.1', 12345, '192.168.1.2', 80)
+        self.tcp.timers = TimerWheel(resolution=0.01, clock=self.clock)
+        self.tcp.output = self.sent.append
+        self.tcp.state = TCPState.ESTABLISHED
+        self.tcp.acknowledgment_number = 1000
+
+    def _data(self, seq, length, flags=TCPFlags.ACK):
+        return self.tcp.handle_packet({'flags': flags, 'seq_num': seq, 'ack_num': self.tcp.sequence_number,
+                                       'data': b'x' * length})
+
+    def test_every_second_full_segment_is_acked(self):
+        self.assertIsNone(self._data(1000, 1460))
+        response = self._data(2460, 1460)
+        self.assertEqual(response['ack_num'], 3920)
+        self.assertEqual(self.tcp.acks_saved, 1)
+        self.assertEqual(len(self.tcp.timers), 0)
+
+    def test_timeout_sends_ack(self):
+        self.assertIsNone(self._data(1000, 100, TCPFlags.PSH | TCPFlags.ACK))
+        self.clock.now += 0.02
+        self.tcp.timers.advance()
+        self.assertEqual(self.sent, [])
+        self.clock.now += 0.03
+        self.tcp.timers.advance()
+        self.assertEqual([p['ack_num'] for p in self.sent], [1100])
+        self.assertEqual(self.tcp.acks_saved, 0)
+
+    def test_out_of_order_is_acked_immediately(self):
+        self.assertIsNone(self._data(1000, 100))
+        response = self._data(1200, 100)
+        self.assertEqual(response['ack_num'], 1100)
+        self.assertEqual(self._data(1100, 100)['ack_num'], 1300)
+
+    def test_ack_piggybacks_on_reply(self):
+        self.assertIsNone(self._data(1000, 100))
+        self.tcp.send(b'response')
+        [reply] = self.sent
+        self.assertEqual(reply['ack_num'], 1100)
+        self.assertEqual(self.tcp.acks_saved, 1)
+        self.clock.now += 0.1
+        self.tcp.timers.advance()
+        self.assertEqual(self.sent, [reply])
+
+    def test_quickack_socket_option(self):
+        socket = Socket('192.168.1.1', 12345, SocketType.TCP)
+        self.assertEqual(socket.getsockopt(TCP_QUICKACK), 0)
+        socket.setsockopt(TCP_QUICKACK, 1)
+        self.assertFalse(socket.protocol.delayed_ack)
+        self.assertEqual(socket.getsockopt(TCP_QUICKACK), 1)
+
+
+class TestSendCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.tcp = TCPProtocol('192.168.1.1', 12345, '192.168.1.2', 80)
+        self.tcp.state = TCPState.ESTABLISHED
+        self.iss = self.tcp.sequence_number
+
+    def _ack(self, offset):
+        self.tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 0, 'ack_num': (self.iss + offset) & 0xFFFFFFFF,
+                                'window_size': 65535})
+
+    def _send(self, data):
+        self.tcp.send(data)
+        return self.tcp.poll_output()
+
+    def test_nagle_coalesces_small_writes(self):
+        self.assertEqual(len(self._send(b'a' * 10)), 1)
+        self.assertEqual(self._send(b'b' * 10), [])
+        self.assertEqual(self._send(b'c' * 10), [])
+        self._ack(10)
+        packets = self.tcp.poll_output()
+        self.assertEqual([p['data'] for p in packets], [b'b' * 10 + b'c' * 10])
+
+    def test_full_segments_are_not_delayed_by_nagle(self):
+        self._send(b'a')
+        packets = self._send(bytes(SEGMENT * 2 + 5))
+        self.assertEqual([len(p['data']) for p in packets], [SEGMENT, SEGMENT])
+
+    def test_nodelay_sends_immediately(self):
+        self.tcp.set_nodelay(True)
+        self._send(b'a' * 10)
+        self.assertEqual(len(self._send(b'b' * 10)), 1)
+
+    def test_cork_holds_until_full_segment(self):
+        self.tcp.set_cork(True)
+        self.assertEqual(self._send(b'a' * 1000), [])
+        packets = self._send(b'b' * 1000)
+        self.assertEqual([len(p['data']) for p in packets], [SEGMENT])
+        self.tcp.set_cork(False)
+        self.assertEqual([len(p['data']) for p in self.tcp.poll_output()], [2000 - SEGMENT])
+
+    def test_socket_options(self):
+        socket = Socket('192.168.1.1', 12345, SocketType.TCP)
+        socket.setsockopt(TCP_NODELAY, 1)
+        socket.setsockopt(TCP_CORK, 1)
+        self.assertEqual((socket.getsockopt(TCP_NODELAY), socket.getsockopt(TCP_CORK)), (1, 1))
+        self.assertTrue(socket.protocol.nodelay and socket.protocol.cork)
+
+
+class TestDispatch(unittest.TestCase):
+    def _established(self, protocol_class=TCPProtocol):
+        tcp = protocol_class('192.168.1.1', 80, '192.168.1.2', 5000)
+        tcp.state = TCPState.ESTABLISHED
+        tcp.acknowledgment_number = 5000
+        tcp.snd_wnd = 20000
+        return tcp
+
+    def test_table_follows_first_matching_rule(self):
+        dispatch = TCPProtocol.dispatch
+        self.assertIs(dispatch[TCPState.ESTABLISHED][TCPFlags.FIN | TCPFlags.ACK], TCPProtocol._handle_fin)
+        self.assertIs(dispatch[TCPState.FIN_WAIT_1][TCPFlags.FIN | TCPFlags.ACK], TCPProtocol._handle_fin)
+        self.assertIs(dispatch[TCPState.FIN_WAIT_1][TCPFlags.ACK], TCPProtocol._handle_established_ack)
+        self.assertIs(dispatch[TCPState.ESTABLISHED][TCPFlags.RST | TCPFlags.ACK], TCPProtocol._handle_rst)
+        self.assertIsNone(dispatch[TCPState.TIME_WAIT][TCPFlags.RST])
+        self.assertIsNone(dispatch[TCPState.SYN_SENT][TCPFlags.SYN])
+        self.assertIsNone(dispatch[TCPState.LISTEN][TCPFlags.SYN])  # the listening Socket answers SYNs
+        self.assertIsNone(dispatch[TCPState.TIME_WAIT][TCPFlags.ACK])
+
+    def test_predicted_segments_skip_dispatch(self):
+        tcp = self._established(configured(dispatch=()))
+        iss = tcp.sequence_number
+        tcp.send(b'x' * 1000)
+        tcp.poll_output()
+        self.assertIsNone(tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 5000, 'ack_num': (iss + 1000) & 0xFFFFFFFF,
+                                             'window_size': 20000, 'data': b''}))
+        self.assertEqual(tcp.snd_una, (iss + 1000) & 0xFFFFFFFF)
+        response = tcp.handle_packet({'flags': TCPFlags.PSH | TCPFlags.ACK, 'seq_num': 5000, 'ack_num': tcp.snd_una,
+                                      'window_size': 20000, 'data': b'abc'})
+        self.assertEqual(response['ack_num'], 5003)
+        self.assertEqual(tcp.get_received_data(), b'abc')
+
+    def test_data_after_our_fin_is_received(self):
+        tcp = self._established()
+        tcp.close()
+        tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 5000, 'ack_num': tcp.sequence_number, 'data': b''})
+        self.assertEqual(tcp.state, TCPState.FIN_WAIT_2)
+        response = tcp.handle_packet({'flags': TCPFlags.PSH | TCPFlags.ACK, 'seq_num': 5000,
+                                      'ack_num': tcp.sequence_number, 'data': b'late'})
+        self.assertEqual(response['ack_num'], 5004)
+        self.assertEqual(tcp.get_received_data(), b'late')
+
+    def test_rst_resets_only_at_rcv_nxt(self):
+        tcp = self._established()
+        tcp.send(b'x' * 100)
+        self.assertIsNone(tcp.handle_packet({'flags': TCPFlags.RST, 'seq_num': 5000 - 10}))
+        challenge = tcp.handle_packet({'flags': TCPFlags.RST, 'seq_num': 5010})
+        self.assertEqual((challenge['flags'], challenge['ack_num']), (TCPFlags.ACK, 5000))
+        self.assertEqual(tcp.state, TCPState.ESTABLISHED)
+        self.assertIsNone(tcp.handle_packet({'flags': TCPFlags.RST | TCPFlags.ACK, 'seq_num': 5000, 'ack_num': 0}))
+        self.assertEqual(tcp.state, TCPState.CLOSED)
+        self.assertIsNone(tcp.retransmit_queue)
+        self.assertEqual(tcp.poll_output(), [])
+
+    def test_abort_sends_rst_and_drops_buffered_data(self):
+        tcp = self._established()
+        tcp.set_cork(True)
+        tcp.send(b'x' * 100)
+        reset = tcp.abort()
+        self.assertEqual((reset['flags'], reset['seq_num']), (TCPFlags.RST, tcp.sequence_number))
+        self.assertEqual((tcp.state, len(tcp.send_buffer)), (TCPState.CLOSED, 0))
+        self.assertIsNone(tcp.abort())
+
+    def test_rst_refuses_a_connection_only_if_it_acks_the_syn(self):
+        tcp = TCPProtocol('192.168.1.1', 5000, '192.168.1.2', 80)
+        tcp.connect()
+        tcp.handle_packet({'flags': TCPFlags.RST | TCPFlags.ACK, 'seq_num': 0, 'ack_num': tcp.snd_una})
+        self.assertEqual(tcp.state, TCPState.SYN_SENT)
+        tcp.handle_packet({'flags': TCPFlags.RST | TCPFlags.ACK, 'seq_num': 0, 'ack_num': tcp.sequence_number})
+        self.assertEqual(tcp.state, TCPState.CLOSED)
+
+    def test_unpredicted_segments_take_slow_path(self):
+        tcp = self._established()
+        iss = tcp.sequence_number
+        tcp.send(b'x' * 1000)
+        tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 5000, 'ack_num': (iss + 500) & 0xFFFFFFFF,
+                           'window_size': 30000, 'data': b''})
+        self.assertEqual(tcp.snd_wnd, 30000)  # a window update is not predicted
+        tcp.handle_packet({'flags': TCPFlags.ACK, 'seq_num': 5100, 'ack_num': tcp.snd_una,
+                           'window_size': 30000, 'data': b'late'})
+        self.assertEqual(len(tcp.out_of_order), 4)
+        response = tcp.handle_packet({'flags': TCPFlags.FIN | TCPFlags.ACK, 'seq_num': 5000, 'ack_num': tcp.snd_una,
+                                      'window_size': 30000, 'data': b''})
+        self.assertEqual(tcp.state, TCPState.CLOSE_WAIT)
+        self.assertEqual(response['ack_num'], 5001)
+
+class TestOptionNegotiation(unittest.TestCase):
+    def setUp(self):
+        self.parser = PacketParser()
+        self.client = TCPProtocol('192.168.1.2', 5000, '192.168.1.1', 80)
+        self.server = TCPProtocol('192.168.1.1', 80, '192.168.1.2', 5000)
+
+    def _wire(self, packet):
+        # Round trip through the real encoder so the options are parsed from bytes.
+        segment = self.parser.construct_tcp_packet(dict(packet, data_offset=5, checksum=0, urgent_pointer=0))
+        return self.parser.parse_tcp_header(segment, packet)
+
+    def _handshake(self):
+        syn = self._wire(self.client.connect())
+        syn_ack = self._wire(self.server.handle_packet(syn))
+        self.client.handle_packet(syn_ack)
+        return syn, syn_ack
+
+    def test_all_options_negotiated(self):
+        self.server = configured(default_mss=1000)('192.168.1.1', 80, '192.168.1.2', 5000)
+        syn, syn_ack = self._handshake()
+        self.assertEqual((syn.mss, syn.window_scale, syn.sack_permitted), (1460, 3, True))
+        self.assertEqual(syn_ack.timestamp[1], syn.timestamp[0])
+        self.assertEqual((self.client.mss, self.server.mss), (1000, 1000))
+        self.assertEqual(self.client.congestion.mss, 1000 - 12)  # less the timestamp option
+        self.assertEqual((self.client.snd_wscale, self.server.snd_wscale), (3, 3))
+        self.assertTrue(self.client.sack_enabled and self.client.ts_enabled)
+
+    def test_options_not_offered_stay_off(self):
+        self.server.handle_packet({'flags': TCPFlags.SYN, 'seq_num': 100, 'window_size': 1000})
+        self.assertEqual(self.server.mss, 536)
+        self.assertEqual((self.server.snd_wscale, self.server.rcv_wscale), (0, 0))
+        self.assertFalse(self.server.sack_enabled or self.server.ts_enabled)
+        syn_ack = self.server._create_syn_ack_packet()
+        self.assertNotIn('window_scale', syn_ack)
+        self.assertNotIn('timestamp', syn_ack)
+
+    def test_window_is_scaled_after_handshake(self):
+        self._handshake()
+        self.client.handle_packet({'flags': TCPFlags.ACK, 'seq_num': self.client.acknowledgment_number,
+                                   'ack_num': self.client.sequence_number, 'window_size': 20000})
+        self.assertEqual(self.client.snd_wnd, 20000 << 3)
+        self.assertEqual(self.client._create_ack_packet()['window_size'], (256 * 1024) >> 3)
+
+    def test_timestamp_echo_gives_rtt_sample(self):
+        clock = FakeClock()
+        self.client = configured(clock=clock)('192.168.1.2', 5000, '192.168.1.1', 80)
+        self.server = configured(clock=clock)('192.168.1.1', 80, '192.168.1.2', 5000)
+        self._handshake()
+        self.assertAlmostEqual(self.client.srtt, 0.0)  # the SYN-ACK's echo of the SYN
+        self.client.send(b'x' * 100)
+        self.client.poll_output()
+        clock.now += 0.25
+        self.client.on_retransmit_timeout()
+        clock.now += 0.05
+        ack = self.server._create_ack_packet()
+        ack['ack_num'] = self.client.sequence_number
+        ack['timestamp'] = (0, int(100.25 * 1000))  # echoes the retransmission
+        self.client.handle_packet(ack)
+        self.assertAlmostEqual(self.client.srtt, 0.125 * 0.05)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,165 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
+import unittest
+from src.socket import Socket, SocketType
+from socket_manager import SocketManager
+from flow_table import FlowTable, IPPROTO_TCP
+from packet_parser import ip_to_int
+from tcp_protocol import TCPFlags, TCPState
+from time_wait import TimeWaitTable
+from timer_wheel import TimerWheel
+
+SERVER, CLIENT = ip_to_int('192.168.1.1'), ip_to_int('192.168.1.2')
+KEY = (SERVER, 80, CLIENT, 5000)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class Listener:
+    def __init__(self):
+        self.packets = []
+
+    def handle_packet(self, packet):
+        self.packets.append(packet)
+        return 'syn-ack'
+
+
+def segment(flags, seq=0, ack=0, timestamp=None):
+    packet = {'src_ip': CLIENT, 'dst_ip': SERVER, 'src_port': 5000, 'dst_port': 80,
+              'seq_num': seq, 'ack_num': ack, 'flags': flags, 'window_size': 1000, 'data': b''}
+    if timestamp is not None:
+        packet['timestamp'] = (timestamp, 0)
+    return packet
+
+
+class TestTimeWaitTable(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.flow_table = FlowTable()
+        self.table = type('TimeWaitTable', (TimeWaitTable,), {'clock': self.clock})(self.flow_table)
+        self.flow_table.time_wait = self.table
+
+    def test_entries_expire_in_bulk(self):
+        wheel = TimerWheel(resolution=0.01, clock=self.clock)
+        self.table.timers = wheel
+        self.table.add((SERVER, 80, CLIENT, 1), 0, 0)
+        self.clock.now += 0.5
+        self.table.add((SERVER, 80, CLIENT, 2), 0, 0)
+        self.clock.now += 10
+        self.table.add((SERVER, 80, CLIENT, 3), 0, 0)
+        self.assertEqual(len(wheel), 1)  # one timer for the whole table
+        self.clock.now = 100.0 + self.table.timeout + self.table.expiry_batch
+        wheel.advance()
+        self.assertEqual(len(self.table), 1)
+        self.assertEqual(self.table.expired, 2)
+        self.assertEqual(len(wheel), 1)
+        self.clock.now += 11
+        wheel.advance()
+        self.assertEqual(len(self.table), 0)
+        self.assertEqual(len(wheel), 0)
+
+    def test_bucket_limit(self):
+        self.table.max_buckets = 2
+        self.assertTrue(self.table.add((SERVER, 80, CLIENT, 1), 0, 0))
+        self.assertTrue(self.table.add((SERVER, 80, CLIENT, 2), 0, 0))
+        self.assertFalse(self.table.add((SERVER, 80, CLIENT, 3), 0, 0))
+        self.assertEqual(self.table.overflows, 1)
+
+    def test_retransmitted_fin_is_acked_and_restarts_wait(self):
+        self.table.add(KEY, 1000, 2000, ts_recent=50)
+        self.table.add((SERVER, 80, CLIENT, 5001), 0, 0)
+        self.clock.now += 30
+        self.assertIs(self.flow_table.lookup(IPPROTO_TCP, SERVER, 80, CLIENT, 5000), self.table)
+        ack = self.table.handle_packet(segment(TCPFlags.FIN | TCPFlags.ACK, seq=1999, ack=1000, timestamp=60))
+        self.assertEqual((ack['seq_num'], ack['ack_num'], ack['flags']), (1000, 2000, TCPFlags.ACK))
+        self.assertEqual(ack['timestamp'][1], 60)
+        self.assertEqual(list(self.table.entries)[-1], KEY)  # restarted entries move to the back
+        self.assertIsNone(self.table.handle_packet(segment(TCPFlags.RST, seq=2000)))
+        self.assertIn(KEY, self.table)
+
+    def test_newer_syn_recycles_tuple(self):
+        listener = Listener()
+        self.flow_table.add_listener(IPPROTO_TCP, SERVER, 80, listener)
+        self.table.add(KEY, 1000, 2000, ts_recent=50)
+        ack = self.table.handle_packet(segment(TCPFlags.SYN, seq=5000, timestamp=40))
+        self.assertEqual(ack['flags'], TCPFlags.ACK)  # older timestamp: not a new incarnation
+        self.assertEqual(self.table.handle_packet(segment(TCPFlags.SYN, seq=5000, timestamp=70)), 'syn-ack')
+        self.assertNotIn(KEY, self.table)
+        self.assertEqual((self.table.recycled, len(listener.packets)), (1, 1))
+
+    def test_syn_without_timestamps_must_be_beyond_rcv_nxt(self):
+        self.flow_table.add_listener(IPPROTO_TCP, SERVER, 80, Listener())
+        self.table.add(KEY, 1000, 2000)
+        self.assertEqual(self.table.handle_packet(segment(TCPFlags.SYN, seq=1500))['flags'], TCPFlags.ACK)
+        self.assertEqual(self.table.handle_packet(segment(TCPFlags.SYN, seq=2500)), 'syn-ack')
+
+
+class TestTimeWaitSockets(unittest.TestCase):
+    def setUp(self):
+        self.manager = SocketManager()
+        self.clock = FakeClock()
+        self.manager.flow_table.time_wait.clock = self.clock
+        self.server = Socket('192.168.1.1', 80, SocketType.TCP)
+        self.manager.add_socket(self.server)
+        self.server.listen()
+
+    def _established(self, port=5000):
+        client = Socket('192.168.1.2', port, SocketType.TCP)
+        self.manager.add_socket(client)
+        syn_ack = self.server.handle_packet(client.connect('192.168.1.1', 80))
+        self.server.handle_packet(client.handle_packet(syn_ack))
+        return client, self.server.accept()
+
+    def _active_close(self, client, conn):
+        client.handle_packet(conn.handle_packet(client.close()))
+        fin = conn.close()
+        conn.handle_packet(client.handle_packet(fin))
+        return fin
+
+    def test_active_close_moves_connection_to_table(self):
+        client, conn = self._established()
+        fin = self._active_close(client, conn)
+        table = self.manager.flow_table.time_wait
+        self.assertEqual(client.protocol.state, TCPState.CLOSED)
+        self.assertEqual(conn.protocol.state, TCPState.CLOSED)
+        self.assertIs(self.manager.flow_table.lookup(IPPROTO_TCP, '192.168.1.2', 5000, '192.168.1.1', 80), table)
+        ack = table.handle_packet(fin)
+        self.assertEqual(ack['ack_num'], client.protocol.acknowledgment_number)
+
+    def test_connect_reuses_tuple_under_timestamps(self):
+        client, conn = self._established()
+        self._active_close(client, conn)
+        snd_nxt = client.protocol.sequence_number
+        again = Socket('192.168.1.2', 5000, SocketType.TCP)
+        self.manager.add_socket(again)
+        with self.assertRaises(ValueError):
+            again.connect('192.168.1.1', 80)
+        self.clock.now += 2
+        syn = again.connect('192.168.1.1', 80)
+        self.assertEqual(syn['seq_num'], (snd_nxt + 0xFFFF + 2) & 0xFFFFFFFF)
+        self.assertEqual(self.manager.flow_table.time_wait.recycled, 1)
+
+    def test_churn_keeps_only_table_entries(self):
+        table = self.manager.flow_table.time_wait
+        for port in range(6000, 6100):
+            client, conn = self._established(port)
+            self._active_close(client, conn)
+        self.assertEqual(len(table), 100)
+        self.assertEqual(len(self.manager.flow_table.flows), 0)
+        self.clock.now += table.timeout
+        self._active_close(*self._established(7000))
+        self.assertEqual(len(table), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import unittest
+from unittest.mock import Mock, patch
+from timer_wheel import TimerWheel
+from event_loop import EventLoop
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimerWheel(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(resolution=0.01, clock=self.clock)
+
+    def test_fires_at_deadline_not_before(self):
+        callback = Mock()
+        self.wheel.schedule(0.05, callback, 'rto')
+        self.clock.now += 0.04
+        self.assertEqual(self.wheel.advance(), 0)
+        self.clock.now += 0.011
+        self.assertEqual(self.wheel.advance(), 1)
+        callback.assert_called_once_with('rto')
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel(self):
+        callback = Mock()
+        timer = self.wheel.schedule(0.02, callback)
+        timer.cancel()
+        self.assertFalse(timer.active)
+        self.clock.now += 1
+        self.wheel.advance()
+        callback.assert_not_called()
+        self.assertIsNone(self.wheel.next_deadline())
+
+    def test_long_delays_cascade(self):
+        fired = []
+        for delay in (0.5, 7.0, 45.0, 3600.0):
+            self.wheel.schedule(delay, fired.append, delay)
+        for _ in range(3700):
+            self.clock.now += 1
+            self.wheel.advance()
+        self.assertEqual(fired, [0.5, 7.0, 45.0, 3600.0])
+
+    def test_cancel_from_callback_in_same_slot(self):
+        second = Mock()
+        timers = []
+        timers.append(self.wheel.schedule(0.01, lambda: timers[1].cancel()))
+        timers.append(self.wheel.schedule(0.01, second))
+        self.clock.now += 0.02
+        self.wheel.advance()
+        second.assert_not_called()
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_next_deadline_tracks_earliest_timer(self):
+        self.wheel.schedule(5.0, Mock())
+        self.wheel.schedule(0.03, Mock())
+        self.assertAlmostEqual(self.wheel.timeout(), 0.03, places=6)
+
+    def test_many_timers(self):
+        callback = Mock()
+        timers = [self.wheel.schedule(i % 300 * 0.01, callback) for i in range(200000)]
+        for timer in timers[::2]:
+            timer.cancel()
+        self.clock.now += 3.0
+        self.assertEqual(self.wheel.advance(), 100000)
+
+
+class TestEventLoopTimers(unittest.TestCase):
+    @patch('select.select')
+    def test_timer_deadline_feeds_poll_timeout(self, mock_select):
+        event_loop = EventLoop('select')
+        mock_select.return_value = ([], [], [])
+        event_loop.call_later(0, event_loop.stop)
+        event_loop.run()
+        timeout = mock_select.call_args[0][3]
+        self.assertIsNotNone(timeout)
+        self.assertLessEqual(timeout, 0.01)
+
+if __name__ == '__main__':
+    unittest.main()
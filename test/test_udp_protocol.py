@@ -1,21 +1,36 @@
+import sys
+import os
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, project_root)
+
 import unittest
 from unittest.mock import Mock, patch
 from src.udp_protocol import UDPProtocol, UDPConnection
+from src.socket import Socket, SocketType
+from virtual_device_manager import NetworkInterface
+from ethernet import EthernetLayer
+from packet_parser import PacketParser, ETH_HEADER, ETH_P_IP, ip_to_int
+from checksum import verify_ip_header, verify_transport
+
+def datagram(ip, port, data=b'payload'):
+    return {'src_ip': ip, 'src_port': port, 'dst_ip': '192.168.1.100', 'dst_port': 53, 'data': data}
 
 class TestUDPProtocol(unittest.TestCase):
     def setUp(self):
         self.udp_protocol = UDPProtocol()
 
     def test_handle_packet_new_connection(self):
-        mock_packet = Mock(source_ip='192.168.1.1', source_port=12345)
-        result = self.udp_protocol.handle_packet(mock_packet)
+        packet = datagram('192.168.1.1', 12345)
+        result = self.udp_protocol.handle_packet(packet)
         self.assertIsNone(result)
         self.assertIn(('192.168.1.1', 12345), self.udp_protocol.connections)
 
     def test_handle_packet_existing_connection(self):
-        mock_packet = Mock(source_ip='192.168.1.1', source_port=12345)
-        self.udp_protocol.handle_packet(mock_packet)  # Create connection
-        result = self.udp_protocol.handle_packet(mock_packet)  # Use existing connection
+        packet = datagram('192.168.1.1', 12345)
+        self.udp_protocol.handle_packet(packet)  # Create connection
+        result = self.udp_protocol.handle_packet(packet)  # Use existing connection
         self.assertIsNone(result)
         self.assertEqual(len(self.udp_protocol.connections), 1)
 
@@ -25,19 +40,148 @@ class TestUDPProtocol(unittest.TestCase):
         self.assertIsInstance(connection, UDPConnection)
         self.assertEqual(connection.remote_addr, addr)
 
+class TestUDPReceiveQueue(unittest.TestCase):
+    def setUp(self):
+        self.clock = Mock(return_value=100.0)
+        self.udp_protocol = type('UDPProtocol', (UDPProtocol,), {'clock': self.clock, 'recv_queue_limit': 3,
+                                                                 'recv_buffer_size': 100, 'max_peers': 2})()
+
+    def test_full_queue_drops_at_tail(self):
+        for i in range(5):
+            self.udp_protocol.handle_packet(datagram('10.0.0.1', 1000, bytes([i])))
+        self.assertEqual((self.udp_protocol.drops, self.udp_protocol.dropped_bytes), (2, 2))
+        self.assertEqual([d.data for d in self.udp_protocol.receive_many(10)], [b'\x00', b'\x01', b'\x02'])
+        self.assertEqual(self.udp_protocol.queued_bytes, 0)
+
+    def test_byte_limit(self):
+        self.udp_protocol.handle_packet(datagram('10.0.0.1', 1000, bytes(80)))
+        self.udp_protocol.handle_packet(datagram('10.0.0.1', 1000, bytes(30)))
+        self.assertEqual(len(self.udp_protocol.receive_queue), 1)
+        self.assertEqual(self.udp_protocol.drops, 1)
+
+    def test_payload_is_copied(self):
+        buffer = bytearray(b'abcd')
+        self.udp_protocol.handle_packet(datagram('10.0.0.1', 1000, memoryview(buffer)))
+        buffer[:] = b'zzzz'
+        self.assertEqual(self.udp_protocol.receive(2), b'ab')
+        self.assertIsNone(self.udp_protocol.receive())
+
+    def test_least_recently_used_peer_is_evicted(self):
+        self.udp_protocol.handle_packet(datagram('10.0.0.1', 1000))
+        self.udp_protocol.handle_packet(datagram('10.0.0.2', 1000))
+        self.udp_protocol.handle_packet(datagram('10.0.0.1', 1000))
+        self.udp_protocol.receive_many(3)
+        self.udp_protocol.handle_packet(datagram('10.0.0.3', 1000))
+        self.assertEqual(list(self.udp_protocol.connections), [('10.0.0.1', 1000), ('10.0.0.3', 1000)])
+        self.assertEqual(self.udp_protocol.peer_evictions, 1)
+
+    def test_idle_peers_are_evicted(self):
+        self.udp_protocol.handle_packet(datagram('10.0.0.1', 1000))
+        self.clock.return_value += UDPProtocol.peer_idle_timeout
+        self.udp_protocol.handle_packet(datagram('10.0.0.2', 1000))
+        self.assertEqual(list(self.udp_protocol.connections), [('10.0.0.2', 1000)])
+
+    def test_socket_recv_many(self):
+        sock = Socket('192.168.1.100', 53, SocketType.UDP)
+        for i in range(5):
+            sock.handle_packet(datagram('10.0.0.1', 1000 + i, b'q%d' % i))
+        batch = sock.recv_many(4)
+        self.assertEqual([(d.data, d.addr) for d in batch[:2]], [(b'q0', ('10.0.0.1', 1000)), (b'q1', ('10.0.0.1', 1001))])
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(sock.recv(10), b'q4')
+        self.assertEqual(sock.recv_many(4), [])
+        with self.assertRaises(NotImplementedError):
+            Socket('192.168.1.100', 80, SocketType.TCP).recv_many(4)
+
+class FakeDevice(NetworkInterface):
+    def __init__(self):
+        self.batches = []
+        self.written = []
+
+    def read(self, length):
+        return b''
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def write_many(self, frames):
+        self.batches.append([b''.join(frame) for frame in frames])
+        return len(frames)
+
+    def close(self):
+        pass
+
+    @property
+    def fd(self):
+        return -1
+
+class TestUDPTransmit(unittest.TestCase):
+    def setUp(self):
+        self.device = FakeDevice()
+        self.link = EthernetLayer(self.device, b'\x02\x00\x00\x00\x00\x01', '192.168.1.100')
+        self.link._confirm(ip_to_int('192.168.1.1'), b'\x02\x00\x00\x00\x00\x02')
+        self.sock = Socket('192.168.1.100', 4000, SocketType.UDP)
+        self.sock.protocol = type('UDPProtocol', (UDPProtocol,), {'link': self.link})('192.168.1.100', 4000)
+        self.parser = PacketParser()
+
+    def _parse(self, frame):
+        dst_mac, src_mac, ethertype = ETH_HEADER.unpack_from(frame)
+        ip = self.parser.parse_ip_header(frame[ETH_HEADER.size:])
+        self.assertEqual(ethertype, ETH_P_IP)
+        self.assertTrue(verify_ip_header(ip.raw[:20]))
+        self.assertTrue(verify_transport(ip.src, ip.dst, 17, ip.data))
+        return dst_mac, ip, self.parser.parse_udp_header(ip.data)
+
+    def test_send_many_is_one_flush(self):
+        sent = self.sock.send_many([(b'a' * n, ('192.168.1.1', 9000 + n % 2)) for n in range(1, 6)] +
+                                   [(b'odd', ('192.168.1.2', 9000))])
+        self.assertEqual(sent, 6)
+        self.assertEqual(len(self.device.batches), 1)
+        frames = self.device.batches[0]
+        idents = []
+        for n, frame in enumerate(frames[:5], 1):
+            dst_mac, ip, udp = self._parse(frame)
+            self.assertEqual(dst_mac, b'\x02\x00\x00\x00\x00\x02')
+            self.assertEqual((ip.total_length, udp.length, udp.dst_port), (28 + n, 8 + n, 9000 + n % 2))
+            self.assertEqual(bytes(udp.data), b'a' * n)
+            idents.append(ip.identification)
+        self.assertEqual(len(set(idents)), 5)
+        self.assertEqual(len(frames), 5)
+        # The unresolved neighbour's datagram waits behind an ARP request.
+        self.assertEqual(len(self.link.neighbours[ip_to_int('192.168.1.2')].pending), 1)
+        self.assertEqual(self.link.arp_requests, 1)
+        self.assertEqual(len(self.sock.protocol.templates), 3)
+
+    def test_connected_send_and_limits(self):
+        with self.assertRaises(ValueError):
+            self.sock.send(b'x')
+        self.sock.connect('192.168.1.1', 53)
+        self.assertEqual(self.sock.send(b'query'), 1)
+        self.assertEqual(self._parse(self.device.batches[0][0])[2].dst_port, 53)
+        with self.assertRaises(ValueError):
+            self.sock.send(bytes(1500 - 28 + 1))
+        self.assertEqual(self.sock.protocol.datagrams_sent, 1)
+
+    def test_template_cache_is_bounded(self):
+        self.sock.protocol.max_templates = 2
+        for port in range(5):
+            self.sock.send_to(b'x', ('192.168.1.1', port))
+        self.assertEqual(list(self.sock.protocol.templates), [('192.168.1.1', 3), ('192.168.1.1', 4)])
+
 class TestUDPConnection(unittest.TestCase):
     def setUp(self):
         self.udp_connection = UDPConnection(('192.168.1.1', 12345))
 
     def test_init(self):
         self.assertEqual(self.udp_connection.remote_addr, ('192.168.1.1', 12345))
-        self.assertEqual(self.udp_connection.received_packets, [])
+        self.assertEqual(self.udp_connection.datagrams, 0)
 
     def test_process_packet(self):
-        mock_packet = Mock()
-        result = self.udp_connection.process_packet(mock_packet)
+        packet = datagram('192.168.1.1', 12345, b'abc')
+        result = self.udp_connection.process_packet(packet)
         self.assertIsNone(result)
-        self.assertEqual(self.udp_connection.received_packets, [mock_packet])
+        self.assertEqual((self.udp_connection.datagrams, self.udp_connection.bytes_received), (1, 3))
 
     @patch('src.udp_protocol.UDPConnection.send')
     def test_send(self, mock_send):
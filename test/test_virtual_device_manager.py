@@ -3,8 +3,9 @@ import os
 import fcntl
 import struct
 import errno
+import select
 from unittest.mock import patch, MagicMock
-from virtual_device_manager import VirtualDeviceInterface
+from virtual_device_manager import VirtualDeviceInterface, QueueInterface, SocketPairInterface, ReceiveBatch
 
 class TestVirtualDeviceInterface(unittest.TestCase):
     @patch('os.open')
@@ -76,12 +77,118 @@ class TestVirtualDeviceInterface(unittest.TestCase):
     @patch('fcntl.fcntl')
     def test_set_blocking_mode(self, mock_fcntl):
         # Test setting to blocking mode
+        mock_fcntl.return_value = os.O_RDWR | os.O_APPEND | os.O_NONBLOCK
         self.device.set_blocking(True)
-        mock_fcntl.assert_called_with(self.mock_fd, fcntl.F_SETFL, 0)
+        mock_fcntl.assert_called_with(self.mock_fd, fcntl.F_SETFL, os.O_RDWR | os.O_APPEND)
 
         # Test setting to non-blocking mode
+        mock_fcntl.return_value = os.O_RDWR | os.O_APPEND
         self.device.set_blocking(False)
-        mock_fcntl.assert_called_with(self.mock_fd, fcntl.F_SETFL, os.O_NONBLOCK)
+        mock_fcntl.assert_called_with(self.mock_fd, fcntl.F_SETFL, os.O_RDWR | os.O_APPEND | os.O_NONBLOCK)
+
+    @patch('os.readv')
+    def test_read_into(self, mock_readv):
+        buffer = bytearray(16)
+        mock_readv.return_value = 4
+        self.assertEqual(self.device.read_into(buffer), 4)
+        mock_readv.assert_called_once_with(self.mock_fd, [buffer])
+
+    @patch('os.readv')
+    def test_read_into_would_block(self, mock_readv):
+        mock_readv.side_effect = BlockingIOError()
+        self.assertEqual(self.device.read_into(bytearray(16)), 0)
+
+class TestReceiveBatch(unittest.TestCase):
+    def _device(self, frames):
+        device = MagicMock()
+        pending = list(frames)
+
+        def read_into(view):
+            if not pending:
+                return 0
+            frame = pending.pop(0)
+            view[:len(frame)] = frame
+            return len(frame)
+
+        device.read_into.side_effect = read_into
+        return device
+
+    def test_drains_until_would_block(self):
+        batch = ReceiveBatch(size=8, frame_size=64)
+        device = self._device([b'one', b'three', b'fifteen'])
+        self.assertEqual(batch.drain(device), 3)
+        self.assertEqual([bytes(frame) for frame in batch], [b'one', b'three', b'fifteen'])
+        self.assertEqual(batch.histogram[3], 1)
+
+    def test_drain_is_capped_at_batch_size(self):
+        batch = ReceiveBatch(size=2, frame_size=64)
+        device = self._device([b'a', b'b', b'c'])
+        self.assertEqual(batch.drain(device), 2)
+        self.assertEqual(batch.drain(device), 1)
+        self.assertEqual(batch.drain(device), 0)
+        self.assertEqual((batch.wakeups, batch.frames), (3, 3))
+
+    def test_buffers_are_reused(self):
+        batch = ReceiveBatch(size=1, frame_size=64)
+        buffer = batch.buffers[0]
+        batch.drain(self._device([b'x']))
+        batch.drain(self._device([b'y']))
+        self.assertIs(batch.buffers[0], buffer)
+        self.assertEqual([bytes(frame) for frame in batch], [b'y'])
+
+class TestQueueInterface(unittest.TestCase):
+    def test_pair_delivers_frames_to_the_other_end(self):
+        a, b = QueueInterface.pair()
+        self.assertEqual(a.write(b'frame one'), 9)
+        self.assertEqual(a.write_many([(b'frame ', b'two')]), 1)
+        self.assertEqual(a.read(64), b'')
+        self.assertEqual(b.read(64), b'frame one')
+        buffer = bytearray(64)
+        self.assertEqual(b.read_into(buffer), 9)
+        self.assertEqual(bytes(buffer[:9]), b'frame two')
+        self.assertEqual(b.read_into(buffer), 0)
+
+    def test_loopback_reads_its_own_writes(self):
+        device = QueueInterface.loopback()
+        device.write(b'echo')
+        self.assertEqual(device.read(64), b'echo')
+
+    def test_full_queue_drops(self):
+        a, b = QueueInterface.pair(capacity=2)
+        self.assertEqual(a.write_many([(b'1',), (b'2',), (b'3',)]), 2)
+        self.assertEqual(a.write(b'4'), 0)
+        self.assertEqual(a.drops, 2)
+        batch = ReceiveBatch(size=8, frame_size=64)
+        self.assertEqual(batch.drain(b), 2)
+
+    def test_read_into_truncates_long_frames(self):
+        a, b = QueueInterface.pair()
+        a.write(b'x' * 100)
+        self.assertEqual(b.read_into(bytearray(64)), 64)
+
+class TestSocketPairInterface(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = SocketPairInterface.pair()
+        self.addCleanup(self.a.close)
+        self.addCleanup(self.b.close)
+        for device in (self.a, self.b):
+            device.set_blocking(False)
+
+    def test_frame_boundaries_are_kept(self):
+        self.a.write(b'first')
+        self.assertEqual(self.a.write_many([(b'sec', b'ond'), (b'third',)]), 2)
+        batch = ReceiveBatch(size=8, frame_size=64)
+        self.assertEqual(batch.drain(self.b), 3)
+        self.assertEqual([bytes(frame) for frame in batch], [b'first', b'second', b'third'])
+
+    def test_empty_read_would_block(self):
+        self.assertEqual(self.b.read(64), b'')
+        self.assertEqual(self.b.read_into(bytearray(64)), 0)
+
+    def test_fd_is_selectable(self):
+        self.a.write(b'ready')
+        readable, _, _ = select.select([self.b.fd], [], [], 1)
+        self.assertEqual(readable, [self.b.fd])
 
 if __name__ == '__main__':
     unittest.main()